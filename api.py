@@ -0,0 +1,121 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  api.py - JSON routes. Searching Open Library from the add books page
+#  (see func.py and jobs.py), job stats and the health check.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import json
+from flask import Blueprint, current_app, request, jsonify, stream_with_context
+from models import db
+from func import Warehouse, MAX_RESULTS, enrichment_key, cache_stats
+from olclient import OpenLibraryError, get_client
+from jobs import get_queue
+from dbconfig import pool_stats, check_database
+
+bp = Blueprint("api", __name__)
+
+
+@bp.route('/api/search-wh')
+def search_wh():
+    """ Upon receipt of AJAX request, we save arguments and search the API Warehouse Class.  
+    The books found are sent straight back as a JSON list. Looking up each book's details 
+    and saving it into our Book Table happens in background jobs (see jobs.py), each book 
+    has the status of its job and the page asks /api/search-wh/status for the rest.
+    If results are empty, we provide the user with JSON message, a 502 with one if 
+    Open Library failed.
+    """
+
+    title = request.args['title']
+    author = request.args['author']
+    
+    book_criteria = Warehouse(title, author)
+
+    try:
+        found_books = book_criteria.search_and_enqueue(get_queue())
+    except OpenLibraryError:
+        message = "Sorry, the book warehouse is not answering. Please try again."
+        return (jsonify(message),502)
+
+    if found_books:
+        message = "Here are your results!"
+        return (jsonify(found_books),201)
+    else: 
+        message = "Sorry, but your search turned up empty. Please try again."
+        return (jsonify(message))
+
+
+@bp.route('/api/search-wh/stream')
+def search_wh_stream():
+    """ Streaming version of /api/search-wh.  The reply is newline delimited JSON with one 
+    line per book, sent as soon as that book's details come back, i.e.
+    {"index": 3, "book": {...}}  where index is its place in the search results.
+    The last line is {"done": true, "found": 10}, or {"error": "..."} if Open Library failed.
+    """
+
+    title = request.args['title']
+    author = request.args['author']
+
+    books = Warehouse(title, author).stream_books()
+
+    def lines():
+        found = 0
+        try:
+            for index, book in books:
+                found += 1
+                yield json.dumps({'index': index, 'book': book}) + "\n"
+        except OpenLibraryError:
+            yield json.dumps({'error': "Sorry, the book warehouse is not answering. Please try again."}) + "\n"
+            return
+        yield json.dumps({'done': True, 'found': found}) + "\n"
+
+    #no buffering by a proxy in front of us, or the books would all show up at the end
+    return current_app.response_class(stream_with_context(lines()), mimetype="application/x-ndjson",
+                              headers={'Cache-Control': "no-cache", 'X-Accel-Buffering': "no"})
+
+
+@bp.route('/api/search-wh/status')
+def search_wh_status():
+    """ Progress of the background jobs for the book keys asked about, i.e. 
+    ?key=/works/OL45883W&key=/works/OL27448W.  Books that are done come with 
+    all of their details.  Keys with no job (never searched or long done) are "unknown".
+    """
+
+    jobs = get_queue()
+    progress = {}
+    for key in request.args.getlist('key')[:MAX_RESULTS]:
+        job = jobs.get(enrichment_key(key))
+        if job is None:
+            progress[key] = {'status': "unknown"}
+        else:
+            progress[key] = {'status': job.status, 'book': job.result, 'error': job.error}
+
+    return jsonify(progress)
+
+
+@bp.route('/api/jobs/stats')
+def job_stats():
+    """Queue depth, counts and latency of the background jobs in this app process"""
+
+    return jsonify(get_queue().stats())
+
+
+@bp.route('/healthz')
+def healthz():
+    """Database ping time, the connection pool, the Open Library connections and cache
+    hits of this app process, 503 if the database can't be reached so the load balancer stops sending
+    requests here"""
+
+    ok, ms, error = check_database(db.engine)
+    health = {'status': "ok" if ok else "error",
+              'database': {'ok': ok, 'ms': ms, 'error': error},
+              'pool': pool_stats(db.engine),
+              'openlibrary': get_client().connection_stats(),
+              'caches': cache_stats(),
+              'pool_mode': current_app.config["DB_POOL_MODE"],
+              'jobs': get_queue().stats()['depth']}
+    return jsonify(health), 200 if ok else 503
@@ -0,0 +1,116 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  auth.py - register, login and logout routes, and the logged in user
+#  (g.user) added before every request of the app.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from flask import Blueprint, render_template, redirect, session, flash, g
+from sqlalchemy.exc import IntegrityError
+from models import db, User
+from forms import RegisterForm, LoginForm
+from usercache import get_current_user, invalidate_user
+
+bp = Blueprint("auth", __name__)
+
+# Sets up session variable
+CURR_USER_KEY = "curr_user"
+
+
+@bp.before_app_request
+def add_user_to_g():
+    """If we're logged in, add the saved sesssion user to current 
+    user to Flask global before app requests start. If not, there is 
+    global user is none. The user comes from a short-lived cached snapshot 
+    (see usercache.py) so most requests do not query the users table.
+    """
+
+    if CURR_USER_KEY in session:
+        g.user = get_current_user(session[CURR_USER_KEY])
+
+    else:
+        g.user = None
+
+
+def do_login(user):
+    """Log in user by adding user to session."""
+    session[CURR_USER_KEY] = user.user_id
+
+
+def do_logout():
+    """Logout user by deleting the user from the session."""
+    if CURR_USER_KEY in session:
+        del session[CURR_USER_KEY]
+        
+
+@bp.route('/register', methods=['GET', 'POST'])
+def register_user():
+    """Register User: Validate submissions, create a new user, add user to session """
+
+    form = RegisterForm()
+    if form.validate_on_submit():
+        username = form.username.data
+        password = form.password.data
+        first_name = form.first_name.data
+        last_name = form.last_name.data
+        address1 = form.address1.data
+        address2 = form.address2.data
+        town = form.town.data
+        state = form.state.data
+        zip = form.zip.data
+        phone = form.phone.data
+        email = form.email.data
+        profile = form.profile.data
+        fav_book = form.fav_book.data
+        fav_author = form.fav_author.data
+
+        new_user = User.register(username, password, email, first_name, last_name, 
+                                 address1, address2, town, state, zip, phone, profile, fav_book, fav_author)
+        db.session.add(new_user)
+        
+        try:
+            db.session.commit()
+        except IntegrityError:
+            form.username.errors.append('Sorry, but this username is taken.  Please pick another.')
+            return render_template('register.html', form=form)
+        
+        do_login(new_user)
+        invalidate_user(new_user.user_id)
+
+        flash('Welcome! Your Account has been created!', "success")
+        return redirect('/addbooks')
+
+    return render_template('register.html', form=form)
+
+
+@bp.route('/login', methods=["GET", "POST"])
+def login():
+    """Handle user login."""
+
+    form = LoginForm()
+
+    if form.validate_on_submit():
+        #authenticates user against saved credentials
+        user = User.authenticate(form.username.data,
+                                 form.password.data)
+
+        if user:
+            do_login(user)
+            flash(f"Hello, {user.username}!", "success")
+            return redirect("/")
+
+        flash("Invalid credentials.", 'danger')
+
+    return render_template('login.html', form=form)
+
+
+@bp.route('/logout')
+def logout():
+    """Logout user by removing their username from the session"""
+    do_logout()
+    flash("You have been logged out.", 'danger')
+    return redirect('/login')
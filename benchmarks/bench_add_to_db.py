@@ -0,0 +1,136 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Benchmark: Warehouse.add_to_db
+#  Compares the old add_to_db (query + commit per book) with the batched
+#  one (one multi-row INSERT ... ON CONFLICT DO UPDATE).
+#  Counts statements and commits, and times both. --rtt-ms adds a fake
+#  network round trip to each statement so the numbers look more like a
+#  remote Postgres than a local SQLite file.
+#
+#  Run from the project folder:
+#      python benchmarks/bench_add_to_db.py --searches 50 --rtt-ms 1
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+from models import db, connect_db, Book
+from func import Warehouse, BookRecord
+
+warnings.simplefilter("ignore")
+
+
+def legacy_add_to_db(warehouse, num):
+    """add_to_db as it was: one lookup and one commit per book"""
+
+    for book in range(num):
+        doc = warehouse.findings['docs'][book]
+        if Book.query.filter_by(key=doc['key']).one_or_none() is None:
+            all_authors = ""
+            for auth in doc['author_name']:
+                all_authors = all_authors + (", " if all_authors else "") + auth
+            all_subjects = ""
+            for subj in doc['subjects']:
+                all_subjects = all_subjects + (", " if all_subjects else "") + subj
+            db.session.add(Book(key=doc['key'], title=doc['title'], author=all_authors,
+                description=doc['description'], subjects=all_subjects,
+                cover_img_url_m=doc['cover_img_url_m'], cover_img_url_s=doc['cover_img_url_s'],
+                published_year=doc['first_publish_year']))
+            db.session.commit()
+
+
+def as_records(docs):
+    """The filled in docs as the BookRecords add_to_db takes now"""
+    return [BookRecord(doc['key'], doc['title'], doc['author_name'], doc['description'], doc['subjects'],
+                       doc['cover_img_url_m'], doc['cover_img_url_s'], doc['first_publish_year']) for doc in docs]
+
+
+def make_findings(search, overlap):
+    """Ten docs per search. overlap of them repeat books from the search before."""
+
+    docs = []
+    for num in range(10):
+        book_num = (search - 1) * 10 + overlap + num if search and num < overlap else search * 10 + num
+        docs.append({'key': f"/works/OL{book_num}W", 'title': f"Book {book_num}",
+                     'author_name': ["Author A", "Author B"], 'description': "A description",
+                     'subjects': ["Fiction", "Adventure", "Classics"],
+                     'cover_img_url_m': "m.jpg", 'cover_img_url_s': "s.jpg",
+                     'first_publish_year': 1950})
+    return {'numFound': 10, 'docs': docs}
+
+
+def run(label, add, searches, overlap, rtt):
+    """Run add for each search against a fresh database, counting round trips"""
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + path
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    connect_db(app)
+
+    counts = {'statements': 0, 'commits': 0}
+
+    with app.app_context():
+        db.create_all()
+
+        def count_statement(*args):
+            counts['statements'] += 1
+            time.sleep(rtt)
+
+        def count_commit(*args):
+            counts['commits'] += 1
+            time.sleep(rtt)
+
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        event.listen(db.engine, "commit", count_commit)
+
+        start = time.perf_counter()
+        for search in range(searches):
+            warehouse = Warehouse("bench", "", client=object())
+            warehouse.findings = make_findings(search, overlap)
+            keys = [doc['key'] for doc in warehouse.findings['docs']]
+            add(warehouse, keys)
+        elapsed = time.perf_counter() - start
+
+        books = Book.query.count()
+
+    return {'label': label, 'books': books, 'statements': counts['statements'],
+            'commits': counts['commits'], 'seconds': elapsed,
+            'round_trips_per_search': (counts['statements'] + counts['commits']) / searches}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-row and batched add_to_db")
+    parser.add_argument("--searches", type=int, default=50)
+    parser.add_argument("--overlap", type=int, default=3, help="books repeated from the search before")
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    rtt = args.rtt_ms / 1000
+
+    results = [
+        run("per-row (old)", lambda w, keys: legacy_add_to_db(w, len(keys)), args.searches, args.overlap, rtt),
+        run("batched (new)", lambda w, keys: w.add_to_db(as_records(w.findings['docs'])), args.searches, args.overlap, rtt),
+    ]
+
+    print(f"{args.searches} searches x 10 books, {args.overlap} repeated per search, {args.rtt_ms}ms per round trip")
+    print(f"{'':15} {'books':>6} {'stmts':>6} {'commits':>8} {'trips/search':>13} {'seconds':>8}")
+    for r in results:
+        print(f"{r['label']:15} {r['books']:>6} {r['statements']:>6} {r['commits']:>8} "
+              f"{r['round_trips_per_search']:>13.1f} {r['seconds']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
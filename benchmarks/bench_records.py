@@ -0,0 +1,179 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Benchmark: turning a search reply into results and book rows
+#  Compares the old way (every field of up to 100 docs parsed and kept on
+#  the Warehouse, docs filled in place, then copied into the JSON reply and
+#  again into book rows) with BookRecords built from a search that asks
+#  for only the fields we use and ten books.
+#  The search replies are made up to look like Open Library's, so no
+#  network or database is used. Reports the reply size, peak memory while
+#  handling it (tracemalloc), memory still held afterwards and CPU time.
+#
+#  Run from the project folder:
+#      python benchmarks/bench_records.py --rounds 200
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from func import BookRecord, DOC_FIELDS, MAX_RESULTS, cover_urls
+
+
+#--------------------------------------------------------------------------#
+#                           Made up Open Library replies
+#--------------------------------------------------------------------------#
+
+def fat_doc(num):
+    """A search doc with every field, the way Open Library sends one for a well known book"""
+
+    return {
+        'key': f"/works/OL{num}W", 'type': "work", 'title': f"Made Up Book {num}",
+        'title_suggest': f"Made Up Book {num}", 'subtitle': "A Novel",
+        'author_name': [f"Author {num}", "Second Author"], 'author_key': [f"OL{num}A", "OL9A"],
+        'author_alternative_name': [f"A. {num}", f"Auth {num}"],
+        'edition_count': 80, 'edition_key': [f"OL{num}{e}M" for e in range(80)],
+        'first_publish_year': 1900 + num % 100,
+        'publish_date': [f"June {1900 + y}" for y in range(60)], 'publish_year': list(range(1900, 1960)),
+        'publisher': [f"Publisher {p}" for p in range(60)], 'publish_place': [f"City {p}" for p in range(20)],
+        'isbn': [f"978{num:04d}{i:06d}" for i in range(150)], 'oclc': [str(40000 + i) for i in range(40)],
+        'lccn': [str(90000 + i) for i in range(10)], 'language': ["eng", "fre", "ger", "spa", "ita"],
+        'subject': [f"Subject {s}" for s in range(80)], 'place': [f"Place {s}" for s in range(20)],
+        'person': [f"Person {s}" for s in range(20)], 'time': [f"Century {s}" for s in range(10)],
+        'id_goodreads': [str(100000 + i) for i in range(40)], 'id_librarything': [str(i) for i in range(20)],
+        'ia': [f"madeupbook{num}_{i}" for i in range(30)], 'has_fulltext': True,
+        'first_sentence': [f"It was a made up morning, number {num}."],
+        'seed': [f"/books/OL{num}{e}M" for e in range(80)] + [f"/subjects/subject_{s}" for s in range(80)],
+        'text': [f"word {t} of book {num}" for t in range(400)],
+        'ratings_average': 4.1, 'ratings_count': 1200, 'want_to_read_count': 5000,
+    }
+
+
+def make_replies(docs=100):
+    """The search reply as Open Library sends it with no fields or limit (100 docs of
+    everything) and with the fields and limit we ask for now. Also the work details."""
+
+    found = [fat_doc(num) for num in range(docs)]
+    fat = json.dumps({'numFound': 2000, 'start': 0, 'docs': found})
+    slim = json.dumps({'numFound': 2000, 'start': 0,
+                       'docs': [{field: doc[field] for field in DOC_FIELDS} for doc in found[:MAX_RESULTS]]})
+    details = [{'description': {'type': "/type/text", 'value': f"Description {num} " * 40},
+                'subjects': [f"Subject {s}" for s in range(30)], 'cover_edition_key': f"OL{num}C"}
+               for num in range(MAX_RESULTS)]
+    return fat, slim, details
+
+
+#--------------------------------------------------------------------------#
+#                           Old and new handling
+#--------------------------------------------------------------------------#
+
+class LegacyWarehouse:
+    """findBooksInWH as it was, less the network and database: the whole reply is kept
+    on self.findings, each doc is filled in place, then copied to the reply and a row"""
+
+    def __init__(self):
+        self.findings = {}
+
+    def handle(self, reply, details):
+        self.findings = json.loads(reply)
+        number_of_books = min(int(self.findings['numFound']), len(self.findings['docs']), MAX_RESULTS)
+
+        books_found = {}
+        for doc in range(number_of_books):
+            found = self.findings['docs'][doc]
+            found['subjects'] = details[doc].get('subjects', "No Subjects")
+            description = details[doc].get("description")
+            found['description'] = description.get("value") if isinstance(description, dict) else description
+            edition_key = (found.get('edition_key') or [None])[0]
+            found['cover_img_url_m'], found['cover_img_url_s'] = cover_urls(details[doc].get('cover_edition_key', edition_key))
+            books_found[doc] = {'key': found['key'], 'title': found['title'], 'author': found['author_name'],
+                'description': found['description'], 'subjects': found['subjects'],
+                'cover_img_url_m': found['cover_img_url_m'], 'cover_img_url_s': found['cover_img_url_s'],
+                'first_publish_year': found['first_publish_year']}
+
+        rows = []
+        for doc in range(number_of_books):
+            found = self.findings['docs'][doc]
+            rows.append(dict(key=found['key'], title=found['title'],
+                author=", ".join(found['author_name']) if type(found['author_name']) is list else "",
+                description=found['description'],
+                subjects=", ".join(found['subjects']) if type(found['subjects']) is list else "",
+                cover_img_url_m=found['cover_img_url_m'], cover_img_url_s=found['cover_img_url_s'],
+                published_year=found['first_publish_year']))
+        return books_found, rows
+
+
+def handle_legacy(reply, details):
+    """The warehouse is sent back too, it held on to the whole reply for the request"""
+    warehouse = LegacyWarehouse()
+    return warehouse, warehouse.handle(reply, details)
+
+
+def handle_records(reply, details):
+    """What findBooksInWH does now: slim docs, one BookRecord each, reply and rows from it"""
+
+    findings = json.loads(reply)
+    number_of_books = min(int(findings['numFound']), MAX_RESULTS)
+    docs = [{field: doc.get(field) for field in DOC_FIELDS} for doc in findings['docs'][:number_of_books]]
+    records = [BookRecord.from_doc(doc, book_info) for doc, book_info in zip(docs, details)]
+    rows = [record.row() for record in records]
+    return dict(enumerate(record.json() for record in records)), rows
+
+
+#--------------------------------------------------------------------------#
+#                           Measuring
+#--------------------------------------------------------------------------#
+
+def measure(label, handle, reply, details, rounds):
+    """Peak and held memory of one search (results kept, like a request holds them until it
+    answers), then CPU time per search over rounds"""
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = handle(reply, details)
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+
+    start = time.process_time()
+    for _ in range(rounds):
+        handle(reply, details)
+    cpu = (time.process_time() - start) / rounds
+
+    return {'label': label, 'reply_kb': len(reply) / 1024, 'peak_kb': (peak - before) / 1024,
+            'held_kb': (held - before) / 1024, 'cpu_ms': cpu * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare old search handling with BookRecords")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    fat, slim, details = make_replies()
+    results = [
+        #the old search asked for everything, so it got the fat reply
+        measure("whole docs (old)", handle_legacy, fat, details, args.rounds),
+        measure("old, slim reply", handle_legacy, slim, details, args.rounds),
+        measure("records (new)", handle_records, slim, details, args.rounds),
+    ]
+
+    print(f"one search of {MAX_RESULTS} books, CPU averaged over {args.rounds} rounds")
+    print(f"{'':18} {'reply KB':>9} {'peak KB':>9} {'held KB':>9} {'CPU ms':>8}")
+    for r in results:
+        print(f"{r['label']:18} {r['reply_kb']:>9.1f} {r['peak_kb']:>9.1f} {r['held_kb']:>9.1f} {r['cpu_ms']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
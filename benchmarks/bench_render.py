@@ -0,0 +1,193 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Benchmark: rendering a page of 20 book cards
+#  Renders books/results.html with 20 books three ways:
+#  - inline (old): the card markup with the if/elif star chain inline
+#  - fragments, cold: the rating_icons filter with an empty card cache
+#  - fragments, warm: the same page again, card parts from the cache
+#  Also times compiling every template with and without the bytecode
+#  cache, which is what a fresh gunicorn worker pays on its first requests.
+#
+#  Run from the project folder:
+#      python benchmarks/bench_render.py --rounds 500
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import g, render_template
+from jinja2 import Environment, FileSystemBytecodeCache
+from models import Book, Status
+from fragments import fragment_cache
+from usercache import CurrentUser, UserSnapshot
+from app import app
+
+warnings.simplefilter("ignore")
+
+#results.html as it was, before the rating_icons filter and card fragments
+LEGACY_RESULTS = """{% extends 'base.html' %}
+
+{% block content %}
+<h1>Your Results</h1>
+
+{% for s in status %}
+<div class="card">
+    <div class="row g-0">
+        <div class="col-md-2">
+            <img src="{{s.book.cover_img_url_m}}" class="img-fluid rounded-start m-3" alt="{{s.book.title}}">
+
+            <div align="center">
+                <h4 class="text-primary fw-bold ml-2">Book Rating</h4>
+                <span class="text-primary">
+                    {% if s.book.avg_rating == 0 or s.book.avg_rating == None -%}
+                    <i class="far fa-star"></i>
+                    <i class="far fa-star"></i>
+                    <i class="far fa-star"></i>
+                    <i class="far fa-star"></i>
+                    <i class="far fa-star"></i>
+                    {% elif s.book.avg_rating > 1 and s.book.avg_rating <= 1.5 -%} <i class="fas fa-star"></i>
+                        <i class="far fa-star"></i>
+                        <i class="far fa-star"></i>
+                        <i class="far fa-star"></i>
+                        <i class="far fa-star"></i>
+                        {% elif s.book.avg_rating > 1.5 and s.book.avg_rating <= 2.5 -%} <i class="fas fa-star"></i>
+                            <i class="fas fa-star"></i>
+                            <i class="far fa-star"></i>
+                            <i class="far fa-star"></i>
+                            <i class="far fa-star"></i>
+                            {% elif s.book.avg_rating > 2.5 and s.book.avg_rating <= 3.5 -%} <i class="fas fa-star"></i>
+                                <i class="fas fa-star"></i>
+                                <i class="fas fa-star"></i>
+                                <i class="far fa-star"></i>
+                                <i class="far fa-star"></i>
+                                {% elif s.book.avg_rating > 3.5 and s.book.avg_rating <= 4.5 -%} <i class="fas fa-star">
+                                    </i>
+                                    <i class="fas fa-star"></i>
+                                    <i class="fas fa-star"></i>
+                                    <i class="fas fa-star"></i>
+                                    <i class="far fa-star"></i>
+                                    {% else -%}
+                                    <i class="fas fa-star"></i>
+                                    <i class="fas fa-star"></i>
+                                    <i class="fas fa-star"></i>
+                                    <i class="fas fa-star"></i>
+                                    <i class="fas fa-star"></i>
+                                    {% endif %}
+                </span>
+            </div>
+
+        </div>
+        <div class="col-md-10">
+            <div class="card-body">
+                <h5 class="card-title"><a href="/book/{{s.book_id}}">{{s.book.title}}</a></h5>
+                <h6 class="card-subtitle mb-2 text-muted">By {{s.book.author}}</h6>
+                <p class="card-text">Published: <small class="text-muted"><mark>{{s.book.published_year}}
+                        </mark></small>
+                    Location: <small class="text-muted"><mark>{{s.location}} </mark></small> Condition: <small
+                        class="text-muted"><mark>{{s.condition}}</small></mark> </p>
+                <p class="card-text">{{s.book.description}}</p>
+                <p class="card-text"><em>Subjects: {{s.book.subjects}}</em></p>
+
+                {% if s.user_id != g.user.user_id %}
+                <form method="POST" action="/book/{{s.book_id}}/{{s.user_id}}/request">
+                    <button class="btn btn-info btn-md" type="submit"><i class="fas fa-book-reader"></i>
+                        &nbspRequest This Book</button>
+                </form>
+                {% else %}
+                <h6 class="card-subtitle mb-2 text-muted"><i class="fas fa-book"></i>&nbspYou own this book.</h6>
+                {% endif %}
+            </div>
+        </div>
+    </div>
+</div>
+{% endfor %}
+{% endblock %}
+"""
+
+
+def make_statuses(count):
+    """Books and statuses that are never saved, the way a search page gets them"""
+
+    statuses = []
+    for num in range(count):
+        book = Book(book_id=num, key=f"/works/OL{num}W", title=f"Book {num}", author="Author A, Author B",
+                    description="A description of the book. " * 8, subjects="Fiction, Adventure, Classics",
+                    cover_img_url_m="m.jpg", published_year="1950", avg_rating=(num % 10) / 2,
+                    updated_at=datetime(2021, 8, 11))
+        statuses.append(Status(book_id=num, user_id=num % 3, location="On Shelf", condition="Like New", book=book))
+    return statuses
+
+
+def time_render(render, rounds, before=None):
+    """Average ms per call of render, running before (untimed) ahead of each call"""
+
+    total = 0.0
+    for _ in range(rounds):
+        if before:
+            before()
+        start = time.perf_counter()
+        render()
+        total += time.perf_counter() - start
+    return total / rounds * 1000
+
+
+def time_compile(bytecode_cache):
+    """ms to compile every template in a new environment, like a new worker would"""
+
+    env = Environment(loader=app.jinja_env.loader, bytecode_cache=bytecode_cache)
+    env.filters.update(app.jinja_env.filters)
+    start = time.perf_counter()
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render time of a 20 card results page")
+    parser.add_argument("--rounds", type=int, default=300)
+    parser.add_argument("--cards", type=int, default=20)
+    args = parser.parse_args()
+
+    statuses = make_statuses(args.cards)
+    context = dict(status=statuses, term="book", page=1, per_page=args.cards, next_cursor=None)
+
+    with app.test_request_context("/search?term=book"):
+        g.user = CurrentUser(UserSnapshot(1, "reader", None))
+        legacy = app.jinja_env.from_string(LEGACY_RESULTS)
+
+        results = [
+            ("inline (old)", time_render(lambda: legacy.render(g=g, **context), args.rounds)),
+            ("fragments, cold", time_render(lambda: render_template("books/results.html", **context),
+                                            args.rounds, before=fragment_cache.clear)),
+            ("fragments, warm", time_render(lambda: render_template("books/results.html", **context),
+                                            args.rounds)),
+        ]
+
+    bytecode_dir = tempfile.mkdtemp()
+    compile_plain = time_compile(None)
+    time_compile(FileSystemBytecodeCache(bytecode_dir))
+    compile_cached = time_compile(FileSystemBytecodeCache(bytecode_dir))
+
+    print(f"{args.cards} cards, {args.rounds} rounds")
+    print(f"{'render':20} {'ms/page':>8}")
+    for label, ms in results:
+        print(f"{label:20} {ms:>8.3f}")
+    print(f"\n{'compile all templates':20} {'ms':>8}")
+    print(f"{'no bytecode cache':20} {compile_plain:>8.1f}")
+    print(f"{'bytecode cache':20} {compile_cached:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Benchmark: page latency and query counts
+#  Requests each page many times through the Flask test client, logged in
+#  as a random seeded user each time, and reports p50/p95/p99 latency plus
+#  the query count and database time from the Server-Timing header (see
+#  dbstats.py). Results are written to JSON so runs can be compared.
+#
+#  Run from the project folder against a seeded database:
+#      flask seed-data --users 20000 --books 200000
+#      python benchmarks/bench_routes.py --requests 200
+#      python benchmarks/bench_routes.py --compare benchmarks/results/<older run>.json
+#
+#  benchmarks/locustfile.py drives the same pages over HTTP against gunicorn.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+import warnings
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db, User, Book, Status, Borrower, BookRating, LenderRating
+from seeddata import WORDS
+from app import app, CURR_USER_KEY
+
+warnings.simplefilter("ignore")
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+ROUTES = {
+    'home': lambda pick: "/",
+    'search': lambda pick: f"/search?term={pick.choice(WORDS)}",
+    'book': lambda pick: f"/book/{pick.book_id()}",
+    'users': lambda pick: "/user/all",
+    'library': lambda pick: "/user/library",
+    'requests': lambda pick: "/user/requests",
+}
+
+
+class Picker:
+    """ Picker - random users and books to request pages with
+        - users are taken from those that own books, books from those on a shelf
+    """
+
+    def __init__(self, seed, sample=1000):
+        """Instatiate class variables on self"""
+        self.rand = random.Random(seed)
+        self.user_ids = [user_id for (user_id,) in
+                         db.session.query(Status.user_id).distinct().order_by(Status.user_id).limit(sample)]
+        self.book_ids = [book_id for (book_id,) in
+                         db.session.query(Status.book_id).order_by(Status.book_id).limit(sample * 10)]
+
+    def choice(self, items):
+        return self.rand.choice(items)
+
+    def user_id(self):
+        return self.rand.choice(self.user_ids)
+
+    def book_id(self):
+        return self.rand.choice(self.book_ids)
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of values (already sorted)"""
+    if not values:
+        return None
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies, queries, db_ms):
+    latencies, db_ms = sorted(latencies), sorted(db_ms)
+    return {
+        'requests': len(latencies),
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries_mean': round(sum(queries) / len(queries), 2),
+        'queries_max': max(queries),
+        'db_p50_ms': round(percentile(db_ms, 50), 2) if db_ms else None,
+    }
+
+
+def run_route(client, name, picker, requests, warmup):
+    """Request one page requests times (after warmup untimed ones), each as a random user"""
+
+    latencies, queries, db_ms = [], [], []
+    for num in range(warmup + requests):
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = picker.user_id()
+        url = ROUTES[name](picker)
+
+        start = time.perf_counter()
+        resp = client.get(url)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        if resp.status_code != 200:
+            raise SystemExit(f"{url} answered {resp.status_code}")
+        if num < warmup:
+            continue
+        latencies.append(elapsed)
+        timing = TIMING.search(resp.headers.get("Server-Timing", ""))
+        if timing:
+            db_ms.append(float(timing.group(1)))
+            queries.append(int(timing.group(2)))
+    return summarize(latencies, queries or [0], db_ms)
+
+
+def table_counts():
+    return {model.__tablename__: db.session.query(model).count()
+            for model in (User, Book, Status, Borrower, BookRating, LenderRating)}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    old = (baseline or {}).get('routes', {})
+    print(f"{'route':10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>8} {'db p50':>8}"
+          + ("   p95 vs baseline" if baseline else ""))
+    for name, r in results['routes'].items():
+        line = (f"{name:10} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                f"{r['queries_mean']:>8.1f} {r['db_p50_ms'] or 0:>8.2f}")
+        if name in old:
+            change = (r['p95_ms'] - old[name]['p95_ms']) / old[name]['p95_ms'] * 100
+            line += f"   {old[name]['p95_ms']:>8.2f} -> {r['p95_ms']:.2f} ({change:+.0f}%)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page latency and query counts on a seeded database")
+    parser.add_argument("--requests", type=int, default=100, help="timed requests per page")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed requests per page first")
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma separated, from: " + ", ".join(ROUTES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="JSON file to write (default benchmarks/results/routes-<time>.json)")
+    parser.add_argument("--compare", help="earlier JSON results to compare p95 against")
+    args = parser.parse_args()
+
+    app.config["WTF_CSRF_ENABLED"] = False
+    app.config["SLOW_QUERY_MS"] = None
+
+    with app.app_context():
+        picker = Picker(args.seed)
+        if not picker.user_ids:
+            raise SystemExit("No books on shelves yet, seed the database first: flask seed-data")
+
+        results = {
+            'started': datetime.utcnow().isoformat(timespec="seconds"),
+            'commit': git_commit(),
+            'database': db.engine.dialect.name,
+            'python': platform.python_version(),
+            'rows': table_counts(),
+            'settings': {'requests': args.requests, 'warmup': args.warmup, 'seed': args.seed},
+            'routes': {},
+        }
+        db.session.remove()
+
+        client = app.test_client()
+        for name in args.routes.split(","):
+            results['routes'][name] = run_route(client, name, picker, args.requests, args.warmup)
+            db.session.remove()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"routes-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(f"{results['database']} {results['rows']['books']:,} books {results['rows']['users']:,} users, "
+          f"{args.requests} requests per page")
+    print_results(results, baseline)
+    print(f"\nwritten to {out}")
+
+
+if __name__ == "__main__":
+    main()
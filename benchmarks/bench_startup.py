@@ -0,0 +1,181 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Benchmark: cold start and memory of each gunicorn worker
+#  --- cold start: a new python process importing the app and building it
+#      ("from app import app"), run --runs times
+#  --- workers: gunicorn -c gunicorn.conf.py started with and without
+#      preload, time until /healthz answers and the memory of each worker
+#      after a few pages. RSS counts pages shared with the master, PSS
+#      splits shared pages between the processes using them, private is
+#      what only that worker holds.
+#
+#  Run from the project folder (Linux, it reads /proc):
+#      python benchmarks/bench_startup.py
+#  The database is a throwaway SQLite file unless --database-url is given.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+PAGES = ["/", "/login", "/register", "/healthz"]
+
+COLD_START = """
+import time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+app.test_client().get("/login")
+print(round((imported - start) * 1000, 1), round((time.perf_counter() - start) * 1000, 1))
+"""
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory_kb(pid):
+    """Rss, Pss and private memory of a process in kB, from /proc/<pid>/smaps_rollup"""
+
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {'rss': fields['Rss'], 'pss': fields['Pss'],
+            'private': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+#--------------------------------------------------------------------------#
+#                           Measurements
+#--------------------------------------------------------------------------#
+
+def cold_start(env, runs):
+    """Median ms to import the app, and to import it and answer the first page"""
+
+    imports, firsts, walls = [], [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        out = subprocess.check_output([sys.executable, "-c", COLD_START], cwd=ROOT, env=env, text=True)
+        walls.append((time.perf_counter() - start) * 1000)
+        imported, first = out.split()[-2:]
+        imports.append(float(imported))
+        firsts.append(float(first))
+    return {'import_ms': median(imports), 'first_page_ms': median(firsts), 'process_ms': round(median(walls), 1)}
+
+
+def workers(env, preload, count, folder):
+    """Boot time and memory of each worker, gunicorn with gunicorn.conf.py"""
+
+    port = free_port()
+    env = dict(env, WEB_CONCURRENCY=str(count), GUNICORN_PRELOAD="1" if preload else "0")
+    log = open(os.path.join(folder, f"gunicorn-preload-{int(preload)}.log"), "w")
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py",
+                               "--bind", f"127.0.0.1:{port}", "app:app"],
+                              cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        booted = None
+        while booted is None and time.perf_counter() - start < 60:
+            if server.poll() is not None:
+                raise SystemExit(f"gunicorn did not start, see {log.name}")
+            try:
+                if requests.get(url + "/healthz", timeout=1).status_code == 200:
+                    booted = (time.perf_counter() - start) * 1000
+            except requests.RequestException:
+                time.sleep(0.05)
+        #wait for every worker, then warm each one up
+        while len(children(server.pid)) < count:
+            time.sleep(0.1)
+        time.sleep(1)
+        for _ in range(count * 10):
+            for page in PAGES:
+                requests.get(url + page, timeout=30)
+
+        worker_memory = [memory_kb(pid) for pid in children(server.pid)]
+        return {
+            'boot_ms': round(booted, 1),
+            'master_kb': memory_kb(server.pid),
+            'worker_kb': {key: round(sum(m[key] for m in worker_memory) / len(worker_memory))
+                          for key in ('rss', 'pss', 'private')},
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def create_database(env):
+    """Tables for the throwaway database, made with the app itself"""
+    subprocess.check_call([sys.executable, "-c", "from app import app\nfrom models import db\n"
+                           "with app.app_context(): db.create_all()"], cwd=ROOT, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start and per worker memory")
+    parser.add_argument("--runs", type=int, default=7, help="cold starts to take the median of")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--database-url", help="database to use instead of a throwaway SQLite file")
+    parser.add_argument("--label", default="", help="name for this run, i.e. before or after")
+    parser.add_argument("--out", help="JSON file to write (default benchmarks/results/startup-<time>.json)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        env = dict(os.environ, LOG_LEVEL="WARNING", JINJA_CACHE_DIR=os.path.join(folder, "jinja"),
+                   COVER_CACHE_DIR=os.path.join(folder, "covers"),
+                   DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(folder, 'startup.db')}")
+        create_database(env)
+        results = {
+            'label': args.label,
+            'started': datetime.utcnow().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'cold_start': cold_start(env, args.runs),
+            'workers': {'preload': workers(env, True, args.workers, folder),
+                        'no_preload': workers(env, False, args.workers, folder)},
+        }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"startup-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    cold = results['cold_start']
+    print(f"cold start: import {cold['import_ms']}ms, first page {cold['first_page_ms']}ms, "
+          f"whole process {cold['process_ms']}ms")
+    print(f"{'':11} {'boot ms':>8} {'worker rss kB':>14} {'pss kB':>8} {'private kB':>11}")
+    for name, r in results['workers'].items():
+        mem = r['worker_kb']
+        print(f"{name:11} {r['boot_ms']:>8.0f} {mem['rss']:>14} {mem['pss']:>8} {mem['private']:>11}")
+    print(f"\nwritten to {out}")
+
+
+if __name__ == "__main__":
+    main()
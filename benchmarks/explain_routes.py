@@ -0,0 +1,129 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Explain Routes: shows the query plan of every SELECT a page sends.
+#  Each page is requested through the Flask test client (logged in as the
+#  user who owns the most books) and the statements it sends are run again
+#  with EXPLAIN ANALYZE on Postgres (EXPLAIN QUERY PLAN on SQLite). The
+#  summary lists the indexes each page used and any full table scans.
+#
+#  Run from the project folder against a seeded database:
+#      DATABASE_URL=postgresql:///booklend_bench python benchmarks/explain_routes.py --seed 2000
+#  --seed N adds N books (and a user per 10 books, shelves, requests and
+#  ratings, see seeddata.py) to an empty database first. Leave it off to
+#  explain an existing database.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import argparse
+import os
+import re
+import sys
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func
+from models import db, Book, Status, Borrower
+from seeddata import generate
+from app import app, CURR_USER_KEY
+
+warnings.simplefilter("ignore")
+
+INDEX_NAME = re.compile(r"\b(ix_\w+|\w+_pkey|sqlite_autoindex_\w+)")
+FULL_SCAN = re.compile(r"Seq Scan on (\w+)|\bSCAN (\w+)\b(?! USING)")
+
+
+def capture(client, url):
+    """Request url and send back the SELECT statements (with parameters) it sent"""
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        resp = client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    if resp.status_code != 200:
+        print(f"  !! {url} answered {resp.status_code}")
+    return statements
+
+
+def explain(statement, parameters):
+    """Run statement again under EXPLAIN and send back the plan lines"""
+
+    with db.engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            prefix = "EXPLAIN (ANALYZE, BUFFERS) "
+        else:
+            prefix = "EXPLAIN QUERY PLAN "
+        rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+    return [" ".join(str(col) for col in row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show the query plans for each page")
+    parser.add_argument("--seed", type=int, default=0, help="books to add to an empty database first")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args()
+
+    app.config["SLOW_QUERY_MS"] = None
+    app.config["WTF_CSRF_ENABLED"] = False
+
+    with app.app_context():
+        db.create_all()
+        if args.seed and not db.session.query(Book.book_id).first():
+            generate(max(args.seed // 10, 2), args.seed, log=lambda line: None)
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+
+        #the user with the most books, a book they own and a user they borrowed from
+        viewer_id, = (db.session.query(Status.user_id).group_by(Status.user_id)
+                      .order_by(func.count().desc()).first() or (None,))
+        if viewer_id is None:
+            sys.exit("No books on shelves yet, run with --seed N on an empty database.")
+        book_id, = db.session.query(Status.book_id).filter_by(user_id=viewer_id).first()
+        owner_id, = (db.session.query(Borrower.status_owner_id).filter_by(borrower_id=viewer_id).first()
+                     or (viewer_id,))
+        term = db.session.query(Book.title).filter_by(book_id=book_id).scalar().split()[0]
+        db.session.remove()
+
+        routes = ["/", "/user/library", f"/book/{book_id}", f"/user/profile/{owner_id}",
+                  "/user/requests", f"/search?term={term}"]
+
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = viewer_id
+
+        summary = []
+        for url in routes:
+            statements = capture(client, url)
+            indexes, scans = set(), set()
+            if not args.quiet:
+                print(f"\n{'=' * 78}\n{url}  ({len(statements)} queries)")
+            for statement, parameters in statements:
+                plan = explain(statement, parameters)
+                text = "\n".join(plan)
+                indexes.update(INDEX_NAME.findall(text))
+                scans.update(name for match in FULL_SCAN.findall(text) for name in match if name)
+                if not args.quiet:
+                    print(f"{'-' * 78}\n{' '.join(statement.split())[:300]}\n")
+                    print(text)
+            summary.append((url, len(statements), sorted(indexes), sorted(scans)))
+
+    print(f"\n{'route':32} {'queries':>7}  indexes used / full scans")
+    for url, count, indexes, scans in summary:
+        print(f"{url[:32]:32} {count:>7}  {', '.join(indexes) or '-'}")
+        if scans:
+            print(f"{'':41}full scan: {', '.join(scans)}")
+
+
+if __name__ == "__main__":
+    main()
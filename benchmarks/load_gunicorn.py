@@ -0,0 +1,279 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Load test: page latency while slow searches run, sync vs gthread workers
+#  Starts a slow fake Open Library and then gunicorn twice:
+#  --- sync     plain "gunicorn app:app", how the Procfile used to run it
+#  --- gthread  "gunicorn -c gunicorn.conf.py app:app"
+#  Each time it times the home and login pages on their own, then again
+#  while --searches streaming searches (/api/search-wh/stream, one search
+#  call and ten work detail calls each) are all waiting on Open Library.
+#
+#  Run from the project folder:
+#      python benchmarks/load_gunicorn.py --searches 50 --search-delay 1 --detail-delay 1
+#  The database is a throwaway SQLite file unless --database-url is given
+#  (use an empty Postgres database, tables are created in it).
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from datetime import datetime
+import requests
+from flask import Flask
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "tests"))
+
+from models import db, connect_db, Book
+from fake_openlibrary import FakeOpenLibrary, make_works
+
+warnings.simplefilter("ignore")
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+PAGES = ["/", "/login"]
+MODES = ("sync", "gthread")
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of values (already sorted)"""
+    if not values:
+        return None
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def summarize(latencies, errors=0):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+        'max_ms': round(latencies[-1], 1),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+#--------------------------------------------------------------------------#
+#                           Setup
+#--------------------------------------------------------------------------#
+
+def make_library(searches):
+    """Ten works for each search, search num finds "Load<num> Book ..." only, so no
+    search is answered from another one's cache"""
+
+    works = make_works(searches * 10)
+    for num, work in enumerate(works):
+        work['title'] = f"Load{num // 10:03d} Book {num % 10}"
+    return works
+
+
+def create_database(database_url):
+    """Empty tables and a few books so the home page has cards to show"""
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    connect_db(app)
+    with app.app_context():
+        db.create_all()
+        if Book.query.first() is None:
+            db.session.add_all(Book(key=f"/works/OL{num}H", title=f"Home Book {num}", author="Author")
+                               for num in range(20))
+            db.session.commit()
+        db.engine.dispose()
+
+
+def start_gunicorn(mode, port, env, folder):
+    """Start gunicorn in mode and wait until /healthz answers"""
+
+    if mode == "sync":
+        #an empty config, or gunicorn would pick up ./gunicorn.conf.py on its own
+        config = os.path.join(folder, "empty.conf.py")
+        open(config, "w").close()
+    else:
+        config = os.path.join(ROOT, "gunicorn.conf.py")
+    log = open(os.path.join(folder, f"gunicorn-{mode}.log"), "w")
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", config, "--bind", f"127.0.0.1:{port}",
+                               "app:app"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"gunicorn ({mode}) did not start, see {log.name}")
+        try:
+            if requests.get(url + "/healthz", timeout=1).status_code == 200:
+                return server, url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f"gunicorn ({mode}) did not answer /healthz, see {log.name}")
+
+
+#--------------------------------------------------------------------------#
+#                           Load
+#--------------------------------------------------------------------------#
+
+def time_pages(url, stop, gap=0.05):
+    """Request the pages one after another until stop is set, latency in ms per request"""
+
+    latencies, errors = [], 0
+    while not stop.is_set():
+        for page in PAGES:
+            start = time.perf_counter()
+            try:
+                ok = requests.get(url + page, timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+        time.sleep(gap)
+    return summarize(latencies, errors)
+
+
+def run_searches(url, first, count):
+    """count searches at once, each reads its whole streamed reply. Latency in ms each."""
+
+    latencies, errors = [], []
+    start_all = threading.Barrier(count)
+
+    def search(num):
+        start_all.wait()
+        start = time.perf_counter()
+        try:
+            resp = requests.get(url + "/api/search-wh/stream", params={'title': f"Load{first + num:03d}", 'author': ""},
+                                timeout=120)
+            lines = resp.text.splitlines()
+            if resp.status_code != 200 or not lines or 'done' not in json.loads(lines[-1]):
+                raise ValueError(lines[-1] if lines else resp.status_code)
+            latencies.append((time.perf_counter() - start) * 1000)
+        except (requests.RequestException, ValueError) as err:
+            errors.append(str(err))
+
+    threads = [threading.Thread(target=search, args=(num,)) for num in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict(summarize(latencies, len(errors)), first_error=errors[0] if errors else None)
+
+
+def run_mode(mode, args, fake, folder, first_search):
+    database_url = args.database_url or f"sqlite:///{os.path.join(folder, mode + '.db')}"
+    create_database(database_url)
+
+    env = dict(os.environ, DATABASE_URL=database_url, PORT="0", LOG_LEVEL="WARNING",
+               WEB_CONCURRENCY=str(args.workers),
+               OPENLIBRARY_SEARCH_URL=fake.url + "/search.json", OPENLIBRARY_INFO_URL=fake.url,
+               OPENLIBRARY_TIMEOUT="30", COVER_CACHE_DIR=os.path.join(folder, mode + "-covers"))
+    server, url = start_gunicorn(mode, free_port(), env, folder)
+    try:
+        for page in PAGES:
+            requests.get(url + page, timeout=30)
+
+        stop = threading.Event()
+        idle = {}
+        sampler = threading.Thread(target=lambda: idle.update(time_pages(url, stop)))
+        sampler.start()
+        time.sleep(args.idle_seconds)
+        stop.set()
+        sampler.join()
+
+        stop = threading.Event()
+        loaded = {}
+        sampler = threading.Thread(target=lambda: loaded.update(time_pages(url, stop)))
+        started = time.perf_counter()
+        sampler.start()
+        searches = run_searches(url, first_search, args.searches)
+        stop.set()
+        sampler.join()
+        elapsed = time.perf_counter() - started
+
+        health = requests.get(url + "/healthz", timeout=30).json()
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    return {'pages_idle': idle, 'pages_during_searches': loaded, 'searches': searches,
+            'searches_total_s': round(elapsed, 2), 'pool_after': health.get('pool')}
+
+
+def print_results(results):
+    print(f"{'':9} {'pages idle p50/p95':>20} {'pages under load p50/p95/max':>30} {'searches p50/p95':>18} {'errors':>7}")
+    for mode, r in results['modes'].items():
+        idle, loaded, searches = r['pages_idle'], r['pages_during_searches'], r['searches']
+        errors = loaded['errors'] + searches['errors']
+        print(f"{mode:9} {idle.get('p50_ms', 0):>10.1f}/{idle.get('p95_ms', 0):<9.1f}"
+              f"{loaded.get('p50_ms', 0):>12.1f}/{loaded.get('p95_ms', 0):.1f}/{loaded.get('max_ms', 0):<10.1f}"
+              f"{searches.get('p50_ms', 0):>10.0f}/{searches.get('p95_ms', 0):<7.0f} {errors:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Page latency while slow searches run, sync vs gthread workers")
+    parser.add_argument("--searches", type=int, default=50, help="streaming searches started at once")
+    parser.add_argument("--search-delay", type=float, default=1.0, help="seconds the fake takes to answer a search")
+    parser.add_argument("--detail-delay", type=float, default=1.0, help="seconds for each work detail call")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes (WEB_CONCURRENCY)")
+    parser.add_argument("--idle-seconds", type=float, default=3, help="how long to time pages before the searches")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated, from: " + ", ".join(MODES))
+    parser.add_argument("--database-url", help="empty database to use instead of a throwaway SQLite file")
+    parser.add_argument("--out", help="JSON file to write (default benchmarks/results/load-<time>.json)")
+    args = parser.parse_args()
+
+    modes = args.modes.split(",")
+    works = make_library(args.searches * len(modes))
+    fake = FakeOpenLibrary(works, search_delay=args.search_delay, detail_delay=args.detail_delay,
+                           match_title=True).start()
+
+    results = {
+        'started': datetime.utcnow().isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'settings': {'searches': args.searches, 'search_delay': args.search_delay,
+                     'detail_delay': args.detail_delay, 'workers': args.workers},
+        'modes': {},
+    }
+    with tempfile.TemporaryDirectory() as folder:
+        for num, mode in enumerate(modes):
+            #each mode searches its own titles so nothing is cached from the run before
+            results['modes'][mode] = run_mode(mode, args, fake, folder, num * args.searches)
+    fake.stop()
+
+    out = args.out or os.path.join(RESULTS_DIR, f"load-{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{args.searches} searches at once, Open Library search {args.search_delay}s + details "
+          f"{args.detail_delay}s, {args.workers} workers, {os.cpu_count()} cpus")
+    print_results(results)
+    print(f"\nwritten to {out}")
+
+
+if __name__ == "__main__":
+    main()
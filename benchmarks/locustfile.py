@@ -0,0 +1,66 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  Locust load test: the same pages as bench_routes.py, over HTTP.
+#  Each simulated user logs in as a seeded user (flask seed-data) and
+#  browses. Locust is not in requirements.txt, install it to run this:
+#      pip install locust
+#      gunicorn app:app --workers 4
+#      locust -f benchmarks/locustfile.py --host http://localhost:8000 \
+#             --users 50 --spawn-rate 10 --run-time 2m --headless --csv benchmarks/results/locust
+#
+#  SEED_USERS sets how many seeded usernames (seed0, seed1, ...) to pick from.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+import random
+from locust import HttpUser, task, between
+
+SEED_USERS = int(os.environ.get("SEED_USERS", 1000))
+SEED_PASSWORD = "password"
+WORDS = ["Shadow", "River", "Garden", "Winter", "Secret", "House", "Light", "Stone"]
+
+
+class BookLandiaUser(HttpUser):
+    """ A logged in seeded user browsing BookLandia """
+
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        #CSRF is on for the login form, so read the token from the page first
+        page = self.client.get("/login", name="/login")
+        token = page.text.split('name="csrf_token" type="hidden" value="', 1)[-1].split('"', 1)[0]
+        self.client.post("/login", name="/login", data={
+            'csrf_token': token,
+            'username': f"seed{random.randrange(SEED_USERS)}",
+            'password': SEED_PASSWORD,
+        })
+
+    @task(5)
+    def home(self):
+        self.client.get("/", name="/")
+
+    @task(3)
+    def search(self):
+        self.client.get(f"/search?term={random.choice(WORDS)}", name="/search")
+
+    @task(3)
+    def book(self):
+        #seeded book ids start near 1, pick from the first few thousand
+        self.client.get(f"/book/{random.randint(1, 5000)}", name="/book/<id>")
+
+    @task(1)
+    def users(self):
+        self.client.get("/user/all", name="/user/all")
+
+    @task(2)
+    def library(self):
+        self.client.get("/user/library", name="/user/library")
+
+    @task(2)
+    def requests(self):
+        self.client.get("/user/requests", name="/user/requests")
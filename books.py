@@ -0,0 +1,365 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  books.py - the home page, book pages, searching our books, adding them
+#  to a shelf, borrowing (see borrow.py), book reviews and book covers.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from flask import Blueprint, current_app, render_template, request, redirect, flash, g, jsonify
+from sqlalchemy import tuple_
+from sqlalchemy.orm import contains_eager, joinedload
+from models import db, User, Book, Status, BookRating
+from forms import StatusForm, BookReviewForm
+from homefeed import latest_books, refresh_latest_books, book_rating_changed
+from covers import get_covers
+from pagination import get_per_page, encode_cursor, decode_cursor
+import borrow
+from borrow import BorrowError
+
+bp = Blueprint("books", __name__)
+
+
+@bp.route('/')
+def homepage():
+    """Show homepage:
+    - Anonymous users: will be directed to signup
+    - logged in user: will see list of books on shelves and reviews
+    """
+
+    if g.user:
+        
+        #Get the latest books added to BookLandia by timestamp, kept ready in the cache (see homefeed.py)
+        feed = latest_books()
+
+        #Get ids of the books on the feed that the user has rated, as a set
+        feed_book_ids = [status['book_id'] for status in feed]
+        reviews_book_ids = {book_rated for (book_rated,) in db.session.query(BookRating.book_rated)
+                            .filter(BookRating.user_rating==g.user.user_id,
+                                    BookRating.book_rated.in_(feed_book_ids))}
+
+        #render this template for users that is logged in.
+        return render_template('home.html', status=feed, reviews=reviews_book_ids)
+
+    else:
+        #render this template for users that have not logged in.
+        return render_template('home-anon.html')
+
+
+@bp.route("/addbooks")
+def add_books():
+    """Render search form"""
+
+    return render_template('books/search_wh.html')
+
+
+@bp.route('/covers/<cover>-<any(S,M,L):size>.jpg')
+def show_cover(cover, size):
+    """Book cover from the local cover cache, fetched from Open Library the first time.
+    Covers Open Library does not have come back as the placeholder."""
+
+    return get_covers().send(cover, size)
+
+
+@bp.route('/covers/placeholder-<any(S,M,L):size>.png')
+def show_cover_placeholder(size):
+    """Plain cover the right size for books without one"""
+
+    return get_covers().send_placeholder(size)
+
+
+#--------------------------------------------------------------------------#
+#                           Book Routes
+#--------------------------------------------------------------------------#
+
+
+@bp.route('/book/add-book')
+def add_book():
+    """ Upon seeing API search results on FrontEnd, users can add any books to 
+    their shelf which are directly tied from User to Status to Book tables. 
+    This allows the append option to work. Note, we use the book key when 
+    working with the API results to ensure a unique book.
+    """
+    
+    key = request.args['key']
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    
+    book_to_add = Book.query.filter_by(key=key).first() 
+    if book_to_add is None:
+        #its background job has not saved it yet
+        return (jsonify("Book is still being added, please try again."),409)
+    db.session.add(Status(book_id=book_to_add.book_id, user_id=g.user.user_id))
+    db.session.commit()      
+    refresh_latest_books()
+
+    return (jsonify("Book Added"),201)
+
+
+@bp.route('/search')
+def search_booklandia():
+    """A user can search the Books Database which will look at the title, author, and description. 
+       There is a field in the nav bar that will collect arguments and send to this path.  
+       On Postgres we use the full text search index (see Book.matching) and order by rank,
+       otherwise we use SQL like arguments i.e. % and order by title.
+       Statuses are joined to their matching books in one query and served a page at a time 
+       (page/per_page, with "after" holding where the last page ended).
+       We serve up those findings on a results page. 
+    """
+ 
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    term = request.args["term"]
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = get_per_page()
+    #sort key, book_id, user_id of the last row on the page before
+    after = decode_cursor(request.args.get("after"), 3)
+
+    match, rank = Book.matching(term, trigram=current_app.config["SEARCH_TRIGRAM"])
+    sort_key = rank if rank is not None else Book.title
+    
+    found_books = (Status.query
+                    .join(Status.book)
+                    .options(contains_eager(Status.book))
+                    .filter(match)
+                    .add_columns(sort_key.label("sort_key"))
+                    .order_by(sort_key.desc(), Status.book_id.desc(), Status.user_id.desc()))
+    if after:
+        found_books = found_books.filter(tuple_(sort_key, Status.book_id, Status.user_id) < tuple_(*after))
+    
+    #one extra row tells us if there is a next page
+    rows = found_books.limit(per_page + 1).all()
+    statuses = [status for status, sort_value in rows[:per_page]]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last_status, last_sort_value = rows[per_page - 1]
+        next_cursor = encode_cursor([last_sort_value, last_status.book_id, last_status.user_id])
+
+    return render_template('books/results.html', status=statuses, term=term, page=page,
+                            per_page=per_page, next_cursor=next_cursor)
+
+
+@bp.route('/book/<int:book_id>')
+def book_info(book_id):
+    """ Every book has it's own page. You can see details about specific book, requests/owners, and reviews.
+    To show necessary information, we query against the book table, the status table, and the book rating table.
+    """
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    book = Book.query.filter_by(book_id=book_id).one()
+    book_statuses = (Status.query
+                    .options(joinedload(Status.user))
+                    .filter_by(book_id=book_id)
+                    .all())
+    book_reviews = (BookRating.query
+                    .options(joinedload(BookRating.user))
+                    .filter_by(book_rated=book_id)
+                    .all())
+    reviews_user_ids = [review.user_rating for review in book_reviews]
+
+    return render_template('books/info.html', book=book, statuses=book_statuses, ratings=book_reviews, user_ids=reviews_user_ids)
+
+
+@bp.route('/book/<int:book_id>/update', methods=["GET","POST"])
+def update_book(book_id):
+    """ If a user owns a book, they have the ability to update the book's location and condition. Users will 
+    not be able to update books that are own by other users. They are presented with a WTForm for these two arguments.
+    These values are then committed to the database for the specific book being updated."""
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    form=StatusForm()
+
+    user_book = Status.query.filter_by(user_id=g.user.user_id,book_id=book_id).one()
+
+    if form.validate_on_submit():
+        location = request.form['location']
+        condition = request.form['condition']
+        #taking a book off the shelf or putting it back, requests move it through borrow.py
+        #which saves the condition in the same commit
+        if location != user_book.location:
+            try:
+                borrow.shelve_copy(book_id, g.user.user_id, location, condition=condition)
+            except BorrowError as err:
+                flash(str(err), "warning")
+                return redirect("/user/library")
+        else:
+            user_book.condition = condition
+            db.session.commit()
+        refresh_latest_books()
+        flash("Book updated.", "success")
+        return redirect("/user/library")
+    return render_template('books/update_bk.html', form=form, book=user_book)
+
+
+@bp.route('/book/<int:book_id>/delete', methods=["POST"])
+def delete_book(book_id):
+    """ While updating a book that they own, they can delete this from their libarary by committing 
+    the delete to the status table. This will not delete the book from the book table.  
+    """
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    user_book = Status.query.filter_by(user_id=g.user.user_id,book_id=book_id).one()
+    db.session.delete(user_book)
+    db.session.commit()
+    refresh_latest_books()
+    flash("Book removed from library.", "success")
+    return redirect("/user/library")
+
+
+@bp.route('/book/<int:book_id>/<int:user_id>/request', methods=["POST"])
+def request_book(book_id,user_id):
+    """If a user finds a book where location of book is "On the Shelf", they can request this book.
+    Upon hitting the request button, this route is taken. The request is saved in the Borrower Table and 
+    the borrow history, and will remain there until the owner of the book approves/disapproves the request. 
+    Only one request gets a copy, if someone else got there first the user is told so (see borrow.py).
+    The user is redirected to see all requests that they have made and that are requesting his/her book. 
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    try:
+        borrow.request_copy(book_id, user_id, g.user.user_id)
+    except BorrowError as err:
+        flash(str(err), "warning")
+        return redirect(f'/user/profile/{user_id}')
+    refresh_latest_books()
+
+    flash("Book has been requested.", "success")
+    return redirect('/user/requests')
+
+    
+@bp.route('/book/<int:book_id>/<int:user_id>/approve', methods=["POST"])
+def approve_request(book_id,user_id):
+    """Book Owner can approve the request that has been made on their book.
+       This will update the status of book to "Checked Out".
+    """
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    try:
+        borrow.approve_request(book_id, user_id, g.user.user_id)
+    except BorrowError as err:
+        flash(str(err), "warning")
+    return redirect ('/user/requests')
+
+@bp.route('/book/<int:book_id>/<int:user_id>/reject', methods=["POST"])
+def reject_request(book_id,user_id):
+    """Book Owner can reject the request that has been made on their book.
+       This will remove the request from the Borrower table and put the book back on the shelf.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    try:
+        borrow.reject_request(book_id, user_id, g.user.user_id)
+    except BorrowError as err:
+        flash(str(err), "warning")
+        return redirect('/user/requests')
+    refresh_latest_books()
+
+    return redirect ('/user/requests')    
+
+@bp.route('/book/<int:book_id>/<int:user_id>/return', methods=["POST"])
+def return_book(book_id,user_id):
+    """Book Owner marks a checked out book as returned, which puts it back on the shelf.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    try:
+        borrow.return_copy(book_id, user_id, g.user.user_id)
+    except BorrowError as err:
+        flash(str(err), "warning")
+        return redirect('/user/requests')
+    refresh_latest_books()
+
+    flash("Book is back on the shelf.", "success")
+    return redirect ('/user/requests')
+
+@bp.route('/book/<int:book_id>/<int:user_id>/review', methods=["GET","POST"])
+def review_book(book_id,user_id):
+    """Logged in user can write a review and provide a rating on any book. We first query to get the 
+    specific book object. Upon validating WTForm, we create a new rating record in the BookRating table.
+    With the added rating, we need to update the Avg Rating for the book in question. Book.add_rating 
+    bumps the book's rating count and sum and works out "avg_rating" from them, committed together
+    with the new rating.
+    """
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    form=BookReviewForm()
+
+    book_under_review = Book.query.get(book_id)
+    user = User.query.get(user_id)
+
+    if form.validate_on_submit():
+        rating = request.form['rating']
+        review = request.form['review']
+        new_rating = BookRating(book_rated=book_under_review.book_id, 
+                    user_rating=user.user_id,rating=rating,review=review)
+        db.session.add(new_rating)
+        Book.add_rating(book_under_review.book_id, rating)
+        db.session.commit()
+        book_rating_changed(book_under_review.book_id)
+
+        flash("Rating and review added.", "success")
+        return redirect("/")
+
+    return render_template('books/review.html', form=form, book=book_under_review)
+
+
+@bp.route('/book/<int:book_id>/<int:user_id>/review/update', methods=["GET","POST"])
+def update_book_review(book_id,user_id):
+    """If a user has an existing review on specific book, they can update the rating and review in this route.
+    Because they may have changed their rating value, we need to ensure the avg_rating is updated.
+    """
+        
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    
+    book_under_review = Book.query.get(book_id)
+
+    form=BookReviewForm()
+
+    if form.validate_on_submit():
+        rating = request.form['rating']
+        review = request.form['review']
+
+        current_review = BookRating.query.filter_by(book_rated=book_id,user_rating=user_id).one()
+        Book.add_rating(book_id, rating, old_rating=current_review.rating)
+        current_review.rating = rating
+        current_review.review = review
+        db.session.commit()
+        book_rating_changed(book_id)
+
+        flash("Rating and review updated.", "success")
+        return redirect("/")
+    
+    return render_template('books/update_rv.html', form=form, book=book_under_review)
@@ -0,0 +1,168 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  borrow.py moves a copy (a book on an owner's shelf) through borrowing:
+#
+#      On Shelf --request--> Requested --approve--> Checked Out
+#         ^                      |                       |
+#         +-------reject---------+                       |
+#         +-------return (marked by the owner)-----------+
+#
+#  - each step is one conditional UPDATE of the status, i.e.
+#    UPDATE statuses SET location='Requested' WHERE ... AND location='On Shelf'
+#    If the copy is not where the step needs it (someone else got there
+#    first) no row changes and BorrowError is raised. The UPDATE also
+#    holds the status row lock for the rest of the step on Postgres.
+#  - each borrow is a borrow_history row with the time of every step, a
+#    unique index on the open borrow of a copy backs up the status check
+#  - one commit per step, anything that goes wrong rolls the step back
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import db, Status, Borrower, BorrowHistory
+
+#where a copy can be (statuses.location)
+ON_SHELF = "On Shelf"
+OFF_SHELF = "Off Shelf"
+REQUESTED = "Requested"
+CHECKED_OUT = "Checked Out"
+SHELF_LOCATIONS = (ON_SHELF, OFF_SHELF)
+
+#where a borrow is at (borrow_history.state)
+BORROW_REQUESTED = "requested"
+BORROW_CHECKED_OUT = "checked_out"
+BORROW_REJECTED = "rejected"
+BORROW_RETURNED = "returned"
+OPEN_BORROW = (BORROW_REQUESTED, BORROW_CHECKED_OUT)
+
+
+class BorrowError(Exception):
+    """Raised when a copy is not where a step needs it, or the user can't take that step"""
+
+
+#--------------------------------------------------------------------------#
+#                           Helpers
+#--------------------------------------------------------------------------#
+
+@contextmanager
+def transaction():
+    """One commit for the step. Any error rolls it all back, and a clash on the open
+    borrow index (another request got in first) comes back as BorrowError."""
+
+    try:
+        yield
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise BorrowError("Someone else has already requested this book.")
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def move_copy(book_id, owner_id, source, target, **values):
+    """Move a copy from source to target location. False if it was not at source.
+    source can be a tuple of locations, values are other status columns to set with it."""
+
+    sources = source if isinstance(source, tuple) else (source,)
+    result = db.session.execute(update(Status.__table__)
+                                .where(Status.book_id == book_id, Status.user_id == owner_id,
+                                       Status.location.in_(sources))
+                                .values(location=target, **values))
+    return result.rowcount == 1
+
+
+def close_borrow(book_id, owner_id, source, target, **times):
+    """Move the open borrow of a copy from state source to target, setting the times given"""
+
+    db.session.execute(update(BorrowHistory.__table__)
+                       .where(BorrowHistory.book_id == book_id, BorrowHistory.owner_id == owner_id,
+                              BorrowHistory.state == source)
+                       .values(state=target, **times))
+
+
+def check_owner(owner_id, user_id):
+    if owner_id != user_id:
+        raise BorrowError("Only the owner of this book can do that.")
+
+
+#--------------------------------------------------------------------------#
+#                           Steps
+#--------------------------------------------------------------------------#
+
+def request_copy(book_id, owner_id, borrower_id):
+    """borrower_id asks to borrow the owner's copy, it must be on the shelf"""
+
+    if borrower_id == owner_id:
+        raise BorrowError("You can't request your own book.")
+
+    with transaction():
+        if not move_copy(book_id, owner_id, ON_SHELF, REQUESTED):
+            raise BorrowError("This book is not on the shelf anymore.")
+        db.session.add(BorrowHistory(book_id=book_id, owner_id=owner_id, borrower_id=borrower_id,
+                                     state=BORROW_REQUESTED, requested_at=datetime.utcnow()))
+        #borrowers is what lender reviews check, see review_lender
+        db.session.add(Borrower(book_id=book_id, status_owner_id=owner_id, borrower_id=borrower_id))
+
+
+def approve_request(book_id, owner_id, user_id):
+    """The owner lends out a requested copy"""
+
+    check_owner(owner_id, user_id)
+    with transaction():
+        if not move_copy(book_id, owner_id, REQUESTED, CHECKED_OUT):
+            raise BorrowError("This book has no request waiting.")
+        close_borrow(book_id, owner_id, BORROW_REQUESTED, BORROW_CHECKED_OUT, checked_out_at=datetime.utcnow())
+
+
+def reject_request(book_id, owner_id, user_id):
+    """The owner turns down a request, the copy goes back on the shelf and the request is
+    taken out of borrowers so it does not count toward a lender review"""
+
+    check_owner(owner_id, user_id)
+    with transaction():
+        if not move_copy(book_id, owner_id, REQUESTED, ON_SHELF):
+            raise BorrowError("This book has no request waiting.")
+        borrow = (BorrowHistory.query
+                  .filter_by(book_id=book_id, owner_id=owner_id, state=BORROW_REQUESTED)
+                  .one_or_none())
+        if borrow is not None:
+            borrow.state = BORROW_REJECTED
+            borrow.rejected_at = datetime.utcnow()
+            #the latest request, earlier borrows of this copy by the same user stay
+            request = (Borrower.query
+                       .filter_by(book_id=book_id, status_owner_id=owner_id, borrower_id=borrow.borrower_id)
+                       .order_by(Borrower.id.desc())
+                       .first())
+            if request is not None:
+                db.session.delete(request)
+
+
+def return_copy(book_id, owner_id, user_id):
+    """The owner has the copy back, it goes back on the shelf"""
+
+    check_owner(owner_id, user_id)
+    with transaction():
+        if not move_copy(book_id, owner_id, CHECKED_OUT, ON_SHELF):
+            raise BorrowError("This book is not checked out.")
+        close_borrow(book_id, owner_id, BORROW_CHECKED_OUT, BORROW_RETURNED, returned_at=datetime.utcnow())
+
+
+def shelve_copy(book_id, owner_id, location, condition=None):
+    """The owner takes a copy off the shelf or puts it back, with its new condition if given
+    (saved in the same commit). Copies that are requested or checked out are moved by the
+    steps above instead."""
+
+    if location not in SHELF_LOCATIONS:
+        raise BorrowError("Requests are approved and returned from the requests page.")
+    values = {'condition': condition} if condition is not None else {}
+    with transaction():
+        if not move_copy(book_id, owner_id, SHELF_LOCATIONS, location, **values):
+            raise BorrowError("This book is requested or checked out, see the requests page.")
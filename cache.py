@@ -0,0 +1,267 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  cache.py holds the caches we keep in front of slow calls.
+#  TTLCache - in-process cache with a time to live and LRU eviction
+#  TwoTierCache - TTLCache in front of the cache_entries table so entries
+#                 survive restarts and are shared across gunicorn workers
+#
+#  References:
+#  --- SQLAlchemy Documentation Website
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, CacheEntry, dialect_insert
+
+log = logging.getLogger(__name__)
+
+#Sent back by get() when nothing is cached, so None and [] can be cached
+MISSING = object()
+
+ENTRIES = CacheEntry.__table__
+
+
+#--------------------------------------------------------------------------#
+#                           In-Process Cache
+#--------------------------------------------------------------------------#
+
+class TTLCache:
+    """ TTLCache
+        - keeps up to maxsize entries, least recently used is evicted first
+        - each entry expires after its ttl (seconds)
+        - safe to share between threads
+    """
+
+    def __init__(self, maxsize=256, ttl=300):
+        """Instatiate class variables on self"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<TTLCache size={len(self.entries)} maxsize={self.maxsize} ttl={self.ttl}>"
+
+    def get(self, key):
+        """Send back the cached value or MISSING if not there or expired"""
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Save value for ttl seconds, evicting the oldest entries when full"""
+
+        ttl = self.ttl if ttl is None else ttl
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self.entries)}
+
+
+#--------------------------------------------------------------------------#
+#                           Two-Tier Cache
+#--------------------------------------------------------------------------#
+
+class TwoTierCache:
+    """ TwoTierCache
+        - checks the in-process TTLCache first, then the cache_entries table
+        - namespace keeps different kinds of entries apart in one table
+        - empty values are cached for negative_ttl seconds instead of ttl
+        - the table is pruned back to max_rows every prune_every writes
+        - a database error is logged and treated as a miss
+        - the table is used on a connection of its own (db.engine.begin()), a
+          cache call never commits or rolls back the request's session
+    """
+
+    def __init__(self, namespace, ttl=86400, negative_ttl=600, local_size=256, local_ttl=300,
+                 max_rows=10000, prune_every=100):
+        """Instatiate class variables on self"""
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.local = TTLCache(maxsize=local_size, ttl=local_ttl)
+        self.max_rows = max_rows
+        self.prune_every = prune_every
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.db_hits = 0
+        self.db_misses = 0
+        self.db_errors = 0
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<TwoTierCache namespace={self.namespace} ttl={self.ttl}>"
+
+    def full_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def count(self, hits=0, misses=0, errors=0):
+        #request threads share this cache, += on its own can lose counts
+        with self.lock:
+            self.db_hits += hits
+            self.db_misses += misses
+            self.db_errors += errors
+
+    def get(self, key):
+        """Send back one cached value or MISSING"""
+        return self.get_many([key]).get(key, MISSING)
+
+    def get_many(self, keys):
+        """Send back a dictionary of the keys that are cached. Keys not found in-process are
+        looked up in the table with one query."""
+
+        found = {}
+        db_keys = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is MISSING:
+                db_keys.append(key)
+            else:
+                found[key] = value
+
+        if not db_keys:
+            return found
+
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                rows = conn.execute(select(ENTRIES.c.key, ENTRIES.c.value, ENTRIES.c.expires_at)
+                                    .where(ENTRIES.c.key.in_([self.full_key(key) for key in db_keys]))
+                                    .where(ENTRIES.c.expires_at > now)).all()
+        except SQLAlchemyError:
+            log.exception("cache %s: lookup failed", self.namespace)
+            self.count(errors=1)
+            return found
+
+        prefix = len(self.namespace) + 1
+        for full_key, value, expires_at in rows:
+            key = full_key[prefix:]
+            found[key] = value
+            #keep it in-process no longer than the table would
+            remaining = (expires_at - now).total_seconds()
+            self.local.set(key, value, ttl=min(self.local.ttl, remaining))
+
+        self.count(hits=len(rows), misses=len(db_keys) - len(rows))
+        return found
+
+    def set(self, key, value, ttl=None):
+        """Save one value in-process and in the table"""
+        self.set_many({key: value}, ttl=ttl)
+
+    def set_many(self, values, ttl=None):
+        """Save several values with a single upsert. Empty values use the negative ttl."""
+
+        if not values:
+            return
+
+        now = datetime.utcnow()
+        rows = []
+        for key, value in values.items():
+            entry_ttl = ttl if ttl is not None else (self.ttl if value else self.negative_ttl)
+            self.local.set(key, value, ttl=min(self.local.ttl, entry_ttl))
+            rows.append({'key': self.full_key(key), 'value': value, 'created_at': now,
+                         'expires_at': now + timedelta(seconds=entry_ttl)})
+
+        stmt = dialect_insert(ENTRIES)
+        stmt = stmt.on_conflict_do_update(index_elements=['key'],
+                    set_={'value': stmt.excluded.value, 'created_at': stmt.excluded.created_at,
+                          'expires_at': stmt.excluded.expires_at})
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(stmt, rows)
+        except SQLAlchemyError:
+            log.exception("cache %s: write failed", self.namespace)
+            self.count(errors=1)
+            return
+
+        with self.lock:
+            self.writes += len(rows)
+            prune = self.writes >= self.prune_every
+            if prune:
+                self.writes = 0
+        if prune:
+            self.prune()
+
+    def delete(self, key):
+        """Drop one value from both tiers"""
+
+        self.local.delete(key)
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(ENTRIES.delete().where(ENTRIES.c.key == self.full_key(key)))
+        except SQLAlchemyError:
+            log.exception("cache %s: delete failed", self.namespace)
+            self.count(errors=1)
+
+    def prune(self):
+        """Delete expired rows, then the oldest rows past max_rows for this namespace"""
+
+        like = self.namespace + ":%"
+        keep = (select(ENTRIES.c.key)
+                .where(ENTRIES.c.key.like(like))
+                .order_by(ENTRIES.c.created_at.desc())
+                .limit(self.max_rows))
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(ENTRIES.delete()
+                             .where(ENTRIES.c.key.like(like), ENTRIES.c.expires_at <= datetime.utcnow()))
+                conn.execute(ENTRIES.delete()
+                             .where(ENTRIES.c.key.like(like), ~ENTRIES.c.key.in_(keep.subquery().select())))
+        except SQLAlchemyError:
+            log.exception("cache %s: prune failed", self.namespace)
+            self.count(errors=1)
+
+    def clear(self):
+        """Empty the in-process tier and this namespace's rows"""
+
+        self.local.clear()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(ENTRIES.delete().where(ENTRIES.c.key.like(self.namespace + ":%")))
+        except SQLAlchemyError:
+            log.exception("cache %s: clear failed", self.namespace)
+            self.count(errors=1)
+
+    def stats(self):
+        """Hit/miss numbers for both tiers"""
+        return {'local': self.local.stats(),
+                'db': {'hits': self.db_hits, 'misses': self.db_misses, 'errors': self.db_errors}}
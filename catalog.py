@@ -0,0 +1,329 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  catalog.py loads books straight from an Open Library data dump instead
+#  of one search at a time. Run it with the flask command (see commands.py):
+#      flask import-dump ol_dump_works_latest.txt.gz --authors ol_dump_authors_latest.txt.gz
+#
+#  - the dump is read a line at a time (gzip or plain), so memory stays the
+#    same however big it is. Dump lines are tab separated with the record's
+#    JSON last; plain JSON lines work too. Only works are loaded.
+#  - records become book rows with the same author, subject, description
+#    and cover rules as Warehouse.findBooksInWH (see func.py)
+#  - batches are loaded by worker processes, each with its own connection,
+#    as an upsert on key (COPY into a temp table first on Postgres)
+#  - after each batch the line count is saved to a checkpoint file, so an
+#    import that stops can be run again and carries on from there
+#
+#  Author names are not in the works dump, only author keys. Pass the
+#  authors dump to fill them in (those names are kept in memory).
+#
+#  References:
+#  --- Open Library Data Dumps Documentation Website
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime
+from sqlalchemy import create_engine, or_, select, table, column, func as sql_func
+from sqlalchemy.dialects import postgresql, sqlite
+from dbconfig import engine_options
+from func import BookRecord
+from models import Book
+
+BATCH_SIZE = 5000
+COVER_ID_URL = "http://covers.openlibrary.org/b/id/"
+WORK_TYPE = "/type/work"
+#the columns a dump fills in, everything else keeps its default or current value
+FIELDS = ('key', 'title', 'author', 'description', 'subjects', 'cover_img_url_m', 'cover_img_url_s', 'published_year')
+YEAR = re.compile(r"\b(\d{4})\b")
+
+
+#--------------------------------------------------------------------------#
+#                           Reading the Dump
+#--------------------------------------------------------------------------#
+
+def open_dump(path):
+    """Open a dump as text, gzip or not"""
+
+    with open(path, "rb") as f:
+        gzipped = f.read(2) == b"\x1f\x8b"
+    if gzipped:
+        return gzip.open(path, "rt", encoding="utf8")
+    return open(path, "r", encoding="utf8")
+
+
+def parse_line(line):
+    """Send back (type, JSON record) of one dump line, None if it can't be read"""
+
+    line = line.rstrip("\n")
+    if not line:
+        return None
+    #dump lines are type, key, revision, last modified then the JSON
+    text = line if line.startswith("{") else line.rsplit("\t", 1)[-1]
+    try:
+        record = json.loads(text)
+    except ValueError:
+        return None
+    kind = record.get('type')
+    kind = kind.get('key') if isinstance(kind, dict) else kind
+    return kind, record
+
+
+def read_batches(path, batch_size=BATCH_SIZE, skip=0):
+    """Yield lists of up to batch_size raw lines, after skipping the first skip lines"""
+
+    with open_dump(path) as dump:
+        for _ in range(skip):
+            if not dump.readline():
+                return
+        batch = []
+        for line in dump:
+            batch.append(line)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+
+def load_authors(path, log=print):
+    """Author key -> name from an authors dump"""
+
+    authors = {}
+    with open_dump(path) as dump:
+        for line in dump:
+            parsed = parse_line(line)
+            if parsed and parsed[1].get('name'):
+                authors[parsed[1]['key']] = parsed[1]['name']
+    log(f"{len(authors):,} author names loaded")
+    return authors
+
+
+#--------------------------------------------------------------------------#
+#                           Records to Book Rows
+#--------------------------------------------------------------------------#
+
+def work_to_row(record, authors):
+    """Book row for one work record, None if it has no key or title. The record is turned
+    into the search doc and work details findBooksInWH works from, then cleaned the same way."""
+
+    if not record.get('key') or not record.get('title'):
+        return None
+
+    names = [authors[entry['author']['key']] for entry in record.get('authors', [])
+             if isinstance(entry.get('author'), dict) and entry['author'].get('key') in authors]
+    year = YEAR.search(str(record.get('first_publish_date', "")))
+    doc = {'key': record['key'], 'title': record['title'], 'author_name': names or None,
+           'edition_key': None, 'first_publish_year': year.group(1) if year else None}
+
+    book_info = {field: record[field] for field in ('description', 'subjects') if field in record}
+    cover_edition = record.get('cover_edition')
+    if isinstance(cover_edition, dict) and cover_edition.get('key'):
+        book_info['cover_edition_key'] = cover_edition['key'].rsplit("/", 1)[-1]
+
+    book = BookRecord.from_doc(doc, book_info)
+    #works without a cover edition often still list cover ids
+    covers = [cover for cover in record.get('covers', []) if isinstance(cover, int) and cover > 0]
+    if book.cover_img_url_m is None and covers:
+        book = book._replace(cover_img_url_m=f"{COVER_ID_URL}{covers[0]}-M.jpg",
+                             cover_img_url_s=f"{COVER_ID_URL}{covers[0]}-S.jpg")
+    if book.cover_img_url_m is None:
+        book = book._replace(cover_img_url_m=Book.cover_img_url_m.default.arg,
+                             cover_img_url_s=Book.cover_img_url_m.default.arg)
+    return book.row()
+
+
+#--------------------------------------------------------------------------#
+#                           Loading Batches (in worker processes)
+#--------------------------------------------------------------------------#
+
+_engine = None
+_authors = {}
+
+
+def init_worker(database_url, authors):
+    """Each worker process opens its own connections"""
+
+    global _engine, _authors
+    _engine = create_engine(database_url, **engine_options(database_url))
+    _authors = authors
+
+
+def upsert_statement(dialect, source=None):
+    """INSERT ... ON CONFLICT (key) DO UPDATE, only touching rows that changed so running
+    the same dump again does not rewrite them. source is a select to insert from."""
+
+    insert = (postgresql if dialect == "postgresql" else sqlite).insert(Book.__table__)
+    if source is not None:
+        insert = insert.from_select(list(FIELDS), source)
+    changed = or_(*[Book.__table__.c[field].is_distinct_from(insert.excluded[field])
+                    for field in FIELDS if field != 'key'])
+    return insert.on_conflict_do_update(
+        index_elements=['key'],
+        set_=dict({field: insert.excluded[field] for field in FIELDS if field != 'key'},
+                  updated_at=sql_func.now()),
+        where=changed)
+
+
+def copy_upsert(conn, rows):
+    """Postgres: COPY the rows into a temp table, then one upsert from it"""
+
+    cursor = conn.connection.cursor()
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS import_books "
+                   f"({', '.join(field + ' text' for field in FIELDS)}) ON COMMIT DELETE ROWS")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([r"\N" if row[field] is None else row[field] for field in FIELDS])
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY import_books ({', '.join(FIELDS)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+
+    staged = table("import_books", *[column(field) for field in FIELDS])
+    conn.execute(upsert_statement("postgresql", select(*[staged.c[field] for field in FIELDS])))
+
+
+def parse_batch(lines):
+    """Book rows for the works in a batch of dump lines. Sends back (lines read, rows)."""
+
+    rows = {}
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed is None or parsed[0] != WORK_TYPE:
+            continue
+        row = work_to_row(parsed[1], _authors)
+        if row is not None:
+            #a key can only be upserted once per statement, the last one wins
+            rows[row['key']] = row
+    return len(lines), list(rows.values())
+
+
+def upsert_rows(rows):
+    """Upsert book rows in one transaction. Sends back how many."""
+
+    if not rows:
+        return 0
+    with _engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            copy_upsert(conn, rows)
+            return len(rows)
+
+        #plain tuples straight to the driver's executemany like seeddata.bulk_insert, with the
+        #column defaults filled in once instead of by SQLAlchemy for every row
+        insert = upsert_statement(conn.dialect.name).compile(dialect=conn.dialect, column_keys=list(FIELDS))
+        defaults = {'rating_count': 0, 'rating_sum': 0,
+                    'updated_at': datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")}
+        conn.exec_driver_sql(str(insert), [tuple(row[name] if name in row else defaults[name]
+                                                 for name in insert.positiontup) for row in rows])
+    return len(rows)
+
+
+def load_batch(lines):
+    """Parse a batch of dump lines and upsert the works in it.
+    Sends back (lines read, books loaded)."""
+
+    count, rows = parse_batch(lines)
+    return count, upsert_rows(rows)
+
+
+#--------------------------------------------------------------------------#
+#                           Checkpoints
+#--------------------------------------------------------------------------#
+
+def dump_id(path):
+    stat = os.stat(path)
+    return {'dump': os.path.abspath(path), 'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+
+
+def read_checkpoint(checkpoint_path, path):
+    """Lines and books already loaded from this dump, (0, 0) for a new or different dump"""
+
+    try:
+        with open(checkpoint_path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return 0, 0
+    if {key: saved.get(key) for key in ('dump', 'size', 'mtime')} != dump_id(path):
+        return 0, 0
+    return saved['lines'], saved['books']
+
+
+def write_checkpoint(checkpoint_path, path, lines, books, complete=False):
+    """Write to a temp file then rename, so a crash never leaves half a checkpoint"""
+
+    temp = checkpoint_path + ".tmp"
+    with open(temp, "w") as f:
+        json.dump(dict(dump_id(path), lines=lines, books=books, complete=complete), f)
+    os.replace(temp, checkpoint_path)
+
+
+#--------------------------------------------------------------------------#
+#                           Import
+#--------------------------------------------------------------------------#
+
+def import_dump(path, database_url, workers=4, batch_size=BATCH_SIZE, authors_path=None,
+                checkpoint_path=None, restart=False, log=print, log_every=5):
+    """Load the works in a dump into the books table. Batches go to worker processes
+    (or run here with workers=1), at most two per worker waiting at a time so memory stays
+    flat. They are checkpointed in order, so a rerun starts after the last whole batch.
+    SQLite only lets one connection write at a time, so there the workers only parse and
+    this process writes. Sends back a dict of lines and books loaded this run and the rows
+    per second."""
+
+    checkpoint_path = checkpoint_path or path + ".checkpoint"
+    lines_done, books_done = (0, 0) if restart else read_checkpoint(checkpoint_path, path)
+    if lines_done:
+        log(f"resuming after line {lines_done:,} ({books_done:,} books already loaded)")
+
+    authors = load_authors(authors_path, log=log) if authors_path else {}
+    started = last_log = time.perf_counter()
+    totals = {'lines': 0, 'books': 0}
+
+    def finished(result):
+        nonlocal lines_done, books_done, last_log
+        lines, books = result
+        if not isinstance(books, int):
+            books = upsert_rows(books)
+        lines_done += lines
+        books_done += books
+        totals['lines'] += lines
+        totals['books'] += books
+        write_checkpoint(checkpoint_path, path, lines_done, books_done)
+        now = time.perf_counter()
+        if now - last_log >= log_every:
+            last_log = now
+            log(f"{lines_done:>12,} lines {books_done:>12,} books {totals['books'] / (now - started):>10,.0f} rows/s")
+
+    batches = read_batches(path, batch_size, skip=lines_done)
+    init_worker(database_url, authors)
+    if workers <= 1:
+        for batch in batches:
+            finished(load_batch(batch))
+    else:
+        work = parse_batch if _engine.dialect.name == "sqlite" else load_batch
+        with multiprocessing.Pool(workers, initializer=init_worker, initargs=(database_url, authors)) as pool:
+            waiting = deque()
+            for batch in batches:
+                waiting.append(pool.apply_async(work, (batch,)))
+                if len(waiting) >= workers * 2:
+                    finished(waiting.popleft().get())
+            while waiting:
+                finished(waiting.popleft().get())
+
+    write_checkpoint(checkpoint_path, path, lines_done, books_done, complete=True)
+    elapsed = time.perf_counter() - started
+    totals['rows_per_second'] = round(totals['books'] / max(elapsed, 1e-9))
+    log(f"{totals['lines']:,} lines, {totals['books']:,} books in {elapsed:.1f}s "
+        f"({totals['rows_per_second']:,} rows/s)")
+    return totals
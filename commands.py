@@ -0,0 +1,92 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  commands.py adds maintenance commands to the flask command line.
+#  Run them from the project folder, i.e.
+#      flask reconcile-ratings
+#      flask seed-data --users 20000 --books 200000
+#      flask import-dump ol_dump_works_latest.txt.gz
+#  and the "flask db" migration commands from Flask-Migrate.
+#
+#  References:
+#  --- Flask Command Line Interface Documentation Website
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+import sys
+import click
+from models import db, User, Book, BookRating, LenderRating
+import seeddata
+import catalog
+
+
+def reconcile_ratings():
+    """Rebuild rating count, sum and average on every book and user from the ratings tables.
+    Sends back (books updated, users updated)."""
+
+    books = Book.reconcile_ratings(BookRating.__table__, BookRating.book_rated)
+    users = User.reconcile_ratings(LenderRating.__table__, LenderRating.user_being_rated_id)
+    db.session.commit()
+    return books, users
+
+
+@click.command("reconcile-ratings")
+def reconcile_ratings_command():
+    """Rebuild the rating totals on books and users (backfill or fix drift)."""
+
+    books, users = reconcile_ratings()
+    click.echo(f"Rating totals rebuilt for {books} books and {users} users.")
+
+
+@click.command("seed-data")
+@click.option("--users", type=click.IntRange(min=2), default=1000, show_default=True)
+@click.option("--books", type=click.IntRange(min=1), default=10000, show_default=True)
+@click.option("--ratings-per-book", type=click.IntRange(min=0), default=3, show_default=True)
+@click.option("--seed", type=int, default=1, show_default=True, help="random seed, same seed same data")
+def seed_data_command(users, books, ratings_per_book, seed):
+    """Bulk add made up users, books, shelves, requests and ratings for load testing."""
+
+    db.create_all()
+    seeddata.generate(users, books, ratings_per_book=ratings_per_book, seed=seed, log=click.echo)
+    click.echo(f"Seeded users log in with password '{seeddata.SEED_PASSWORD}'.")
+
+
+@click.command("import-dump")
+@click.argument("dump", type=click.Path(exists=True, dir_okay=False))
+@click.option("--authors", type=click.Path(exists=True, dir_okay=False), help="authors dump, for author names")
+@click.option("--workers", type=click.IntRange(min=1), help="loader processes [default: CPUs, up to 4]")
+@click.option("--batch-size", type=click.IntRange(min=1), default=catalog.BATCH_SIZE, show_default=True)
+@click.option("--checkpoint", type=click.Path(dir_okay=False), help="default: <dump>.checkpoint")
+@click.option("--restart", is_flag=True, help="ignore the checkpoint and start from the first line")
+def import_dump_command(dump, authors, workers, batch_size, checkpoint, restart):
+    """Load the works in an Open Library dump file into the books table."""
+
+    db.create_all()
+    database_url = db.engine.url.render_as_string(hide_password=False)
+    if database_url.startswith("sqlite") and db.engine.url.database in (None, "", ":memory:"):
+        raise click.UsageError("An in-memory database can not be shared with worker processes.")
+    workers = workers or min(4, os.cpu_count() or 1)
+    catalog.import_dump(dump, database_url, workers=workers, batch_size=batch_size, authors_path=authors,
+                        checkpoint_path=checkpoint, restart=restart, log=click.echo)
+
+
+def init_migrations(app):
+    """Set up Flask-Migrate for the "flask db" commands. It brings in alembic, about 150ms of
+    imports a web worker never uses, so it is only set up when something already imported it:
+    the flask command line loads it (with its commands) before it makes the app, and seed.py
+    imports it first too."""
+
+    if "flask_migrate" in sys.modules:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+
+
+def register_commands(app):
+    """Add the commands above to app.cli"""
+    app.cli.add_command(reconcile_ratings_command)
+    app.cli.add_command(seed_data_command)
+    app.cli.add_command(import_dump_command)
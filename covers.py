@@ -0,0 +1,326 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  covers.py serves book covers from our own server instead of pointing
+#  every page at covers.openlibrary.org.
+#  - /covers/<olid or cover id>-<S|M|L>.jpg fetches the cover from Open
+#    Library the first time and keeps it on local disk. Files are named by
+#    the SHA-256 of their bytes, so the same image is only kept once, and
+#    that hash is the strong ETag
+#  - the folder is capped at COVER_CACHE_MB, least recently served covers
+#    are deleted first (serving a cover touches its file)
+#  - covers are sent with send_file from a path, so gunicorn can hand the
+#    file straight to the socket (sendfile) instead of copying it
+#  - books without a cover, and covers Open Library does not have, get a
+#    plain placeholder PNG the right size, made here instead of the 480px
+#    No_image_available image
+#
+#  Settings: COVER_CACHE_DIR, COVER_CACHE_MB (512), COVERS_URL
+#
+#  References:
+#  --- Open Library Covers API Documentation Website
+#  --- PNG Specification (W3C)
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import hashlib
+import logging
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from flask import abort, current_app, send_file
+from cache import TTLCache, MISSING
+from models import Book
+from olclient import get_client, OpenLibraryError
+
+log = logging.getLogger(__name__)
+
+COVERS_URL = "https://covers.openlibrary.org"
+#placeholder (width, height) for each Open Library cover size
+SIZES = {'S': (40, 60), 'M': (180, 270), 'L': (360, 540)}
+#an edition or work olid (OL123M) or a numeric cover id
+COVER_NAME = re.compile(r"^(OL\d+[A-Z]|\d+)$")
+OL_COVER_URL = re.compile(r"^https?://covers\.openlibrary\.org/b/(olid|id)/([A-Za-z0-9]+)-[SML]\.jpg$")
+NO_IMAGE_URL = Book.cover_img_url_m.default.arg
+
+#covers do not change once Open Library has them
+COVER_MAX_AGE = 30 * 24 * 3600
+PLACEHOLDER_MAX_AGE = 3600
+#how long a cover Open Library does not have is remembered before asking again
+MISSING_TTL = 24 * 3600
+#after going over the cap, evict down to this share of it
+EVICT_TO = 0.9
+LOCK_STRIPES = 64
+
+
+#--------------------------------------------------------------------------#
+#                           Placeholders
+#--------------------------------------------------------------------------#
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def placeholder_png(width, height, fill=(233, 236, 239), edge=(173, 181, 189)):
+    """A plain grey cover with a darker border as PNG bytes, no imaging library needed"""
+
+    border = max(1, width // 40)
+    edge, fill = bytes(edge), bytes(fill)
+    #each PNG row starts with its filter type, 0 is none
+    edge_row = b"\x00" + edge * width
+    inner_row = b"\x00" + edge * border + fill * (width - 2 * border) + edge * border
+    pixels = edge_row * border + inner_row * (height - 2 * border) + edge_row * border
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + png_chunk(b"IDAT", zlib.compress(pixels, 9))
+            + png_chunk(b"IEND", b""))
+
+
+#--------------------------------------------------------------------------#
+#                           Cover Cache Class - covers on local disk
+#--------------------------------------------------------------------------#
+
+class CoverCache:
+    """ CoverCache
+        - objects/ab/<sha256>.jpg holds each image once, named by its hash
+        - keys/<cover>-<size> holds the hash for that cover, or "missing"
+          when Open Library does not have it
+        - the folder is shared by every worker, files are written to a temp
+          name then renamed so a reader never sees half a file
+        - one fetch at a time per cover in each process
+    """
+
+    def __init__(self, directory, max_bytes, covers_url=COVERS_URL, client=None):
+        """Instatiate class variables on self"""
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.covers_url = covers_url.rstrip("/")
+        self.client = client
+        #cover-size -> hash, saves reading the key file on every request
+        self.index = TTLCache(maxsize=10000, ttl=3600)
+        self.locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        #guards size and counts, request threads share one cache
+        self.lock = threading.Lock()
+        self.size = None
+        self.placeholders = {}
+        self.counts = {'hits': 0, 'fetched': 0, 'missing': 0, 'errors': 0, 'evicted': 0}
+        for folder in ("objects", "keys", "placeholders"):
+            os.makedirs(os.path.join(directory, folder), exist_ok=True)
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<CoverCache directory={self.directory} max_bytes={self.max_bytes}>"
+
+    def object_path(self, digest):
+        return os.path.join(self.directory, "objects", digest[:2], digest + ".jpg")
+
+    def key_path(self, name):
+        return os.path.join(self.directory, "keys", name)
+
+    def write_file(self, path, data):
+        """Write to a temp file next to path then rename it into place"""
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+
+    def cover_url(self, cover, size):
+        """The Open Library url, numeric covers are cover ids and the rest are olids.
+        default=false makes a missing cover a 404 instead of a blank image."""
+        kind = "id" if cover.isdigit() else "olid"
+        return f"{self.covers_url}/b/{kind}/{cover}-{size}.jpg?default=false"
+
+    def lookup(self, name):
+        """Hash of the cached cover, "missing" if Open Library did not have it lately,
+        None if we have to ask"""
+
+        digest = self.index.get(name)
+        if digest is MISSING:
+            try:
+                with open(self.key_path(name)) as f:
+                    digest = f.read().strip()
+            except OSError:
+                return None
+            if digest == "missing":
+                if time.time() - os.path.getmtime(self.key_path(name)) > MISSING_TTL:
+                    return None
+                return digest
+        if digest == "missing":
+            return digest
+
+        #touching the file marks it recently used, and tells us it has not been evicted
+        try:
+            os.utime(self.object_path(digest))
+        except OSError:
+            self.index.delete(name)
+            return None
+        self.index.set(name, digest)
+        return digest
+
+    def get(self, cover, size):
+        """Path and hash of the cover, fetching it the first time. None when there is no
+        cover to send (Open Library does not have it, or could not be reached)."""
+
+        name = f"{cover}-{size}"
+        digest = self.lookup(name)
+        if digest is None:
+            with self.locks[zlib.crc32(name.encode()) % LOCK_STRIPES]:
+                #another thread may have fetched it while we waited
+                digest = self.lookup(name) or self.fetch(cover, size)
+        else:
+            self.count('hits')
+
+        if digest is None or digest == "missing":
+            return None
+        return self.object_path(digest), digest
+
+    def fetch(self, cover, size):
+        """Fetch the cover from Open Library and store it, sends back its hash"""
+
+        name = f"{cover}-{size}"
+        try:
+            data = (self.client or get_client()).get_bytes(self.cover_url(cover, size))
+        except OpenLibraryError:
+            #try again next time rather than remembering it as missing
+            log.warning("cover %s could not be fetched", name)
+            self.count('errors')
+            return None
+
+        if not data:
+            self.count('missing')
+            self.write_file(self.key_path(name), b"missing")
+            self.index.set(name, "missing", ttl=MISSING_TTL)
+            return "missing"
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if not os.path.exists(path):
+            self.write_file(path, data)
+            self.grow(len(data))
+        self.write_file(self.key_path(name), digest.encode())
+        self.index.set(name, digest)
+        self.count('fetched')
+        return digest
+
+    def objects(self):
+        """(mtime, size, path) of every cached image"""
+
+        found = []
+        for folder in os.scandir(os.path.join(self.directory, "objects")):
+            if folder.is_dir():
+                for entry in os.scandir(folder.path):
+                    if not entry.name.startswith("tmp"):
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, stat.st_size, entry.path))
+        return found
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def grow(self, added):
+        """Count a new image and evict the least recently used ones once over the cap.
+        The size is counted from disk the first time, other workers add to the same folder
+        so it is counted again whenever we evict."""
+
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.objects())
+            else:
+                self.size += added
+            if self.size <= self.max_bytes:
+                return
+
+            found = sorted(self.objects())
+            self.size = sum(size for _, size, _ in found)
+            for _, size, path in found:
+                if self.size <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self.size -= size
+                self.counts['evicted'] += 1
+
+    def placeholder(self, size):
+        """Path and hash of the placeholder for size, made the first time it is needed"""
+
+        found = self.placeholders.get(size)
+        if found is None:
+            data = placeholder_png(*SIZES[size])
+            digest = hashlib.sha256(data).hexdigest()
+            path = os.path.join(self.directory, "placeholders", f"{digest[:16]}-{size}.png")
+            if not os.path.exists(path):
+                self.write_file(path, data)
+            found = self.placeholders[size] = (path, digest)
+        return found
+
+    def send(self, cover, size):
+        """Response for /covers/<cover>-<size>.jpg, the placeholder when there is no cover"""
+
+        if not COVER_NAME.match(cover):
+            abort(404)
+        found = self.get(cover, size)
+        if found is None:
+            return self.send_placeholder(size)
+
+        path, digest = found
+        resp = send_file(path, mimetype="image/jpeg", etag=digest, max_age=COVER_MAX_AGE)
+        resp.cache_control.immutable = True
+        return resp
+
+    def send_placeholder(self, size):
+        path, digest = self.placeholder(size)
+        return send_file(path, mimetype="image/png", etag=digest, max_age=PLACEHOLDER_MAX_AGE)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, bytes=self.size, max_bytes=self.max_bytes)
+
+
+#--------------------------------------------------------------------------#
+#                           Templates
+#--------------------------------------------------------------------------#
+
+def cover_src(url, size="M"):
+    """Template filter: {{ book.cover_img_url_s|cover_src("S") }} points an Open Library cover
+    url at /covers, and a missing cover (or the No_image_available default) at the placeholder.
+    Any other image url is left alone."""
+
+    if not url or url == NO_IMAGE_URL:
+        return f"/covers/placeholder-{size}.png"
+    match = OL_COVER_URL.match(url)
+    if match is None:
+        return url
+    return f"/covers/{match.group(2)}-{size}.jpg"
+
+
+#--------------------------------------------------------------------------#
+#                           Setup
+#--------------------------------------------------------------------------#
+
+def init_covers(app):
+    """Give app the cover cache and the cover_src filter. COVER_CACHE_DIR sets where covers
+    are kept (default: a folder in the temp dir), COVER_CACHE_MB how much they may take up."""
+
+    directory = os.environ.get('COVER_CACHE_DIR',
+                               os.path.join(tempfile.gettempdir(), f"booklandia-covers-{os.getuid()}"))
+    max_bytes = int(float(os.environ.get('COVER_CACHE_MB', 512)) * 1024 * 1024)
+    app.extensions['covers'] = CoverCache(directory, max_bytes, os.environ.get('COVERS_URL', COVERS_URL))
+    app.add_template_filter(cover_src)
+
+
+def get_covers():
+    """The current app's cover cache"""
+    return current_app.extensions['covers']
@@ -0,0 +1,145 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  dbconfig.py sets up the database connection pool of each app process.
+#  Every gunicorn worker has its own pool, so the most connections open at
+#  once is workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW), keep that under the
+#  server's max_connections.
+#
+#  DB_POOL_MODE=queue (default) - a pool of kept-open connections
+#  --- DB_POOL_SIZE (5) connections kept, DB_MAX_OVERFLOW (10) more opened
+#      when busy, waiting up to DB_POOL_TIMEOUT (30s) for a free one
+#  --- DB_PRE_PING (1) checks a connection before handing it out, so a
+#      Postgres restart costs one reconnect instead of a failed request
+#  --- DB_POOL_RECYCLE (1800s) replaces connections older than that, and
+#      the most recently used connection is handed out first so the spare
+#      ones sit idle and get recycled
+#  --- DB_STATEMENT_TIMEOUT_MS (30000, 0 is off) is sent as a connection
+#      option, Postgres cancels statements that run longer
+#
+#  DB_POOL_MODE=pgbouncer - for PgBouncer in transaction pooling mode
+#  --- PgBouncer does the pooling, so each checkout opens a new
+#      connection to it (NullPool) and none are kept here
+#  --- PgBouncer does not pass connection options on, so the statement
+#      timeout is set with SET LOCAL at the start of each transaction
+#
+#  Only Postgres urls get these settings, SQLite keeps the defaults.
+#
+#  References:
+#  --- SQLAlchemy Connection Pooling Documentation Website
+#  --- PgBouncer Features Documentation Website
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+import time
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.pool import NullPool, QueuePool
+
+#setting -> (default, type)
+DEFAULTS = {
+    'DB_POOL_MODE': ("queue", str),
+    'DB_POOL_SIZE': (5, int),
+    'DB_MAX_OVERFLOW': (10, int),
+    'DB_POOL_TIMEOUT': (30, float),
+    'DB_POOL_RECYCLE': (1800, int),
+    'DB_PRE_PING': (True, lambda value: str(value) not in ("0", "false", "False", "")),
+    'DB_STATEMENT_TIMEOUT_MS': (30000, int),
+}
+POOL_MODES = ("queue", "pgbouncer")
+
+
+#--------------------------------------------------------------------------#
+#                           Settings to Engine Options
+#--------------------------------------------------------------------------#
+
+def db_settings(environ=None):
+    """The pool settings from environment variables, defaults for the ones not set"""
+
+    environ = os.environ if environ is None else environ
+    settings = {name: convert(environ.get(name, default)) for name, (default, convert) in DEFAULTS.items()}
+    if settings['DB_POOL_MODE'] not in POOL_MODES:
+        raise ValueError(f"DB_POOL_MODE must be one of {', '.join(POOL_MODES)}")
+    return settings
+
+
+def engine_options(url, settings=None):
+    """create_engine keyword arguments for url, i.e. create_engine(url, **engine_options(url)).
+    settings is a dict like db_settings() (an app's config works too)."""
+
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    settings = settings if settings is not None else db_settings()
+    setting = lambda name: settings.get(name, DEFAULTS[name][0])
+    timeout = setting('DB_STATEMENT_TIMEOUT_MS')
+
+    if setting('DB_POOL_MODE') == "pgbouncer":
+        options = {'poolclass': NullPool}
+        if timeout:
+            options['execution_options'] = {'statement_timeout_ms': timeout}
+        return options
+
+    options = {'poolclass': QueuePool,
+               'pool_size': setting('DB_POOL_SIZE'),
+               'max_overflow': setting('DB_MAX_OVERFLOW'),
+               'pool_timeout': setting('DB_POOL_TIMEOUT'),
+               'pool_recycle': setting('DB_POOL_RECYCLE'),
+               'pool_pre_ping': setting('DB_PRE_PING'),
+               'pool_use_lifo': True}
+    if timeout:
+        options['connect_args'] = {'options': f"-c statement_timeout={timeout}"}
+    return options
+
+
+@event.listens_for(Engine, "begin")
+def set_statement_timeout(conn):
+    """pgbouncer mode: the statement timeout for this transaction only, so it does
+    not stay on a server connection PgBouncer hands to someone else next"""
+
+    timeout = conn.get_execution_options().get('statement_timeout_ms')
+    if timeout:
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+class PooledSQLAlchemy(SQLAlchemy):
+    """ Flask-SQLAlchemy with the pool settings above. They are worked out when each engine
+        is made, from its url and the app's config, so an app (or a test) that points at
+        SQLite gets none of the Postgres ones """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        options.update(engine_options(sa_url, app.config))
+        return sa_url, options
+
+
+#--------------------------------------------------------------------------#
+#                           Health
+#--------------------------------------------------------------------------#
+
+def pool_stats(engine):
+    """Connections kept in the pool and handed out right now, for /healthz"""
+
+    pool = engine.pool
+    stats = {'class': pool.__class__.__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_in=pool.checkedin(), checked_out=pool.checkedout(),
+                     overflow=pool.overflow())
+    return stats
+
+
+def check_database(engine):
+    """Run SELECT 1 and time it. Sends back (ok, ms, error)"""
+
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except SQLAlchemyError as err:
+        return False, round((time.perf_counter() - start) * 1000, 2), err.__class__.__name__
+    return True, round((time.perf_counter() - start) * 1000, 2), None
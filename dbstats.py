@@ -0,0 +1,154 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  dbstats.py counts and times the SQL each request sends.
+#  SQLAlchemy engine events record every statement while a request runs.
+#  After the request we add a Server-Timing header (shows up in the
+#  browser dev tools) and write one log line with the totals. Statements
+#  slower than SLOW_QUERY_MS are logged with their EXPLAIN plan.
+#
+#  References:
+#  --- SQLAlchemy Core Events Documentation Website
+#  --- MDN Server-Timing Documentation Website
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import json
+import logging
+import time
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+log = logging.getLogger("booklandia.db")
+
+
+class RequestDbStats:
+    """ RequestDbStats - totals for one request
+        - count: number of statements
+        - total: seconds spent waiting on the database
+        - slowest / slowest_sql: the longest statement
+    """
+
+    def __init__(self):
+        """Instatiate class variables on self"""
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = None
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<RequestDbStats count={self.count} total_ms={self.total * 1000:.1f}>"
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.slowest:
+            self.slowest = duration
+            self.slowest_sql = statement
+
+
+def current_stats():
+    """Send back the stats for the request running on this thread, if any"""
+    if has_app_context():
+        return g.get("db_stats")
+    return None
+
+
+#--------------------------------------------------------------------------#
+#                           Engine Events
+#--------------------------------------------------------------------------#
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_start"].pop()
+    duration = time.perf_counter() - started
+
+    #statements we send ourselves to explain a slow query are not counted
+    if conn.info.get("explaining"):
+        return
+
+    stats = current_stats()
+    if stats is None:
+        return
+    stats.add(statement, duration)
+
+    slow_ms = current_app.config.get("SLOW_QUERY_MS")
+    if slow_ms is not None and duration * 1000 >= slow_ms:
+        log.warning("slow query %.1fms: %s\n%s", duration * 1000, statement,
+                    explain(conn, statement, parameters, executemany))
+
+
+def explain(conn, statement, parameters, executemany):
+    """Ask the database how it ran a statement. EXPLAIN does not run the statement again."""
+
+    if executemany or not statement.lstrip().upper().startswith(("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")):
+        return "(no plan)"
+
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    conn.info["explaining"] = True
+    try:
+        if conn.in_transaction():
+            #this is the request's own transaction, on Postgres a failed EXPLAIN would abort it
+            #and the request's next statement fail. The savepoint is rolled back instead.
+            with conn.begin_nested():
+                rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        else:
+            rows = conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+        return "\n".join(" ".join(str(col) for col in row) for row in rows)
+    except Exception as err:
+        return f"(no plan: {err})"
+    finally:
+        conn.info["explaining"] = False
+
+
+#--------------------------------------------------------------------------#
+#                           Flask Hooks
+#--------------------------------------------------------------------------#
+
+def start_request_stats():
+    g.db_stats = RequestDbStats()
+
+
+def finish_request_stats(response):
+    """Add the Server-Timing header and write the log line for this request"""
+
+    stats = g.pop("db_stats", None)
+    if stats is None:
+        return response
+
+    response.headers.add("Server-Timing",
+        f'db;dur={stats.total * 1000:.1f};desc="{stats.count} queries", '
+        f'db-slowest;dur={stats.slowest * 1000:.1f}')
+
+    log.info(json.dumps({
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'queries': stats.count,
+        'db_ms': round(stats.total * 1000, 1),
+        'slowest_ms': round(stats.slowest * 1000, 1),
+        'slowest_sql': (stats.slowest_sql or "")[:200],
+    }))
+    return response
+
+
+def init_db_stats(app):
+    """Turn on per request SQL stats for app. SLOW_QUERY_MS sets how slow (in ms) a
+    statement has to be before it is logged with its plan, None turns that off."""
+
+    app.config.setdefault("SLOW_QUERY_MS", 250)
+
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+
+    app.before_request(start_request_stats)
+    app.after_request(finish_request_stats)
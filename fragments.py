@@ -0,0 +1,105 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  fragments.py makes the book and user lists cheaper to render.
+#  - rating_icons: a template filter that turns a rating into its 5
+#    star/heart icons from a table built once, instead of an if/elif chain
+#    in every template
+#  - book_card: renders the parts of a book card that only depend on the
+#    book (cover, stars, title, description...) and keeps them keyed by
+#    (book_id, avg_rating, updated_at), so a changed book gets a new key
+#  - templates are compiled to bytecode on disk (JINJA_CACHE_DIR) so new
+#    workers load them instead of compiling them again
+#
+#  References:
+#  --- Jinja Bytecode Cache Documentation Website
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import math
+import os
+import tempfile
+from collections import namedtuple
+from flask import get_template_attribute
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from cache import TTLCache, MISSING
+
+fragment_cache = TTLCache(maxsize=int(os.environ.get('FRAGMENT_CACHE_SIZE', 4096)),
+                          ttl=int(os.environ.get('FRAGMENT_CACHE_TTL', 3600)))
+
+
+#--------------------------------------------------------------------------#
+#                           Rating Icons
+#--------------------------------------------------------------------------#
+
+def filled_icons(rating):
+    """How many of the 5 icons are filled in: no rating is 0, otherwise rounded
+    to the nearest whole icon (x.5 rounds down) and at least 1"""
+    if not rating:
+        return 0
+    return min(5, max(1, math.ceil(rating - 0.5)))
+
+
+#every widget there can be, i.e. RATING_ICONS['star'][3] is 3 filled stars then 2 empty ones
+RATING_ICONS = {
+    icon: [Markup("\n".join([f'<i class="fas fa-{icon}"></i>'] * filled + [f'<i class="far fa-{icon}"></i>'] * (5 - filled)))
+           for filled in range(6)]
+    for icon in ("star", "heart")
+}
+
+
+def rating_icons(rating, icon="star"):
+    """Template filter: {{ book.avg_rating|rating_icons }} or {{ user.avg_rating|rating_icons("heart") }}"""
+    return RATING_ICONS[icon][filled_icons(rating)]
+
+
+#--------------------------------------------------------------------------#
+#                           Book Card Fragments
+#--------------------------------------------------------------------------#
+
+def field(book, name):
+    #books are Book rows, or plain dicts when they come from a cache (see homefeed.py)
+    return book[name] if isinstance(book, dict) else getattr(book, name)
+
+
+BookCard = namedtuple("BookCard", ["cover", "heading", "about"])
+
+
+def book_card(book):
+    """The rendered macros from books/_card.html for book, cached until the book's rating
+    or details change. Templates use {% set card = book_card(s.book) %} then {{card.cover}}."""
+
+    key = (field(book, 'book_id'), field(book, 'avg_rating'), str(field(book, 'updated_at')))
+    card = fragment_cache.get(key)
+    if card is MISSING:
+        card = BookCard(*(Markup(get_template_attribute('books/_card.html', part)(book))
+                          for part in BookCard._fields))
+        fragment_cache.set(key, card)
+    return card
+
+
+#--------------------------------------------------------------------------#
+#                           Setup
+#--------------------------------------------------------------------------#
+
+def init_fragments(app):
+    """Add the filter and book card helper to app's templates and turn on the bytecode cache.
+    JINJA_CACHE_DIR sets where compiled templates are kept (default: a folder in the temp dir)."""
+
+    directory = os.environ.get('JINJA_CACHE_DIR',
+                               os.path.join(tempfile.gettempdir(), f"booklandia-jinja-{os.getuid()}"))
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+
+    app.add_template_filter(rating_icons)
+    app.add_template_global(book_card)
+
+
+def compile_templates(app):
+    """Load every template now, i.e. in the gunicorn master with --preload, so workers start with them compiled"""
+    for name in app.jinja_env.list_templates(extensions=["html"]):
+        app.jinja_env.get_template(name)
@@ -21,18 +21,236 @@
 #--------------------------------------------------------------------------#
 
 
-import requests
-from models import db, connect_db, Book
+import os
+import threading
+from datetime import datetime
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from models import db, Book, dialect_insert
+from olclient import get_client, OpenLibraryError
+from cache import TwoTierCache, MISSING
+from jobs import QueueFull, DONE
 
 
 #--------------------------------------------------------------------------#
 #                           Establish baseline API URLs
 #--------------------------------------------------------------------------#
 
-SEARCH_URL = "https://openlibrary.org/search.json?"
-INFO_URL = "https://openlibrary.org"
+#Search and Works URLs live with the client in olclient.py
 COVER_URL = "http://covers.openlibrary.org/b/olid/"
 
+#Detail lookups run at the same time, so we cap how many go out at once and 
+#how long we are willing to wait on all of them before using default values
+MAX_DETAIL_WORKERS = 10
+DETAILS_DEADLINE = 8
+
+#Searches show the first 10 books found
+MAX_RESULTS = 10
+
+
+#--------------------------------------------------------------------------#
+#                           Search and Work Detail Caches
+#--------------------------------------------------------------------------#
+
+#Popular titles get searched over and over, so searches are cached by the cleaned up 
+#title and author, and work details by book key.  Searches that find nothing are 
+#cached for a shorter time.  Times are in seconds.
+search_cache = TwoTierCache("ol-search",
+                ttl=int(os.environ.get('OPENLIBRARY_SEARCH_TTL', 86400)),
+                negative_ttl=int(os.environ.get('OPENLIBRARY_NEGATIVE_TTL', 600)),
+                local_size=int(os.environ.get('OPENLIBRARY_CACHE_LOCAL_SIZE', 256)),
+                max_rows=int(os.environ.get('OPENLIBRARY_CACHE_MAX_ROWS', 10000)))
+work_cache = TwoTierCache("ol-work",
+                ttl=int(os.environ.get('OPENLIBRARY_WORK_TTL', 604800)),
+                local_size=int(os.environ.get('OPENLIBRARY_CACHE_LOCAL_SIZE', 256)) * 4,
+                max_rows=int(os.environ.get('OPENLIBRARY_CACHE_MAX_ROWS', 10000)) * 4)
+
+#Only these work detail fields are used, so only these are cached
+WORK_FIELDS = ('subjects', 'description', 'cover_edition_key')
+
+
+def search_cache_key(title, author):
+    """Lower case and collapse spaces so "The  Hobbit" and "the hobbit" share an entry"""
+    return " ".join(str(title).lower().split()) + "|" + " ".join(str(author).lower().split())
+
+
+def cache_search(query_key, books, complete=True):
+    """Cache a search's books. A search with a book whose details are missing (the lookup
+    failed or ran past the deadline) is only kept for the negative ttl, so those details
+    are tried again soon instead of being served without them for a day."""
+    search_cache.set(query_key, books, ttl=None if complete else search_cache.negative_ttl)
+
+
+def cache_stats():
+    """Hit/miss numbers for the search and work detail caches"""
+    return {'search': search_cache.stats(), 'work': work_cache.stats()}
+
+
+#--------------------------------------------------------------------------#
+#                           Book Records - one per book found
+#--------------------------------------------------------------------------#
+
+#The only search doc fields we use, so the only ones we ask Open Library for
+DOC_FIELDS = ('key', 'title', 'author_name', 'edition_key', 'first_publish_year')
+
+
+def cover_urls(cover_id):
+    if not cover_id:
+        return None, None
+    return COVER_URL + cover_id + "-M.jpg", COVER_URL + cover_id + "-S.jpg"
+
+
+class BookRecord(NamedTuple):
+    """ BookRecord
+        - one book found in a search, built once from its search doc and work details
+        - field names match the JSON reply, so json() is just the fields
+        - row() is the same book cleaned up for the book table
+    """
+
+    key: str
+    title: str
+    author: list
+    description: str
+    subjects: list
+    cover_img_url_m: str
+    cover_img_url_s: str
+    first_publish_year: int
+
+    @classmethod
+    def from_doc(cls, doc, book_info=None):
+        """Build from a search doc and its work details. Without details (not looked up yet)
+        there is no description or subjects, and the cover comes from the first edition."""
+
+        #use either cover edition key if provided or use the edition
+        edition_key = (doc.get('edition_key') or [None])[0]
+        if book_info is None:
+            description, subjects, cover_id = None, [], edition_key
+        else:
+            #descriptions come as plain text or as {"type": "/type/text", "value": "..."}
+            description = book_info.get("description")
+            if isinstance(description, dict):
+                description = description.get("value")
+            subjects = book_info.get('subjects', "No Subjects")
+            cover_id = book_info.get('cover_edition_key', edition_key)
+
+        cover_m, cover_s = cover_urls(cover_id)
+        return cls(doc['key'], doc['title'], doc.get('author_name'), description, subjects,
+                   cover_m, cover_s, doc.get('first_publish_year'))
+
+    def json(self):
+        """The JSON reply for this book"""
+        return self._asdict()
+
+    def row(self):
+        """Clean up author and subject data for the book table"""
+
+        return dict(key=self.key,
+            title=self.title,
+            author=", ".join(self.author) if type(self.author) is list else "",
+            description=self.description,
+            subjects=", ".join(self.subjects) if type(self.subjects) is list else "",
+            cover_img_url_m=self.cover_img_url_m,
+            cover_img_url_s=self.cover_img_url_s,
+            published_year=self.first_publish_year)
+
+
+#--------------------------------------------------------------------------#
+#                           Background Enrichment
+#--------------------------------------------------------------------------#
+
+
+def enrichment_key(key):
+    """Job key for one work, so each work is only looked up and saved once at a time"""
+    return "enrich:" + key
+
+
+def enrich_book(doc, client=None):
+    """Background job (see jobs.py): get the work details for one search doc, cache them and
+    send back the book as the JSON reply has it. The search's SearchBatch saves the details."""
+
+    book_info = work_cache.get(doc['key'])
+    if book_info is MISSING:
+        release_connection()
+        book_info = Warehouse(doc['title'], "", client=client).fetch_book_info(doc['key'])
+        if book_info is None:
+            book_info = {}
+        else:
+            work_cache.set(doc['key'], book_info)
+
+    return BookRecord.from_doc(doc, book_info).json()
+
+
+class SearchBatch:
+    """ SearchBatch
+        - the enrichment jobs of one search made by search_and_enqueue
+        - once the last of them is over, every book of the search is saved with one
+          upsert and the search is cached (see cache_search)
+    """
+
+    def __init__(self, query_key, docs):
+        """Instatiate class variables on self"""
+        self.query_key = query_key
+        self.docs = docs
+        self.waiting = len(docs)
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<SearchBatch query={self.query_key} waiting={self.waiting}>"
+
+    def book_done(self, job=None):
+        """Called once for each doc, when its job is over or the queue turned it away"""
+
+        with self.lock:
+            self.waiting -= 1
+            last = self.waiting == 0
+        if last:
+            self.finish()
+
+    def finish(self):
+        """Save and cache the whole search, using the work details the jobs cached"""
+
+        keys = list(dict.fromkeys(doc['key'] for doc in self.docs))
+        details = work_cache.get_many(keys)
+        records = [BookRecord.from_doc(doc, details.get(doc['key'], {})) for doc in self.docs]
+        save_books(records)
+        cache_search(self.query_key, [record.json() for record in records], complete=len(details) == len(keys))
+
+
+def save_books(records):
+    """Add book records to the book table with one upsert. Books we already have are left
+    alone, except that a missing description or subjects (their lookup failed when the book
+    was first saved) are filled in, along with the cover those details name."""
+
+    #one row per key, ON CONFLICT can not touch the same row twice in one statement
+    rows = {record.key: record.row() for record in records}
+    if not rows:
+        return
+
+    books = Book.__table__
+    stmt = dialect_insert(books).values(list(rows.values()))
+    new = stmt.excluded
+    no_subjects = db.func.coalesce(books.c.subjects, "") == ""
+    gains_details = db.or_(db.and_(books.c.description.is_(None), new.description.isnot(None)),
+                           db.and_(no_subjects, new.subjects != ""))
+    #onupdate is not applied to ON CONFLICT, updated_at is set here so cached book cards refresh
+    stmt = stmt.on_conflict_do_update(index_elements=['key'],
+                set_={'description': db.func.coalesce(books.c.description, new.description),
+                      'subjects': db.case((no_subjects, new.subjects), else_=books.c.subjects),
+                      'cover_img_url_m': db.func.coalesce(new.cover_img_url_m, books.c.cover_img_url_m),
+                      'cover_img_url_s': db.func.coalesce(new.cover_img_url_s, books.c.cover_img_url_s),
+                      'updated_at': datetime.utcnow()},
+                where=gains_details)
+    db.session.execute(stmt)
+    db.session.commit()
+
+
+def release_connection():
+    """End the read transaction (cache lookups) before waiting on Open Library, so its
+    database connection goes back to the pool instead of sitting idle in a transaction
+    for seconds. Closing rolls back, anything left pending is never committed from here."""
+    db.session.close()
+
 
 #--------------------------------------------------------------------------#
 #                           Warehouse Class - stores search findings
@@ -46,126 +264,204 @@ class Warehouse:
         - serializes data for JSON reply 
     """
     
-    def __init__(self, title, author):
-        """Instatiate class variables on self """
+    def __init__(self, title, author, client=None):
+        """Instatiate class variables on self. The client defaults to this worker's shared 
+        Open Library client."""
         self.title = title
         self.author = author
+        self.client = client or get_client()
         self.book_search_url = ""
-        self.findings = {}
 
     def __repr__(self):
         """Creates string identifier in command prompt"""
         return f"<Warehouse title={self.title}, author={self.author}"
     
-    def add_to_db(self, num, keys):
-        """Add all books found to app library"""
-        
-        for book in range(num):
-            #Make sure book does not already exist in database
-            in_Book_Tbl = Book.query.filter_by(key=self.findings['docs'][book]['key']).one_or_none()
-            
-            if in_Book_Tbl is None:
-
-                #Clean up author data before adding to database
-                book_authors = self.findings['docs'][book]['author_name'];
-                all_authors = "";
-                count = 0;
-                if type(book_authors) is list:
-                    for auth in book_authors:
-                        if count != 0:
-                            all_authors = all_authors + ", " + auth
-                        else:
-                            all_authors = all_authors + auth
-                            count = 1;
-
-                #Clean up subject data before adding to database
-                book_subjects = self.findings['docs'][book]['subjects'];
-                all_subjects = "";
-                count = 0;
-                if type(book_subjects) is list:
-                    for subj in book_subjects:
-                        if count != 0:
-                            all_subjects = all_subjects + ", " + subj
-                        else:
-                            all_subjects = all_subjects + subj
-                            count = 1;
-                
-                #add book to book table
-                new_book = Book(key=self.findings['docs'][book]['key'], 
-                    title=self.findings['docs'][book]['title'],
-                    author=all_authors,
-                    description=self.findings['docs'][book]['description'],
-                    subjects=all_subjects,
-                    cover_img_url_m=self.findings['docs'][book]['cover_img_url_m'],
-                    cover_img_url_s=self.findings['docs'][book]['cover_img_url_s'],
-                    published_year=self.findings['docs'][book]['first_publish_year'])
-                db.session.add(new_book) 
-                db.session.commit()      
+    def add_to_db(self, records):
+        """Add all books found (BookRecords) to app library with one upsert in one transaction
+        (see save_books). Books we already have are not added again, and if another search
+        adds the same book at the same time, ON CONFLICT takes care of it instead of failing."""
 
-        
+        save_books(records)
+
+    def fetch_book_info(self, key):
+        """Get the extra information for one book key i.e. subject, description, and cover.
+        If Open Library is slow or sends back an error, we send back None so the book 
+        still shows up with the default values and nothing gets cached."""
+
+        try:
+            book_info = self.client.work(key)
+        except OpenLibraryError:
+            return None
+        return {field: book_info[field] for field in WORK_FIELDS if field in book_info}
+
+    def fetch_all_book_info(self, keys):
+        """Get the extra information for every key. Cached details are used first, the rest 
+        are fetched at the same time using a capped thread pool. Results come back in the 
+        same order as the keys.  Any lookup that failed or is not done by the deadline is
+        None so one slow work can not hold up the whole search."""
+
+        found = dict(self.iter_book_info(keys))
+        return [found[key] for key in keys]
+
+    def iter_book_info(self, keys):
+        """Generator behind fetch_all_book_info: yields (key, details) for each key, cached
+        ones first and the rest in the order their lookups finish.  Lookups still going at 
+        the deadline, and failed ones, are yielded as None.  What was fetched is cached once
+        all are done."""
+
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return
+
+        cached = work_cache.get_many(keys)
+        yield from cached.items()
+        missing = [key for key in keys if key not in cached]
+        if not missing:
+            return
+
+        release_connection()
+        fetched = {}
+        pool = ThreadPoolExecutor(max_workers=min(MAX_DETAIL_WORKERS, len(missing)))
+        lookups = {pool.submit(self.fetch_book_info, key): key for key in missing}
+        try:
+            for lookup in as_completed(lookups, timeout=DETAILS_DEADLINE):
+                key = lookups.pop(lookup)
+                if lookup.result() is not None:
+                    fetched[key] = lookup.result()
+                yield key, fetched.get(key)
+        except FuturesTimeout:
+            for key in lookups.values():
+                yield key, None
+        finally:
+            #do not wait on stragglers, their own request timeout will end them
+            pool.shutdown(wait=False)
+            work_cache.set_many(fetched)
+
+    def search_params(self):
+        """Search API parameters for the title and/or author, None if both are empty"""
 
-    def findBooksInWH(self):
-        """Find books by calling API"""
-        
-        books_found = {}
-        books_keys = []
-        
         if self.title != "" and self.author == "":
-            book_search_url = SEARCH_URL + "title="+ str(self.title)
+            return {'title': str(self.title)}
         elif self.title == "" and self.author != "":
-            book_search_url = SEARCH_URL + "author="+ str(self.author)
+            return {'author': str(self.author)}
         elif self.title != "" and self.author != "":
-            book_search_url = SEARCH_URL + "title="+ str(self.title) +"&author="+str(self.author)
-        else:
-            return books_found
+            return {'title': str(self.title), 'author': str(self.author)}
+        return None
 
-        #make API Call and save into dictionary
-        self.findings = requests.get(book_search_url).json()
-      
+    def search_docs(self, search_params):
+        """Make the search call for only the fields and number of books we use, and keep 
+        just those fields of each doc. The rest of the reply is dropped here."""
+
+        release_connection()
+        findings = self.client.search(**search_params, fields=",".join(DOC_FIELDS), limit=MAX_RESULTS)
         #count number of findings if more than 10 cap the findings
-        number_of_books = int(self.findings['numFound'])
-        if number_of_books > 10: 
-            number_of_books = 10;
+        number_of_books = min(int(findings['numFound']), MAX_RESULTS)
+        return [{field: doc.get(field) for field in DOC_FIELDS} for doc in findings['docs'][:number_of_books]]
+
+    def findBooksInWH(self):
+        """Find books by calling API"""
+        
+        search_params = self.search_params()
+        if search_params is None:
+            return {}
+
+        #a search we have seen recently is answered from the cache
+        query_key = search_cache_key(self.title, self.author)
+        cached_books = search_cache.get(query_key)
+        if cached_books is not MISSING:
+            return {doc: book for doc, book in enumerate(cached_books)}
+
+        #make API Call
+        docs = self.search_docs(search_params)
 
         #for each book, we need to get additional information i.e. subject, description, and image url
-        for doc in range(number_of_books):
+        #missing details fall back to the default values
+        all_book_info = self.fetch_all_book_info([doc['key'] for doc in docs])
+        records = [BookRecord.from_doc(doc, book_info or {}) for doc, book_info in zip(docs, all_book_info)]
+
+        self.add_to_db(records)
+        books_found = [record.json() for record in records]
+        cache_search(query_key, books_found, complete=None not in all_book_info)
+
+        return dict(enumerate(books_found))
+
+    def stream_books(self):
+        """Generator version of findBooksInWH for the streaming endpoint. Yields (index, book)
+        for each book as soon as its work details come back, index being its place in the 
+        search results, so the first book shows up one search and one detail call after we 
+        start instead of after the slowest one.  Once the last book is sent, they are all
+        saved with one upsert and the whole search is cached, like findBooksInWH."""
+
+        search_params = self.search_params()
+        if search_params is None:
+            return
 
-            key = self.findings["docs"][doc]["key"]
-            book_info_url = INFO_URL + key + ".json"
-            book_info = requests.get(book_info_url).json()
-            #save subject and description to findings
-            self.findings['docs'][doc]['subjects'] = book_info.get('subjects', "No Subjects")
+        query_key = search_cache_key(self.title, self.author)
+        cached_books = search_cache.get(query_key)
+        if cached_books is not MISSING:
+            yield from enumerate(cached_books)
+            return
+
+        docs = self.search_docs(search_params)
+
+        #the same work can turn up twice in one search
+        places = {}
+        for index, doc in enumerate(docs):
+            places.setdefault(doc['key'], []).append(index)
+
+        books = {}
+        records = []
+        complete = True
+        for key, book_info in self.iter_book_info(places):
+            complete = complete and book_info is not None
+            for index in places[key]:
+                record = BookRecord.from_doc(docs[index], book_info or {})
+                records.append(record)
+                books[index] = record.json()
+                yield index, books[index]
+
+        save_books(records)
+        cache_search(query_key, [books[index] for index in range(len(docs))], complete)
+
+    def search_and_enqueue(self, jobs):
+        """Make only the search call, and leave work details to background jobs on the jobs
+        queue (see enrich_book). Sends back the books in search order, each with the 'status'
+        of its job. Books that are done have every field, the rest only what the search sent
+        back. A book the full queue turned away is "busy".  The books are saved right away
+        so they can be added to a shelf, and their details are saved and the search cached
+        once every job is over (see SearchBatch)."""
+
+        search_params = self.search_params()
+        if search_params is None:
+            return []
+
+        #a search that was fully looked up before is already done
+        query_key = search_cache_key(self.title, self.author)
+        cached_books = search_cache.get(query_key)
+        if cached_books is not MISSING:
+            return [dict(book, status=DONE) for book in cached_books]
+
+        docs = self.search_docs(search_params)
+        if not docs:
+            cache_search(query_key, [])
+            return []
+
+        save_books([BookRecord.from_doc(doc) for doc in docs])
+        batch = SearchBatch(query_key, docs)
+        books = []
+        for doc in docs:
             try:
-                book_info.get("description")
-                try: 
-                    book_info["description"].get("value")
-                    self.findings['docs'][doc]['description'] = book_info["description"].get("value")
-                except:
-                    self.findings['docs'][doc]['description'] = book_info.get("description")
-            except:  
-                self.findings['docs'][doc]['description'] = "No Description"
-            #using the self.findings information use either cover edition key if provided or use the edition
-            edition_key = self.findings['docs'][doc]['edition_key'][0]
-            cover_id = book_info.get('cover_edition_key', edition_key)
-            self.findings['docs'][doc]['cover_img_url_m'] = COVER_URL + cover_id + "-M.jpg"
-            self.findings['docs'][doc]['cover_img_url_s'] = COVER_URL + cover_id + "-S.jpg"
-
-            #serialize findings
-            book = {
-                'key' : self.findings['docs'][doc]['key'],
-                'title' : self.findings['docs'][doc]['title'],
-                'author' : self.findings['docs'][doc]['author_name'],
-                'description' : self.findings['docs'][doc]['description'],
-                'subjects' : self.findings['docs'][doc]['subjects'],
-                'cover_img_url_m' : self.findings['docs'][doc]['cover_img_url_m'],
-                'cover_img_url_s' : self.findings['docs'][doc]['cover_img_url_s'],
-                'first_publish_year' : self.findings['docs'][doc]['first_publish_year']
-            }
-            
-            #append dictionary
-            books_found[doc] = book
-            books_keys.append(key)
-
-        self.add_to_db(number_of_books, books_keys)
-
-        return books_found
+                job = jobs.submit(enrichment_key(doc['key']), enrich_book, doc, self.client)
+            except QueueFull:
+                job = None
+
+            if job is None:
+                batch.book_done()
+            else:
+                job.add_done_callback(batch.book_done)
+
+            if job is not None and job.status == DONE:
+                books.append(dict(job.result, status=DONE))
+            else:
+                books.append(dict(BookRecord.from_doc(doc).json(), status=job.status if job else "busy"))
+        return books
@@ -0,0 +1,86 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  gunicorn.conf.py runs the app with threaded (gthread) workers:
+#      gunicorn -c gunicorn.conf.py "app:create_app()"
+#
+#  A search waits seconds on Open Library. A sync worker does nothing else
+#  while it waits, so a few searches at once left no worker for the other
+#  pages. A gthread worker answers up to GUNICORN_THREADS requests at once,
+#  a thread waiting on Open Library or Postgres only holds itself.
+#
+#  Settings:
+#  --- WEB_CONCURRENCY     worker processes (CPU count + 1)
+#  --- GUNICORN_THREADS    threads per worker (32)
+#  --- GUNICORN_TIMEOUT    seconds a worker may go silent before it is
+#                          restarted (60)
+#  --- GUNICORN_PRELOAD    load the app once before forking (1), workers
+#                          share the compiled templates and start faster
+#  --- PORT                (8000)
+#
+#  Why threads and not gevent: psycopg2 blocks the whole process under
+#  gevent unless it is patched (psycogreen), threads need nothing new and
+#  everything shared between requests is already thread safe:
+#  --- database sessions are per thread (Flask-SQLAlchemy scoped session),
+#      searches give their connection back while they wait on Open Library
+#      (func.release_connection)
+#  --- each process builds its own Open Library client, job threads and
+#      database connections after the fork (olclient.get_client, jobs.py,
+#      pre_fork below)
+#  --- caches, the job queue and the cover cache lock their shared state
+#
+#  Connections per worker: DB_POOL_SIZE defaults to the thread count here
+#  (job threads use the overflow). Postgres needs room for
+#  WEB_CONCURRENCY x (DB_POOL_SIZE + DB_MAX_OVERFLOW), see dbconfig.py.
+#
+#  References:
+#  --- Gunicorn Settings and Design Documentation Website
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import multiprocessing
+import os
+
+
+#--------------------------------------------------------------------------#
+#                           Workers
+#--------------------------------------------------------------------------#
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+worker_class = "gthread"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+#the worker heartbeat file, on tmpfs a slow disk can't make a busy worker look dead
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"
+
+#set before the app is loaded so dbconfig.py and olclient.py pick them up
+os.environ.setdefault('DB_POOL_SIZE', str(threads))
+os.environ.setdefault('OPENLIBRARY_POOL_SIZE', str(threads))
+
+accesslog = "-"
+
+
+#--------------------------------------------------------------------------#
+#                           Hooks
+#--------------------------------------------------------------------------#
+
+def pre_fork(server, worker):
+    """With preload the app lives in this process too. A connection it opened would be
+    shared by every forked worker, so close them all before each fork."""
+
+    if not server.cfg.preload_app:
+        return
+    from models import db
+    #the app gunicorn loaded
+    app = server.app.wsgi()
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,73 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  homefeed.py keeps the homepage "latest additions" ready to show.
+#  The 10 newest books on a shelf are the same for everyone, so they are
+#  worked out once and saved in the cache (see cache.py) as plain dicts.
+#  Routes that add, move or remove a book on a shelf rebuild the feed
+#  right after they commit, so the homepage doesn't have to.
+#
+#  HOME_FEED_TTL (seconds, default 3600) is a safety net in case a change
+#  is missed. Other app workers pick up a rebuilt feed within
+#  HOME_FEED_LOCAL_TTL seconds (default 5), their in-process copy.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+from sqlalchemy.orm import joinedload
+from cache import TwoTierCache, MISSING
+from models import Status
+
+FEED_SIZE = 10
+FEED_KEY = "latest"
+BOOK_FIELDS = ('book_id', 'title', 'author', 'description', 'subjects',
+               'cover_img_url_m', 'published_year', 'avg_rating', 'updated_at')
+
+feed_cache = TwoTierCache("home-feed",
+                          ttl=int(os.environ.get('HOME_FEED_TTL', 3600)),
+                          negative_ttl=int(os.environ.get('HOME_FEED_TTL', 3600)),
+                          local_size=4,
+                          local_ttl=int(os.environ.get('HOME_FEED_LOCAL_TTL', 5)))
+
+
+def build_latest_books():
+    """Query the newest books on a shelf and send back what home.html shows for each"""
+
+    statuses = (Status.query
+                .options(joinedload(Status.book))
+                .filter_by(location="On Shelf")
+                .order_by(Status.timestamp.desc())
+                .limit(FEED_SIZE))
+
+    return [{'book_id': s.book_id, 'user_id': s.user_id, 'location': s.location, 'condition': s.condition,
+             'book': {field: str(getattr(s.book, field)) if field == 'updated_at' else getattr(s.book, field)
+                      for field in BOOK_FIELDS}}
+            for s in statuses]
+
+
+def latest_books():
+    """Send back the feed, from the cache unless it has expired"""
+
+    feed = feed_cache.get(FEED_KEY)
+    if feed is MISSING:
+        feed = refresh_latest_books()
+    return feed
+
+
+def refresh_latest_books():
+    """Rebuild the feed and save it. Call after committing a change to a shelf."""
+
+    feed = build_latest_books()
+    feed_cache.set(FEED_KEY, feed)
+    return feed
+
+
+def book_rating_changed(book_id):
+    """Rebuild the feed if the book is showing on it, so its stars stay current"""
+
+    feed = feed_cache.get(FEED_KEY)
+    if feed is not MISSING and any(entry['book_id'] == book_id for entry in feed):
+        refresh_latest_books()
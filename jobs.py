@@ -0,0 +1,318 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  jobs.py runs slow work (Open Library detail lookups and saving books)
+#  in the background so requests can answer right away.
+#  - every job has a key, submitting a key that is already waiting,
+#    running or recently done sends back that job instead of a new one
+#  - the queue is bounded, a full queue raises QueueFull
+#  - stats() reports queue depth, counts and job latency
+#
+#  Backends (JOB_BACKEND):
+#  --- thread  worker threads in each app process (default)
+#  --- inline  runs the job during submit, for tests and debugging
+#  Another backend only needs to subclass JobQueue and add itself to BACKENDS.
+#
+#  Settings: JOB_WORKERS (4), JOB_QUEUE_SIZE (200), JOB_RESULT_TTL (600s)
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from flask import current_app, has_app_context
+from cache import TTLCache, MISSING
+
+log = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+#how many recent jobs the latency numbers are worked out from
+LATENCY_SAMPLES = 500
+
+
+class QueueFull(Exception):
+    """Raised by submit when the queue already holds maxsize jobs"""
+
+
+#--------------------------------------------------------------------------#
+#                           Job Class - one piece of background work
+#--------------------------------------------------------------------------#
+
+class Job:
+    """ Job
+        - func(*args) is run once, its return value is kept as result
+        - status goes pending -> running -> done (or failed, with the error)
+        - times are kept to report how long it waited and ran
+        - callbacks added with add_done_callback are called once it is over
+    """
+
+    def __init__(self, key, func, args):
+        """Instatiate class variables on self"""
+        self.key = key
+        self.func = func
+        self.args = args
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<Job key={self.key} status={self.status}>"
+
+    def run(self):
+        """Run the job, catching any error so one bad job does not stop a worker"""
+
+        self.started_at = time.monotonic()
+        self.status = RUNNING
+        try:
+            self.result = self.func(*self.args)
+            self.status = DONE
+        except Exception as err:
+            log.exception("job %s failed", self.key)
+            self.error = str(err) or err.__class__.__name__
+            self.status = FAILED
+        with self.lock:
+            self.finished_at = time.monotonic()
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            self.call(callback)
+
+    def add_done_callback(self, callback):
+        """Call callback(job) once the job is done or failed, right away if it already is"""
+
+        with self.lock:
+            if self.finished_at is None:
+                self.callbacks.append(callback)
+                return
+        self.call(callback)
+
+    def call(self, callback):
+        """Run one callback, a failing one is logged and does not fail the job"""
+
+        try:
+            callback(self)
+        except Exception:
+            log.exception("job %s callback failed", self.key)
+
+    def wait_ms(self):
+        return (self.started_at - self.enqueued_at) * 1000
+
+    def run_ms(self):
+        return (self.finished_at - self.started_at) * 1000
+
+    def to_dict(self):
+        """What the polling endpoint sends back for this job"""
+        return {'key': self.key, 'status': self.status, 'result': self.result, 'error': self.error}
+
+
+#--------------------------------------------------------------------------#
+#                           JobQueue - backends build on this
+#--------------------------------------------------------------------------#
+
+def percentile(values, pct):
+    """Nearest rank percentile of values, None if there are none"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(round(pct / 100 * len(values) + 0.5)) - 1, 0)
+    return round(values[min(rank, len(values) - 1)], 2)
+
+
+class JobQueue:
+    """ JobQueue
+        - keeps waiting and running jobs by key, and finished ones for result_ttl seconds
+        - a failed job can be submitted again, anything else is shared
+        - backends override dispatch() to decide where jobs run
+    """
+
+    backend = None
+
+    def __init__(self, app, maxsize=200, result_ttl=600, result_size=2000):
+        """Instatiate class variables on self"""
+        self.app = app
+        self.maxsize = maxsize
+        self.active = {}
+        self.finished = TTLCache(maxsize=result_size, ttl=result_ttl)
+        self.lock = threading.Lock()
+        self.counts = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'completed': 0, 'failed': 0}
+        self.wait_times = deque(maxlen=LATENCY_SAMPLES)
+        self.run_times = deque(maxlen=LATENCY_SAMPLES)
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<{self.__class__.__name__} active={len(self.active)} maxsize={self.maxsize}>"
+
+    def submit(self, key, func, *args):
+        """Queue func(*args) under key and send back its Job. If key is already queued,
+        running or done, that job comes back instead and func is not run again."""
+
+        with self.lock:
+            job = self.active.get(key)
+            if job is None:
+                job = self.finished.get(key)
+                if job is MISSING or job.status == FAILED:
+                    job = None
+            if job is not None:
+                self.counts['deduplicated'] += 1
+                return job
+
+            if len(self.active) >= self.maxsize:
+                self.counts['rejected'] += 1
+                raise QueueFull(f"{len(self.active)} jobs already queued")
+            job = Job(key, func, args)
+            self.active[key] = job
+            self.counts['submitted'] += 1
+
+        self.dispatch(job)
+        return job
+
+    def get(self, key):
+        """Send back the job for key, or None if there isn't one (or it has expired)"""
+
+        with self.lock:
+            job = self.active.get(key)
+            if job is None:
+                job = self.finished.get(key)
+        return None if job is MISSING else job
+
+    def dispatch(self, job):
+        raise NotImplementedError
+
+    def run_job(self, job):
+        """Run job inside an app context and move it over to finished"""
+
+        if has_app_context():
+            job.run()
+        else:
+            with self.app.app_context():
+                job.run()
+
+        with self.lock:
+            self.active.pop(job.key, None)
+            self.finished.set(job.key, job)
+            self.counts['completed' if job.status == DONE else 'failed'] += 1
+            self.wait_times.append(job.wait_ms())
+            self.run_times.append(job.run_ms())
+
+    def stats(self):
+        """Queue depth, counts and latency (ms) of recent jobs"""
+
+        with self.lock:
+            running = sum(1 for job in self.active.values() if job.status == RUNNING)
+            waits, runs = list(self.wait_times), list(self.run_times)
+            stats = dict(self.counts, backend=self.backend, maxsize=self.maxsize,
+                         depth=len(self.active) - running, running=running)
+        stats['wait_ms'] = {'p50': percentile(waits, 50), 'p95': percentile(waits, 95)}
+        stats['run_ms'] = {'p50': percentile(runs, 50), 'p95': percentile(runs, 95)}
+        return stats
+
+
+#--------------------------------------------------------------------------#
+#                           Backends
+#--------------------------------------------------------------------------#
+
+class InlineQueue(JobQueue):
+    """ InlineQueue - runs each job as soon as it is submitted """
+
+    backend = "inline"
+
+    def dispatch(self, job):
+        self.run_job(job)
+
+
+class ThreadQueue(JobQueue):
+    """ ThreadQueue
+        - worker threads take jobs off a bounded queue.Queue
+        - threads are started on first use in each process, so a gunicorn
+          worker forked from a preloaded app starts its own
+    """
+
+    backend = "thread"
+
+    def __init__(self, app, workers=4, **kwargs):
+        """Instatiate class variables on self"""
+        super().__init__(app, **kwargs)
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=self.maxsize)
+        self.threads = []
+        self.pid = None
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid != os.getpid():
+                self.threads = [threading.Thread(target=self.work, name=f"job-worker-{num}", daemon=True)
+                                for num in range(self.workers)]
+                for thread in self.threads:
+                    thread.start()
+                self.pid = os.getpid()
+
+    def dispatch(self, job):
+        self.start()
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self.lock:
+                self.active.pop(job.key, None)
+                self.counts['rejected'] += 1
+            raise QueueFull(f"{self.maxsize} jobs already queued")
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    def shutdown(self):
+        """Stop the workers once the jobs already queued are done"""
+
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        self.pid = None
+
+    def stats(self):
+        return dict(super().stats(), workers=self.workers)
+
+
+BACKENDS = {'thread': ThreadQueue, 'inline': InlineQueue}
+
+
+#--------------------------------------------------------------------------#
+#                           Setup
+#--------------------------------------------------------------------------#
+
+def init_jobs(app):
+    """Give app the job queue picked by JOB_BACKEND, see get_queue()"""
+
+    backend = os.environ.get('JOB_BACKEND', 'thread')
+    options = {'maxsize': int(os.environ.get('JOB_QUEUE_SIZE', 200)),
+               'result_ttl': int(os.environ.get('JOB_RESULT_TTL', 600))}
+    if backend == 'thread':
+        options['workers'] = int(os.environ.get('JOB_WORKERS', 4))
+    app.extensions['jobs'] = BACKENDS[backend](app, **options)
+
+
+def get_queue():
+    """The current app's job queue"""
+    return current_app.extensions['jobs']
@@ -0,0 +1,32 @@
+"""book updated at
+
+Revision ID: 33346bda318d
+Revises: afa3a8b417a8
+Create Date: 2026-10-18 11:05:52.390617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '33346bda318d'
+down_revision = 'afa3a8b417a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # cached book cards are keyed by updated_at (see fragments.py). Added empty and filled
+    # in first, SQLite can't add a column with a CURRENT_TIMESTAMP default in place.
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE books SET updated_at = CURRENT_TIMESTAMP")
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False,
+                              server_default=sa.func.now())
+
+
+def downgrade():
+    with op.batch_alter_table('books', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
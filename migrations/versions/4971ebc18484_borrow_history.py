@@ -0,0 +1,62 @@
+"""borrow history
+
+Revision ID: 4971ebc18484
+Revises: 33346bda318d
+Create Date: 2026-10-18 15:12:40.118245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4971ebc18484'
+down_revision = '33346bda318d'
+branch_labels = None
+depends_on = None
+
+
+OPEN_BORROW = sa.text("state IN ('requested', 'checked_out')")
+
+
+def upgrade():
+    # one row per borrow of a copy with the time of each step, see borrow.py
+    op.create_table('borrow_history',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('book_id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('borrower_id', sa.Integer(), nullable=False),
+    sa.Column('state', sa.String(length=20), nullable=False),
+    sa.Column('requested_at', sa.DateTime(), nullable=False),
+    sa.Column('checked_out_at', sa.DateTime(), nullable=True),
+    sa.Column('rejected_at', sa.DateTime(), nullable=True),
+    sa.Column('returned_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['book_id'], ['books.book_id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['borrower_id'], ['users.user_id'], ondelete='cascade'),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.user_id'], ondelete='cascade'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_borrow_history_open_copy', 'borrow_history', ['book_id', 'owner_id'], unique=True,
+                    postgresql_where=OPEN_BORROW, sqlite_where=OPEN_BORROW)
+    op.create_index('ix_borrow_history_open_borrower', 'borrow_history', ['borrower_id'], unique=False,
+                    postgresql_where=OPEN_BORROW, sqlite_where=OPEN_BORROW)
+
+    # copies requested or checked out now get an open borrow from their latest borrowers
+    # row. When they were requested wasn't kept, so the history starts now.
+    op.execute("""
+        INSERT INTO borrow_history (book_id, owner_id, borrower_id, state, requested_at, checked_out_at)
+        SELECT s.book_id, s.user_id, b.borrower_id,
+               CASE WHEN s.location = 'Checked Out' THEN 'checked_out' ELSE 'requested' END,
+               CURRENT_TIMESTAMP,
+               CASE WHEN s.location = 'Checked Out' THEN CURRENT_TIMESTAMP END
+        FROM statuses s
+        JOIN borrowers b ON b.id = (SELECT MAX(id) FROM borrowers
+                                    WHERE book_id = s.book_id AND status_owner_id = s.user_id)
+        WHERE s.location IN ('Requested', 'Checked Out') AND b.borrower_id IS NOT NULL
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_borrow_history_open_borrower', table_name='borrow_history')
+    op.drop_index('ix_borrow_history_open_copy', table_name='borrow_history')
+    op.drop_table('borrow_history')
@@ -0,0 +1,26 @@
+"""user directory sort
+
+Revision ID: afa3a8b417a8
+Revises: 2e2b2262f663
+Create Date: 2026-10-18 10:31:15.804127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'afa3a8b417a8'
+down_revision = '2e2b2262f663'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /user/all?sort=rating pages through users by average rating, unrated users count as 0
+    op.create_index('ix_users_rating_sort', 'users',
+                    [sa.text('coalesce(avg_rating, 0) DESC'), sa.text('user_id DESC')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_rating_sort', table_name='users')
@@ -0,0 +1,47 @@
+"""rating totals
+
+Revision ID: c0adfb4043d8
+Revises: e7486939f2f9
+Create Date: 2026-10-18 09:12:40.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c0adfb4043d8'
+down_revision = 'e7486939f2f9'
+branch_labels = None
+depends_on = None
+
+
+BACKFILL = """
+    UPDATE {table} SET
+        rating_count = (SELECT count(*) FROM {ratings} WHERE {ratings}.{rated} = {table}.{pk}),
+        rating_sum = (SELECT coalesce(sum(rating), 0) FROM {ratings} WHERE {ratings}.{rated} = {table}.{pk})
+"""
+
+AVERAGE = """
+    UPDATE {table} SET avg_rating = round(CAST(CAST(rating_sum AS FLOAT) / nullif(rating_count, 0) AS NUMERIC), 1)
+"""
+
+
+def upgrade():
+    for table in ('books', 'users'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('rating_count', sa.Integer(), server_default='0', nullable=False))
+            batch_op.add_column(sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+
+    # fill the totals from the ratings already saved, same as "flask reconcile-ratings"
+    op.execute(BACKFILL.format(table='books', pk='book_id', ratings='books_ratings', rated='book_rated'))
+    op.execute(BACKFILL.format(table='users', pk='user_id', ratings='lender_ratings', rated='user_being_rated_id'))
+    op.execute(AVERAGE.format(table='books'))
+    op.execute(AVERAGE.format(table='users'))
+
+
+def downgrade():
+    for table in ('users', 'books'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('rating_sum')
+            batch_op.drop_column('rating_count')
@@ -0,0 +1,33 @@
+"""cache entries
+
+Revision ID: d29cd5f1f1d9
+Revises: 73d7868c2cde
+Create Date: 2026-10-18 07:44:24.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd29cd5f1f1d9'
+down_revision = '73d7868c2cde'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # durable tier of the Open Library and home feed caches, see cache.py
+    op.create_table('cache_entries',
+    sa.Column('key', sa.Text(), nullable=False),
+    sa.Column('value', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index(op.f('ix_cache_entries_expires_at'), 'cache_entries', ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_cache_entries_expires_at'), table_name='cache_entries')
+    op.drop_table('cache_entries')
@@ -0,0 +1,32 @@
+"""book search trigram
+
+Revision ID: e7486939f2f9
+Revises: f531903d7b39
+Create Date: 2026-10-18 07:44:27.167449
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7486939f2f9'
+down_revision = 'f531903d7b39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # trigram indexes keep ILIKE and typo tolerant searches on title/author index backed
+    # they are only used when SEARCH_TRIGRAM is turned on, see Book.matching
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE INDEX ix_books_title_trgm ON books USING GIN (title gin_trgm_ops)")
+    op.execute("CREATE INDEX ix_books_author_trgm ON books USING GIN (author gin_trgm_ops)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_books_author_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_books_title_trgm")
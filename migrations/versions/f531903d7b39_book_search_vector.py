@@ -0,0 +1,40 @@
+"""book search vector
+
+Revision ID: f531903d7b39
+Revises: d29cd5f1f1d9
+Create Date: 2026-10-18 07:44:25.765483
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f531903d7b39'
+down_revision = 'd29cd5f1f1d9'
+branch_labels = None
+depends_on = None
+
+
+#Weighted title > author > description > subjects, kept up to date by Postgres
+SEARCH_VECTOR = """
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(author, '')), 'B') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'C') ||
+    setweight(to_tsvector('english', coalesce(subjects, '')), 'D')
+"""
+
+
+def upgrade():
+    # full text search is Postgres only, other databases search with ILIKE
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(f"ALTER TABLE books ADD COLUMN search_vector tsvector "
+               f"GENERATED ALWAYS AS ({SEARCH_VECTOR}) STORED")
+    op.execute("CREATE INDEX ix_books_search_vector ON books USING GIN (search_vector)")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute("DROP INDEX IF EXISTS ix_books_search_vector")
+    op.execute("ALTER TABLE books DROP COLUMN IF EXISTS search_vector")
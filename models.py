@@ -9,6 +9,9 @@
 #  BookRating Model - saves all ratings and reviews for many
 #               users to many books
 #  LenderRating Model - saves all ratings by lender and borrower
+#  RatingTotals - running rating count/sum/average kept on books and users
+#  CacheEntry Model - durable cache shared by all app workers
+#  BorrowHistory Model - one row per borrow of a copy, with its step times
 #
 #  References: 
 #  --- SQLAlchemy Documentation Website
@@ -23,11 +26,14 @@
 #                           Import Necessary Libraries 
 #--------------------------------------------------------------------------#
 
-from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from datetime import datetime
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects import postgresql, sqlite
+from dbconfig import PooledSQLAlchemy
 
-db = SQLAlchemy()
+#Connection pool settings come from the DB_* environment variables, see dbconfig.py
+db = PooledSQLAlchemy()
 bcrypt = Bcrypt()
 
 
@@ -40,6 +46,66 @@ def connect_db(app):
     db.app = app
     db.init_app(app)
 
+
+def dialect_insert(table):
+    """Insert statement that supports ON CONFLICT for the database in use.
+    Postgres in production and SQLite in tests both support it."""
+
+    if db.engine.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+
+def rating_average(total, count):
+    """SQL for total / count rounded to one decimal, NULL when there are no ratings"""
+
+    average = db.cast(total, db.Float) / db.func.nullif(count, 0)
+    return db.func.round(db.cast(average, db.Numeric), 1)
+
+
+class RatingTotals:
+    """ Running rating totals for books and lenders
+        - rating_count / rating_sum change in the same transaction as the rating itself
+        - avg_rating is worked out from the two totals, no re-averaging of every rating
+    """
+
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    @classmethod
+    def add_rating(cls, obj_id, rating, old_rating=None):
+        """Count a new rating, or swap old_rating for rating when a review is edited.
+        One UPDATE does the math in the database so two people rating at once can't
+        lose each other's rating. The caller commits along with the rating row."""
+
+        count = cls.rating_count if old_rating is not None else cls.rating_count + 1
+        total = cls.rating_sum + (int(rating) - int(old_rating or 0))
+        pk = cls.__mapper__.primary_key[0]
+
+        db.session.execute(db.update(cls)
+                           .where(pk == obj_id)
+                           .values(rating_count=count, rating_sum=total,
+                                   avg_rating=rating_average(total, count))
+                           .execution_options(synchronize_session=False))
+
+    @classmethod
+    def reconcile_ratings(cls, rating_table, rated_column):
+        """Rebuild the totals for every row from the ratings table in one UPDATE.
+        Sends back the number of rows updated."""
+
+        pk = cls.__mapper__.primary_key[0]
+        count = (db.select(db.func.count()).select_from(rating_table)
+                 .where(rated_column == pk).scalar_subquery())
+        total = (db.select(db.func.coalesce(db.func.sum(rating_table.c.rating), 0))
+                 .where(rated_column == pk).scalar_subquery())
+
+        result = db.session.execute(db.update(cls)
+                                    .values(rating_count=count, rating_sum=total,
+                                            avg_rating=rating_average(total, count))
+                                    .execution_options(synchronize_session=False))
+        return result.rowcount
+
+
 class LenderRating(db.Model):
     """ Connection between lender and borrower """
 
@@ -50,7 +116,10 @@ class LenderRating(db.Model):
     rating = db.Column(db.Integer)
     review = db.Column(db.Text)
 
-class User(db.Model):
+    #ratings given by one user (the primary key covers ratings of one user)
+    __table_args__ = (db.Index('ix_lender_ratings_user_rating_id', user_rating_id),)
+
+class User(RatingTotals, db.Model):
     """Table for user profiles. One to Many"""
 
     __tablename__ = 'users'
@@ -73,7 +142,7 @@ class User(db.Model):
     avg_rating = db.Column(db.Float)
 
     status = db.relationship('Status')
-    borrower = db.relationship('Borrower')
+    borrower = db.relationship('Borrower', foreign_keys='Borrower.borrower_id')
 
     lender = db.relationship(
         "User",
@@ -94,17 +163,6 @@ class User(db.Model):
         u = self
         return f"<USER user_id={u.user_id} username={u.username}>"
 
-    def calc_avg_rating(cls, avg):
-        """cleans up the average received and sends back cleaner version"""
-
-        temp = str(avg)
-        temp2 = temp.split("'")
-        temp = float(temp2[1])
-        user_ratings_avg = '{:,}'.format(round(temp,1))
-        average_rating = float(user_ratings_avg)
-        
-        return average_rating
-
     @classmethod
     def register(cls, username, password, email, first_name, last_name, 
                 address1, address2, town, state, zip, phone, profile, fav_book, fav_author):
@@ -136,7 +194,11 @@ class User(db.Model):
         return False
 
 
-class Book(db.Model):
+#user directory sorted by rating, highest first (see see_all_users in app.py)
+db.Index('ix_users_rating_sort', db.func.coalesce(User.avg_rating, 0).desc(), User.user_id.desc())
+
+
+class Book(RatingTotals, db.Model):
     """Table for all books and their details.  One to many """
 
     __tablename__ = 'books'
@@ -151,6 +213,9 @@ class Book(db.Model):
     cover_img_url_s = db.Column(db.Text, default="https://upload.wikimedia.org/wikipedia/commons/thumb/a/ac/No_image_available.svg/480px-No_image_available.svg.png")
     published_year = db.Column(db.Text)
     avg_rating = db.Column(db.Float)
+    #changes whenever the row does, cached book cards are keyed by it (see fragments.py)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow,
+                           server_default=db.func.now())
 
     user = db.relationship('User', secondary='statuses', backref='books')
     status = db.relationship('Status')
@@ -159,17 +224,50 @@ class Book(db.Model):
         """show info about book in cmd prompt"""
         b = self
         return f"<BOOK book_id={b.book_id} key={b.key}> title={b.title}> author={b.author}>"
-    
-    def calc_avg_rating(cls, avg):
-        """cleans up the average received and sends back cleaner version"""
-
-        temp = str(avg)
-        temp2 = temp.split("'")
-        temp = float(temp2[1])
-        book_ratings_avg = '{:,}'.format(round(temp,1))
-        average_rating = float(book_ratings_avg)
-        
-        return average_rating
+
+    @classmethod
+    def matching(cls, term, trigram=False):
+        """Sends back (filter, rank) for a search term.
+        Postgres matches the term against the weighted search_vector column with 
+        websearch_to_tsquery and ranks with ts_rank (as double precision). With trigram on, close spellings and 
+        substrings of the title/author match too, backed by the pg_trgm indexes.
+        Other databases (SQLite in tests) fall back to ILIKE with no rank."""
+
+        if db.engine.dialect.name != "postgresql":
+            like = "%{}%".format(term)
+            return (cls.title.ilike(like) | cls.author.ilike(like) | cls.description.ilike(like)), None
+
+        query = db.func.websearch_to_tsquery('english', term)
+        vector = db.literal_column("books.search_vector")
+        match = vector.op('@@')(query)
+        rank = db.func.ts_rank(vector, query)
+
+        if trigram:
+            like = "%{}%".format(term)
+            term_text = db.cast(term, db.Text)
+            match = (match | cls.title.ilike(like) | cls.author.ilike(like)
+                     | term_text.op('<%')(cls.title) | term_text.op('<%')(cls.author))
+            rank = rank + db.func.word_similarity(term_text, cls.title)
+
+        #ts_rank is a real, but a page cursor sends the rank back as a double. Compared as
+        #real the two are almost never equal, so rows of the same book would be repeated or
+        #skipped at a page boundary. Ranked as double precision they match exactly.
+        return match, db.cast(rank, db.Float)
+
+#Postgres full text search column on books, weighted title > author > description > subjects.
+#It is not a mapped column so SQLite can still create the table, see Book.matching. 
+#Migrations add the same column and indexes to existing databases.
+event.listen(Book.__table__, "after_create", DDL("""
+    ALTER TABLE books ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(subjects, '')), 'D')) STORED;
+    CREATE INDEX ix_books_search_vector ON books USING GIN (search_vector);
+    CREATE EXTENSION IF NOT EXISTS pg_trgm;
+    CREATE INDEX ix_books_title_trgm ON books USING GIN (title gin_trgm_ops);
+    CREATE INDEX ix_books_author_trgm ON books USING GIN (author gin_trgm_ops);
+""").execute_if(dialect="postgresql"))
 
 
 class Status(db.Model):
@@ -182,10 +280,24 @@ class Status(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey("users.user_id",ondelete="cascade"), primary_key=True)
     location = db.Column(db.String(50), nullable=False, default="On Shelf")
     condition = db.Column(db.String(50), nullable=False, default="Like New")
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow())
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        #homepage: books on the shelf, newest first
+        db.Index('ix_statuses_on_shelf_timestamp', timestamp.desc(),
+                 postgresql_where=db.text("location = 'On Shelf'"), sqlite_where=db.text("location = 'On Shelf'")),
+        #library and profile pages: one user's books, newest first
+        db.Index('ix_statuses_user_timestamp', user_id, timestamp.desc()),
+        #requests page: open requests for a user (book_id lookups use the primary key)
+        db.Index('ix_statuses_open_requests', user_id, book_id,
+                 postgresql_where=db.text("location IN ('Requested', 'Checked Out')"),
+                 sqlite_where=db.text("location IN ('Requested', 'Checked Out')")),
+    )
 
-    book = db.relationship('Book')
-    user = db.relationship('User')
+    #a status is almost always shown with its book, so join it in the same query.
+    #the owner is only shown on some pages, those routes ask for it with joinedload.
+    book = db.relationship('Book', lazy='joined')
+    user = db.relationship('User', lazy='select')
     
     
     def __repr__(self):
@@ -200,11 +312,19 @@ class Borrower(db.Model):
     __tablename__ = "borrowers"
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    book_id = db.Column(db.Integer)
-    status_owner_id = db.Column(db.Integer)
+    book_id = db.Column(db.Integer, db.ForeignKey("books.book_id",ondelete="cascade"))
+    status_owner_id = db.Column(db.Integer, db.ForeignKey("users.user_id",ondelete="cascade"))
     borrower_id = db.Column(db.Integer, db.ForeignKey("users.user_id",ondelete="cascade"))
 
-    user = db.relationship('User')
+    __table_args__ = (
+        #requests from others on the owner's books, and returning/approving one book
+        db.Index('ix_borrowers_owner_book', status_owner_id, book_id),
+        #the borrower's own requests, and "has borrowed from this owner" before a lender review
+        db.Index('ix_borrowers_borrower_owner', borrower_id, status_owner_id),
+    )
+
+    #the borrower is shown whenever a request is shown
+    user = db.relationship('User', lazy='joined', foreign_keys=[borrower_id])
 
     def __repr__(self):
         """show info about tag in cmd prompt"""
@@ -212,6 +332,41 @@ class Borrower(db.Model):
         return f"<BORROWER borrower_id={b.borrower_id} book_id={b.book_id} owner_id={b.status_owner_id}>"
 
 
+class BorrowHistory(db.Model):
+    """ One borrow of one copy (a book on an owner's shelf), from the request until it
+    is rejected or returned. The steps are made in borrow.py """
+
+    __tablename__ = "borrow_history"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    book_id = db.Column(db.Integer, db.ForeignKey("books.book_id",ondelete="cascade"), nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey("users.user_id",ondelete="cascade"), nullable=False)
+    borrower_id = db.Column(db.Integer, db.ForeignKey("users.user_id",ondelete="cascade"), nullable=False)
+    state = db.Column(db.String(20), nullable=False, default="requested")
+    requested_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    checked_out_at = db.Column(db.DateTime)
+    rejected_at = db.Column(db.DateTime)
+    returned_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        #one open borrow per copy, so two requests for the same copy can't both get in
+        db.Index('ix_borrow_history_open_copy', book_id, owner_id, unique=True,
+                 postgresql_where=db.text("state IN ('requested', 'checked_out')"),
+                 sqlite_where=db.text("state IN ('requested', 'checked_out')")),
+        #requests page: the borrower's open borrows
+        db.Index('ix_borrow_history_open_borrower', borrower_id,
+                 postgresql_where=db.text("state IN ('requested', 'checked_out')"),
+                 sqlite_where=db.text("state IN ('requested', 'checked_out')")),
+    )
+
+    borrower = db.relationship('User', lazy='select', foreign_keys=[borrower_id])
+
+    def __repr__(self):
+        """show info about tag in cmd prompt"""
+        h = self
+        return f"<BORROW_HISTORY book_id={h.book_id} owner_id={h.owner_id} borrower_id={h.borrower_id} state={h.state}>"
+
+
 class BookRating(db.Model):
     """ Joins together books and users for ratings and reviews. Many to Many """
 
@@ -222,8 +377,13 @@ class BookRating(db.Model):
     rating = db.Column(db.Integer)
     review = db.Column(db.Text)
 
-    book = db.relationship('Book')
-    user = db.relationship('User')
+    #reviews written by one user (the primary key covers reviews of one book)
+    __table_args__ = (db.Index('ix_books_ratings_user_rating', user_rating),)
+
+    #the book or user is usually already loaded on the page (and found in the session 
+    #without a query), routes that list ratings for someone else ask for joinedload.
+    book = db.relationship('Book', lazy='select')
+    user = db.relationship('User', lazy='select')
 
     def __repr__(self):
         """show info about tag in cmd prompt"""
@@ -231,4 +391,17 @@ class BookRating(db.Model):
         return f"<BOOKRATING book={b.book_rated} user={b.user_rating}>"
 
 
+class CacheEntry(db.Model):
+    """ Durable cache entries i.e. Open Library searches. Shared by all workers and survives restarts """
+
+    __tablename__ = "cache_entries"
 
+    key = db.Column(db.Text, primary_key=True)
+    value = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        """show info about cache entry in cmd prompt"""
+        c = self
+        return f"<CACHEENTRY key={c.key} expires_at={c.expires_at}>"
@@ -0,0 +1,150 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  olclient.py is the one place we talk HTTP to Open Library.
+#  A client holds a requests Session so connections are kept alive and
+#  pooled, retries 5xx and connection errors with backoff, and uses
+#  timeouts on every call. Each gunicorn worker gets its own client.
+#
+#  Settings can be changed with environment variables:
+#  --- OPENLIBRARY_SEARCH_URL / OPENLIBRARY_INFO_URL  (point at a stand-in)
+#  --- OPENLIBRARY_TIMEOUT, OPENLIBRARY_RETRIES, OPENLIBRARY_BACKOFF
+#  --- OPENLIBRARY_POOL_SIZE
+#
+#  References:
+#  --- Requests and urllib3 Documentation Websites
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+#--------------------------------------------------------------------------#
+#                           Default Settings
+#--------------------------------------------------------------------------#
+
+SEARCH_URL = "https://openlibrary.org/search.json"
+INFO_URL = "https://openlibrary.org"
+TIMEOUT = 5
+RETRIES = 2
+BACKOFF = 0.3
+POOL_SIZE = 10
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class OpenLibraryError(Exception):
+    """Raised when Open Library can not be reached or sends back bad data"""
+
+
+#--------------------------------------------------------------------------#
+#                           Client Class - pooled HTTP session
+#--------------------------------------------------------------------------#
+
+class OpenLibraryClient:
+    """ OpenLibraryClient
+        - keeps one pooled, keep-alive session
+        - retries server errors and dropped connections with backoff
+        - sends back parsed JSON for search and work detail calls
+        - counts connections opened vs. reused
+    """
+
+    def __init__(self, search_url=None, info_url=None, timeout=None, retries=None,
+                 backoff=None, pool_size=None):
+        """Instatiate class variables on self, falling back to environment then defaults"""
+        self.search_url = search_url or os.environ.get('OPENLIBRARY_SEARCH_URL', SEARCH_URL)
+        self.info_url = info_url or os.environ.get('OPENLIBRARY_INFO_URL', INFO_URL)
+        self.timeout = float(timeout or os.environ.get('OPENLIBRARY_TIMEOUT', TIMEOUT))
+        retries = int(retries if retries is not None else os.environ.get('OPENLIBRARY_RETRIES', RETRIES))
+        backoff = float(backoff if backoff is not None else os.environ.get('OPENLIBRARY_BACKOFF', BACKOFF))
+        pool_size = int(pool_size or os.environ.get('OPENLIBRARY_POOL_SIZE', POOL_SIZE))
+
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                      allowed_methods=frozenset(['GET']))
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<OpenLibraryClient search_url={self.search_url} info_url={self.info_url}>"
+
+    def get_json(self, url, params=None):
+        """Make a GET call and send back the JSON. Errors come back as OpenLibraryError."""
+
+        try:
+            resp = self.session.get(url, params=params, timeout=self.timeout)
+            resp.raise_for_status()
+            return resp.json()
+        except (requests.RequestException, ValueError) as err:
+            raise OpenLibraryError(f"Open Library call failed: {url}") from err
+
+    def get_bytes(self, url, params=None):
+        """Make a GET call and send back the body, None if there is nothing at url (404).
+        Other errors come back as OpenLibraryError."""
+
+        try:
+            resp = self.session.get(url, params=params, timeout=self.timeout)
+            if resp.status_code == 404:
+                return None
+            resp.raise_for_status()
+            return resp.content
+        except requests.RequestException as err:
+            raise OpenLibraryError(f"Open Library call failed: {url}") from err
+
+    def search(self, **params):
+        """Search API i.e. search(title="Dune", author="Herbert")"""
+        return self.get_json(self.search_url, params=params)
+
+    def work(self, key):
+        """Works API for one book key i.e. work("/works/OL45883W")"""
+        return self.get_json(self.info_url + key + ".json")
+
+    def connection_stats(self):
+        """Count connections opened and reused across all hosts this client talks to"""
+
+        opened = 0
+        requests_made = 0
+        pools = self.adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is not None:
+                opened += pool.num_connections
+                requests_made += pool.num_requests
+        return {'opened': opened, 'reused': requests_made - opened, 'requests': requests_made}
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+
+#--------------------------------------------------------------------------#
+#                           One client per worker process
+#--------------------------------------------------------------------------#
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Send back this process's shared client. Sessions are not shared across a fork,
+    so a gunicorn worker builds its own the first time it needs one."""
+
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = OpenLibraryClient()
+                _client_pid = pid
+    return _client
@@ -0,0 +1,53 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  pagination.py - helpers for pages that are served a page at a time.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from flask import request
+
+
+#Pages are found by the sort values of the last row on the page before (keyset
+#pagination) instead of OFFSET, so a deep page costs the same as the first one.
+PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+#what a cursor may hold, anything else (lists, objects) can't be compared in SQL
+PLAIN_TYPES = (str, int, float, type(None))
+
+
+def get_per_page():
+    """Read per_page from the query string, kept between 1 and MAX_PER_PAGE"""
+    per_page = request.args.get("per_page", PER_PAGE, type=int)
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def encode_cursor(values):
+    """Turn the sort values of the last row on a page into a url safe string"""
+    return urlsafe_b64encode(json.dumps(list(values)).encode()).decode()
+
+
+def decode_cursor(cursor, length, nullable=True):
+    """Turn a cursor back into its length sort values. A missing or bad cursor means the
+    first page, only a list of length plain values (str/int/float/None) is let through.
+    With nullable=False None is bad too, for pages whose sort keys are never NULL."""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != length:
+        return None
+    #bool is an int too, but no sort key is a bool
+    if any(isinstance(value, bool) or not isinstance(value, PLAIN_TYPES) for value in values):
+        return None
+    if not nullable and None in values:
+        return None
+    return values
@@ -6,10 +6,16 @@
 #--------------------------------------------------------------------------#
 
 
-from models import db, connect_db
-from app import app
+#imported before the app is made so it sets up Flask-Migrate, see commands.init_migrations
+from flask_migrate import stamp
+from models import db
+from app import create_app
 
-connect_db(app)
+app = create_app()
 
-db.drop_all()
-db.create_all()
\ No newline at end of file
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+    #Tables were made from the models, so mark every migration as already applied
+    stamp()
@@ -0,0 +1,203 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  seeddata.py fills the database with made up users, books, shelves,
+#  borrow requests and ratings so we can see how pages hold up with lots
+#  of rows. Run it with the flask command (see commands.py):
+#      flask seed-data --users 20000 --books 200000
+#
+#  The data is shaped a bit like the real thing: a few users own most of
+#  the books, most books sit on the shelf, popular books get most of the
+#  ratings and most ratings are 4 or 5. Rows go in with COPY on Postgres
+#  and batched executemany inserts elsewhere. Every seeded user has the
+#  password SEED_PASSWORD so load tests can log in.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta
+from models import db, bcrypt, User, Book, Status, Borrower, BorrowHistory, BookRating, LenderRating
+
+SEED_PASSWORD = "password"
+BATCH_SIZE = 10000
+
+#weights are cumulative (random.choices cum_weights) so they aren't summed again for every row
+LOCATIONS = ["On Shelf", "Requested", "Checked Out"]
+LOCATION_WEIGHTS = [80, 92, 100]
+CONDITIONS = ["Like New", "Very Good", "Good", "Fair", "Poor"]
+CONDITION_WEIGHTS = [30, 60, 85, 95, 100]
+RATINGS = [1, 2, 3, 4, 5]
+RATING_WEIGHTS = [4, 10, 25, 60, 100]
+SUBJECTS = ["Fiction", "Mystery", "Romance", "History", "Science", "Fantasy",
+            "Biography", "Poetry", "Travel", "Cooking", "Children", "Classics"]
+WORDS = ["Shadow", "River", "Garden", "Winter", "Secret", "House", "Light", "Stone",
+         "Summer", "Night", "Journey", "Ocean", "Letter", "Crown", "Forest", "Island"]
+
+
+#--------------------------------------------------------------------------#
+#                           Bulk Inserts
+#--------------------------------------------------------------------------#
+
+def bulk_insert(table, rows):
+    """Insert rows (dicts, all with the same keys) into table as fast as the database allows.
+    Postgres gets one COPY per batch, other databases get executemany. Sends back the row count."""
+
+    conn = db.session.connection()
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            total += _insert_batch(conn, table, batch)
+            batch = []
+    if batch:
+        total += _insert_batch(conn, table, batch)
+    return total
+
+
+def _insert_batch(conn, table, batch):
+    columns = list(batch[0])
+
+    if conn.dialect.name != "postgresql":
+        #plain tuples straight to the driver's executemany, skipping per row processing in SQLAlchemy
+        insert = table.insert().compile(dialect=conn.dialect, column_keys=columns)
+        params = [tuple(row[col] for col in insert.positiontup) for row in batch] if insert.positional else batch
+        conn.exec_driver_sql(str(insert), params)
+        return len(batch)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow([r"\N" if row[col] is None else row[col] for col in columns])
+    buffer.seek(0)
+
+    cursor = conn.connection.cursor()
+    cursor.copy_expert(f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buffer)
+    return len(batch)
+
+
+#--------------------------------------------------------------------------#
+#                           Row Generators
+#--------------------------------------------------------------------------#
+
+def skewed(rand, items, skew=3):
+    """Pick from items so the first ones come up far more often. With skew 3 the
+    first 10% of items are picked about half the time, skew 1 is an even pick."""
+    return items[int(len(items) * rand.random() ** skew)]
+
+
+def user_rows(start, count, password):
+    for num in range(start, start + count):
+        yield {'username': f"seed{num}", 'password': password, 'first_name': "Seed", 'last_name': f"User{num}",
+               'address1': f"{num} Main St", 'address2': None, 'town': "Austin", 'state': "TX", 'zip': "78701",
+               'phone': None, 'email': f"seed{num}@example.com", 'profile': None, 'fav_book': None,
+               'fav_author': None, 'avg_rating': None, 'rating_count': 0, 'rating_sum': 0}
+
+
+def book_rows(rand, start, count, now):
+    for num in range(start, start + count):
+        title = f"The {rand.choice(WORDS)} {rand.choice(WORDS)} {num}"
+        yield {'key': f"/works/OL{num}SEED", 'title': title, 'author': f"Author {int(5000 * rand.random() ** 2)}",
+               'description': f"{title} is a made up book for load testing.",
+               'subjects': ", ".join(rand.sample(SUBJECTS, 3)),
+               'cover_img_url_m': None, 'cover_img_url_s': None,
+               'published_year': str(rand.randint(1900, 2021)),
+               'avg_rating': None, 'rating_count': 0, 'rating_sum': 0, 'updated_at': now}
+
+
+def generate(users, books, ratings_per_book=3, seed=1, log=print):
+    """Add users and books, put every book on an owner's shelf, then add borrow requests,
+    book ratings and lender ratings to match. Rating totals are rebuilt at the end.
+    Sends back a dict of rows added per table."""
+
+    rand = random.Random(seed)
+    started = time.perf_counter()
+    added = {}
+    password = bcrypt.generate_password_hash(SEED_PASSWORD).decode("utf8")
+    now = datetime.utcnow()
+
+    def step(name, table, rows):
+        begin = time.perf_counter()
+        added[name] = bulk_insert(table, rows)
+        elapsed = time.perf_counter() - begin
+        log(f"{name:15} {added[name]:>10,} rows {elapsed:>7.2f}s {added[name] / max(elapsed, 1e-9):>12,.0f} rows/s")
+
+    user_start = db.session.query(db.func.count(User.user_id)).scalar()
+    book_start = db.session.query(db.func.count(Book.book_id)).scalar()
+
+    step("users", User.__table__, user_rows(user_start, users, password))
+    step("books", Book.__table__, book_rows(rand, book_start, books, now))
+
+    user_ids = [user_id for (user_id,) in db.session.query(User.user_id)
+                .filter(User.username.like("seed%")).order_by(User.user_id)][-users:]
+    book_ids = [book_id for (book_id,) in db.session.query(Book.book_id)
+                .filter(Book.key.like("%SEED")).order_by(Book.book_id)][-books:]
+
+    #a few users own most of the books
+    owners = {book_id: skewed(rand, user_ids) for book_id in book_ids}
+    locations = {book_id: rand.choices(LOCATIONS, cum_weights=LOCATION_WEIGHTS)[0] for book_id in book_ids}
+
+    def borrower_for(owner):
+        borrower = owner
+        while borrower == owner:
+            borrower = rand.choice(user_ids)
+        return borrower
+
+    borrows = [(book_id, owners[book_id], borrower_for(owners[book_id]))
+               for book_id in book_ids if locations[book_id] != "On Shelf"]
+
+    step("statuses", Status.__table__, (
+        {'book_id': book_id, 'user_id': owners[book_id], 'location': locations[book_id],
+         'condition': rand.choices(CONDITIONS, cum_weights=CONDITION_WEIGHTS)[0],
+         'timestamp': now - timedelta(seconds=rand.randint(0, 365 * 24 * 3600))}
+        for book_id in book_ids))
+
+    step("borrowers", Borrower.__table__, (
+        {'book_id': book_id, 'status_owner_id': owner, 'borrower_id': borrower}
+        for book_id, owner, borrower in borrows))
+
+    def borrow_history():
+        #the open borrow of every requested or checked out copy, see borrow.py
+        for book_id, owner, borrower in borrows:
+            requested_at = now - timedelta(seconds=rand.randint(3600, 30 * 24 * 3600))
+            checked_out = locations[book_id] == "Checked Out"
+            yield {'book_id': book_id, 'owner_id': owner, 'borrower_id': borrower,
+                   'state': "checked_out" if checked_out else "requested", 'requested_at': requested_at,
+                   'checked_out_at': requested_at + timedelta(hours=1) if checked_out else None}
+
+    step("borrow_history", BorrowHistory.__table__, borrow_history())
+
+    def book_ratings():
+        #popular books (picked by skew) get most of the ratings, one rating per user per book
+        seen = set()
+        for _ in range(books * ratings_per_book):
+            pair = (skewed(rand, book_ids, 2), rand.choice(user_ids))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            yield {'book_rated': pair[0], 'user_rating': pair[1],
+                   'rating': rand.choices(RATINGS, cum_weights=RATING_WEIGHTS)[0], 'review': "Seeded review"}
+
+    step("books_ratings", BookRating.__table__, book_ratings())
+
+    #about half of the borrowers rate the lender, once per lender
+    lender_pairs = {(owner, borrower) for _, owner, borrower in borrows if rand.random() < 0.5}
+    step("lender_ratings", LenderRating.__table__, (
+        {'user_being_rated_id': owner, 'user_rating_id': borrower,
+         'rating': rand.choices(RATINGS, cum_weights=RATING_WEIGHTS)[0], 'review': "Seeded review"}
+        for owner, borrower in lender_pairs))
+
+    begin = time.perf_counter()
+    Book.reconcile_ratings(BookRating.__table__, BookRating.book_rated)
+    User.reconcile_ratings(LenderRating.__table__, LenderRating.user_being_rated_id)
+    log(f"{'rating totals':15} {'':>10} {time.perf_counter() - begin:>12.2f}s")
+
+    db.session.commit()
+    log(f"{'total':15} {sum(added.values()):>10,} rows {time.perf_counter() - started:>7.2f}s")
+    return added
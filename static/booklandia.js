@@ -1,17 +1,25 @@
-/* 
+/*
 Capstone Project:  BookLandia
 
 Jquery gets values of form when user is searching for a book
 We first make the API call with AJAX axios request
 If no findings, we expect messages within the response
 If we have findings, we need to handle that response with adding an element to DOM for each book received
+Browsers that can read a streamed reply use /api/search-wh/stream, which sends each book (one JSON
+object per line) as soon as its details are looked up, so cards show up one by one in search order.
+Otherwise books come back right away with what the search found. Their details (description, subjects,
+cover) are looked up in the background, so we poll /api/search-wh/status and fill each card in when done.
 
-References: 
-    - https://api.jquery.com/ 
+References:
+    - https://api.jquery.com/
     - Springboard projects
 */
 
 const $spinner = $("#waiting").hide();
+const $showsFoundBooks = $("#shows-found-books");
+const POLL_EVERY_MS = 500;
+const POLL_TRIES = 60;
+
 /** processForm: get data from form and make AJAX call to our API. */
 async function processForm(evt) {
 
@@ -23,13 +31,16 @@ async function processForm(evt) {
     const title = $("#title").val();
     const author = $("#author").val();
 
-    /** Make axios request and send entries - Wait for the response*/
-    let response = await axios.get("/api/search-wh", { params: { title: title, author: author } });
+    if (window.fetch && window.ReadableStream && window.TextDecoder) {
+        return streamSearch(title, author);
+    }
+
+    /** Make axios request and send entries - Wait for the response, a 502 (Open Library down) comes with a message too */
+    let response = await axios.get("/api/search-wh", { params: { title: title, author: author }, validateStatus: null });
 
     $spinner.hide();
     /** Make call to handle the response received */
     if (response.status != 201) {
-        const $showsFoundBooks = $("#shows-found-books");
         $showsFoundBooks.empty().html(`<h3 class="row" align="center">${response.data}</h3>`);
     }
     else {
@@ -38,90 +49,186 @@ async function processForm(evt) {
 
 }
 
-/** handleResponse: deal with response from our lucky-num API. */
-
-function handleResponse(resp) {
+/** streamSearch: read the streamed reply a line at a time and show each book as it arrives */
 
-    /** If entries were errors - provide error and have them retry */
-    searchedBooks = resp.data;
+async function streamSearch(title, author) {
 
-    const $showsFoundBooks = $("#shows-found-books");
     $showsFoundBooks.empty();
-
-    let bookCount = Object.keys(searchedBooks);
-    bookCount = bookCount.length;
-
-    for (let book = 0; book <= bookCount; book++) {
-
-        /** Shorten book description for card */
-        let description = searchedBooks[book]['description'];
-        if ((typeof (description) === "string") && description.length >= 300) {
-            description = (description.slice(0, 300)) + "...";
+    const params = new URLSearchParams({ title: title, author: author });
+    const response = await fetch(`/api/search-wh/stream?${params}`);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = "";
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
         }
-        /** Shorten subject content for card */
-        let subjects = searchedBooks[book]['subjects'];
-        let allSubjects = "";
-        for (let x = 0; x <= subjects.length; x++) {
-            if (x != 0) {
-                allSubjects = allSubjects + ", " + subjects[x];
-            }
-            else {
-                allSubjects = allSubjects + subjects[x];
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        /** the last piece may be half a line, keep it for the next read */
+        buffered = lines.pop();
+        for (let line of lines) {
+            if (line) {
+                handleLine(JSON.parse(line));
             }
         }
-        if (allSubjects.length >= 100) {
-            allSubjects = (allSubjects.slice(0, 100)) + "...";
-        }
+    }
+    $spinner.hide();
 
-        /** Shorten author content for card */
-        authors = searchedBooks[book]['author'];
-        let allAuthors = "";
-        for (let x = 0; x <= authors.length; x++) {
-            if (x != 0 && authors[0] != allAuthors) {
-                allAuthors = allAuthors + ", " + authors[0];
-            }
-            else
-                allAuthors = authors[0];
-        }
-        if (allAuthors.length >= 100) {
-            allAuthors = (allAuthors.slice(0, 100)) + "...";
-        }
+}
 
-        /** Create card to add to DOM for each book */
-        let $item = $(
-            `<div  class="card" data-show-id="${searchedBooks[book]['key']}">
-                <div class="row g-0">
-                    <div class="col-md-2">
-                        <img src="${searchedBooks[book]['cover_img_url_m']}" class="img-fluid rounded-start m-3" alt="${searchedBooks[book]['title']}">
-                    </div>
-                    <div class="col-md-10">
-                        <div class="card-body">
-                            <h5 class="card-title">${searchedBooks[book]['title']}</h5>
-                            <h6 class="card-subtitle mb-2 text-muted">By ${allAuthors}</h6>
-                            <p class="card-text">${description}</p>
-                            <p class="card-text">Published: ${searchedBooks[book]['first_publish_year']}</p>
-                            <p class="card-text">Subjects: ${allSubjects}</p>
-                            <button type="button" class="btn btn-info btn-md" data-book-id="${searchedBooks[book]['key']}">Add Book to My Library</button>
-                        </div>
+/** handleLine: one line of the streamed reply, a book, the end or an error */
+
+function handleLine(line) {
+
+    if (line.book) {
+        $spinner.hide();
+        placeCard(line.index, bookCard(Object.assign(line.book, { status: "done" })));
+    }
+    else if (line.error || line.found == 0) {
+        const message = line.error || "Sorry, but your search turned up empty. Please try again.";
+        $showsFoundBooks.empty().html(`<h3 class="row" align="center">${message}</h3>`);
+    }
+
+}
+
+/** placeCard: books arrive in any order, keep the cards in search order */
+
+function placeCard(index, $card) {
+
+    $card.attr("data-index", index);
+    const $after = $showsFoundBooks.children().filter(function () {
+        return Number($(this).attr("data-index")) > index;
+    }).first();
+    if ($after.length) {
+        $card.insertBefore($after);
+    }
+    else {
+        $showsFoundBooks.append($card);
+    }
+
+}
+
+/** shorten: cut long text down for the card */
+
+function shorten(text, length) {
+    if ((typeof (text) === "string") && text.length >= length) {
+        return (text.slice(0, length)) + "...";
+    }
+    return text;
+}
+
+/** coverSrc: show Open Library covers through our cover cache (/covers, see covers.py), same as the cover_src filter */
+
+const OL_COVER_URL = /^https?:\/\/covers\.openlibrary\.org\/b\/(?:olid|id)\/([A-Za-z0-9]+)-[SML]\.jpg$/;
+
+function coverSrc(url, size) {
+    if (!url) {
+        return `/covers/placeholder-${size}.png`;
+    }
+    const match = OL_COVER_URL.exec(url);
+    return match ? `/covers/${match[1]}-${size}.jpg` : url;
+}
+
+/** bookCard: card for one book, with its details once its background job is done */
+
+function bookCard(book) {
+
+    const done = book.status == "done";
+    const authors = Array.isArray(book.author) ? book.author.join(", ") : (book.author || "");
+    const subjects = Array.isArray(book.subjects) ? book.subjects.join(", ") : (book.subjects || "");
+
+    let details = `<p class="card-text text-muted"><em>Looking up the details for this book...</em></p>`;
+    if (book.status == "busy" || book.status == "failed" || book.status == "unknown") {
+        details = `<p class="card-text text-muted"><em>Details could not be looked up right now, please search again.</em></p>`;
+    }
+    else if (done) {
+        details = `<p class="card-text">${shorten(book.description, 300) || ""}</p>
+                   <p class="card-text">Subjects: ${shorten(subjects, 100)}</p>`;
+    }
+
+    const button = done
+        ? `<button type="button" class="btn btn-info btn-md" data-book-id="${book.key}">Add Book to My Library</button>`
+        : `<button type="button" class="btn btn-secondary btn-md" disabled>Add Book to My Library</button>`;
+
+    return $(
+        `<div  class="card" data-show-id="${book.key}">
+            <div class="row g-0">
+                <div class="col-md-2">
+                    <img src="${coverSrc(book.cover_img_url_m, "M")}" class="img-fluid rounded-start m-3" alt="${book.title}">
+                </div>
+                <div class="col-md-10">
+                    <div class="card-body">
+                        <h5 class="card-title">${book.title}</h5>
+                        <h6 class="card-subtitle mb-2 text-muted">By ${shorten(authors, 100)}</h6>
+                        ${details}
+                        <p class="card-text">Published: ${book.first_publish_year}</p>
+                        ${button}
                     </div>
-                </div>  
+                </div>
             </div>
-        `);
+        </div>
+    `);
+}
 
-        const $addToLibButton = $(".card-body").find("button");
-        $addToLibButton.on("click", async function (event) {
-            event.preventDefault();
-            const book = event.target;
-            let id = book.getAttribute("data-book-id");
-            let resp = await axios.get("/book/add-book", { params: { key: id } });
-            $(this).text("Added to Library").removeClass("btn btn-info btn-md").addClass("btn btn-secondary btn-md").unbind();
-        });
+/** handleResponse: add a card for each book found, then wait on the ones still being looked up. */
 
-        $showsFoundBooks.append($item);
+function handleResponse(resp) {
 
-    }//end of for loop
+    const searchedBooks = resp.data;
+    $showsFoundBooks.empty();
+
+    for (let book of searchedBooks) {
+        $showsFoundBooks.append(bookCard(book));
+    }
+
+    const pending = searchedBooks.filter(book => book.status == "pending" || book.status == "running");
+    if (pending.length) {
+        pollDetails(pending, 0);
+    }
 
 }
 
-$("#find-book-form").on("submit", processForm);
+/** pollDetails: ask for the books still being looked up and swap in each card once done */
+
+async function pollDetails(books, tries) {
+
+    await new Promise(resolve => setTimeout(resolve, POLL_EVERY_MS));
+
+    const params = new URLSearchParams();
+    books.forEach(book => params.append("key", book.key));
+    const response = await axios.get("/api/search-wh/status", { params: params });
 
+    let waiting = [];
+    for (let book of books) {
+        const progress = response.data[book.key];
+        const $card = $showsFoundBooks.find(`[data-show-id="${book.key}"]`);
+        if (progress.status == "done") {
+            $card.replaceWith(bookCard(Object.assign(progress.book, { status: "done" })));
+        }
+        else if (progress.status == "pending" || progress.status == "running") {
+            waiting.push(book);
+        }
+        else {
+            $card.replaceWith(bookCard(Object.assign(book, { status: progress.status })));
+        }
+    }
+
+    if (waiting.length && tries < POLL_TRIES) {
+        pollDetails(waiting, tries + 1);
+    }
+
+}
+
+/** Add a book to the library, the cards come and go so one handler on the list serves them all */
+
+$showsFoundBooks.on("click", "button[data-book-id]", async function (event) {
+    event.preventDefault();
+    let id = this.getAttribute("data-book-id");
+    await axios.get("/book/add-book", { params: { key: id } });
+    $(this).text("Added to Library").removeClass("btn btn-info btn-md").addClass("btn btn-secondary btn-md").prop("disabled", true);
+});
+
+$("#find-book-form").on("submit", processForm);
@@ -0,0 +1,135 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Fake Open Library:
+#  - Small local HTTP server that answers search, work detail and cover calls
+#  - Latency can be added to any call to act like a slow Open Library
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def make_works(count):
+    """Build search docs and work details for the fake library"""
+
+    works = []
+    for num in range(count):
+        works.append({
+            'key': f"/works/OL{num}W",
+            'title': f"Fake Book {num}",
+            'author_name': [f"Author {num}", "Second Author"],
+            'edition_key': [f"OL{num}M"],
+            'first_publish_year': 1900 + num,
+            'description': {'type': '/type/text', 'value': f"Description {num}"},
+            'subjects': ["Fiction", f"Subject {num}"],
+            'cover_edition_key': f"OL{num}C",
+        })
+    return works
+
+
+class FakeOpenLibrary:
+    """ Fake Open Library
+        - search_delay: seconds to wait before answering a search
+        - detail_delay: seconds to wait before answering a work detail call
+        - slow_keys: work keys that wait slow_delay seconds instead
+        - covers: "OL1M-M" (or cover id "123-M") -> image bytes, served like
+          covers.openlibrary.org/b/olid/OL1M-M.jpg, the rest are 404s
+        - match_title: searches only find works with the title asked for in their
+          title, otherwise every search finds the same works
+    """
+
+    def __init__(self, works, search_delay=0, detail_delay=0, slow_keys=(), slow_delay=0, covers=None,
+                 match_title=False):
+        self.works = works
+        self.match_title = match_title
+        self.covers = covers or {}
+        self.search_delay = search_delay
+        self.detail_delay = detail_delay
+        self.slow_keys = set(slow_keys)
+        self.slow_delay = slow_delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            #keep connections alive like the real Open Library does
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                with fake.lock:
+                    fake.calls.append(self.path)
+
+                if path == "/search.json":
+                    time.sleep(fake.search_delay)
+                    #like Open Library, fields and limit cut the reply down, without them every field comes back
+                    query = parse_qs(urlparse(self.path).query)
+                    fields = query['fields'][0].split(",") if 'fields' in query else list(fake.works[0]) if fake.works else []
+                    limit = int(query['limit'][0]) if 'limit' in query else 100
+                    works = fake.works
+                    if fake.match_title:
+                        title = query.get('title', [""])[0].lower()
+                        works = [w for w in works if title in w['title'].lower()]
+                    docs = [{k: w[k] for k in fields if k in w} for w in works[:limit]]
+                    return self.send_json({'numFound': len(works), 'docs': docs})
+
+                if path.startswith("/b/"):
+                    name = path.rsplit("/", 1)[-1][:-len(".jpg")]
+                    if name in fake.covers:
+                        return self.send_body(fake.covers[name], "image/jpeg")
+                    return self.send_body(b"", status=404)
+
+                for work in fake.works:
+                    if path == work['key'] + ".json":
+                        if work['key'] in fake.slow_keys:
+                            time.sleep(fake.slow_delay)
+                        else:
+                            time.sleep(fake.detail_delay)
+                        detail = {k: work[k] for k in ('key', 'title', 'description', 'subjects', 'cover_edition_key')}
+                        return self.send_json(detail)
+
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def send_json(self, data):
+                self.send_body(json.dumps(data).encode(), "application/json")
+
+            def send_body(self, body, content_type="text/plain", status=200):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,57 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Query Counter:
+#  - Counts SQL statements sent to the database while a block runs
+#  - assertMaxQueries fails a test if a route sends more than expected,
+#    which is how lazy loads in templates (N+1 queries) show up
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from contextlib import contextmanager
+from sqlalchemy import event
+
+
+class QueryCounter:
+    """Collects statements from engine events"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __len__(self):
+        return len(self.statements)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine):
+    """Count statements sent through engine while the block runs"""
+
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter.record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter.record)
+
+
+class QueryCountMixin:
+    """Mix into a TestCase to check how many queries a block sends"""
+
+    @contextmanager
+    def assertMaxQueries(self, maximum, engine=None):
+        from models import db
+
+        with count_queries(engine or db.engine) as counter:
+            yield counter
+        if len(counter) > maximum:
+            statements = "\n\n".join(counter.statements)
+            self.fail(f"{len(counter)} queries sent, expected at most {maximum}:\n\n{statements}")
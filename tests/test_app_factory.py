@@ -0,0 +1,62 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  App Factory Tests:
+#  - importing app builds nothing, app.app is built from the environment
+#    the first time it is used
+#  - settings passed to create_app go over the environment, and two apps
+#    do not share their job queue or cover cache
+#  - the blueprints keep every page at the url it had before
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+from app import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHECK_IMPORT = """
+import sys
+import app
+print('app' in vars(app), 'alembic' in sys.modules)
+print(app.app.config['SQLALCHEMY_DATABASE_URI'], app.app is app.app)
+"""
+
+
+class AppFactoryTestCase(TestCase):
+    """Test create_app."""
+
+    def test_import_builds_nothing(self):
+        """Run in a new process, this one has imported everything already"""
+
+        env = dict(os.environ, DATABASE_URL="postgres://booklend@localhost/booklend")
+        out = subprocess.check_output([sys.executable, "-c", CHECK_IMPORT], cwd=ROOT, env=env, text=True)
+        self.assertEqual(out.split("\n")[:2], ["False False", "postgresql://booklend@localhost/booklend True"])
+
+    def test_config_and_separate_apps(self):
+        first = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://", 'SEARCH_TRIGRAM': True})
+        second = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+        self.assertTrue(first.config['SEARCH_TRIGRAM'])
+        self.assertFalse(second.config['SEARCH_TRIGRAM'])
+        self.assertIsNot(first.extensions['jobs'], second.extensions['jobs'])
+        self.assertIsNot(first.extensions['covers'], second.extensions['covers'])
+        self.assertEqual(first.test_client().get("/login").status_code, 200)
+
+    def test_urls_unchanged(self):
+        rules = {rule.rule for rule in create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"}).url_map.iter_rules()}
+        for url in ("/", "/register", "/login", "/logout", "/addbooks", "/search", "/book/<int:book_id>",
+                    "/book/<int:book_id>/<int:user_id>/return", "/user/all", "/user/requests",
+                    "/user/<int:user_id>/review", "/api/search-wh", "/api/search-wh/stream", "/healthz",
+                    "/covers/<cover>-<any(S,M,L):size>.jpg"):
+            self.assertIn(url, rules)
@@ -0,0 +1,175 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Borrow Tests:
+#  - a copy goes On Shelf -> Requested -> Checked Out -> back On Shelf,
+#    one commit per step, with the time of each step in the history
+#  - steps from the wrong place or by the wrong user change nothing
+#  - shelving a copy saves its new condition in the same commit
+#  - requests fired at one copy at the same time, only one gets it
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from sqlalchemy import event
+from models import db, User, Book, Status, Borrower, BorrowHistory
+import borrow
+from borrow import BorrowError
+from test_warehouse import make_test_app
+
+
+def make_user(num):
+    return User(username=f"user{num}", password="HASHED_PASSWORD", first_name="First", last_name="Last",
+                address1="address1", town="town", state="TX", zip="12345", email=f"user{num}@test.com")
+
+
+class BorrowTestCase(TestCase):
+    """Test the borrow steps."""
+
+    def setUp(self):
+        """One copy on an owner's shelf and 8 users who may want it. The database is a file
+        so each thread in the parallel test gets its own connection."""
+
+        handle, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.app = make_test_app()
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{self.db_path}"
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        users = [make_user(num) for num in range(9)]
+        book = Book(key="/works/OL1W", title="Only Copy", author="Author")
+        db.session.add_all(users + [book])
+        db.session.flush()
+        db.session.add(Status(book_id=book.book_id, user_id=users[0].user_id))
+        db.session.commit()
+
+        self.book_id = book.book_id
+        self.owner_id = users[0].user_id
+        self.user_ids = [user.user_id for user in users[1:]]
+
+        self.commits = 0
+        event.listen(db.engine, "commit", self.count_commit)
+
+    def count_commit(self, conn):
+        self.commits += 1
+
+    def location(self):
+        db.session.expire_all()
+        return Status.query.filter_by(book_id=self.book_id, user_id=self.owner_id).one().location
+
+    def test_borrow_cycle(self):
+        borrower = self.user_ids[0]
+        borrow.request_copy(self.book_id, self.owner_id, borrower)
+        self.assertEqual(self.location(), borrow.REQUESTED)
+        borrow.approve_request(self.book_id, self.owner_id, self.owner_id)
+        self.assertEqual(self.location(), borrow.CHECKED_OUT)
+        borrow.return_copy(self.book_id, self.owner_id, self.owner_id)
+        self.assertEqual(self.location(), borrow.ON_SHELF)
+        self.assertEqual(self.commits, 3)
+
+        history = BorrowHistory.query.one()
+        self.assertEqual((history.borrower_id, history.state), (borrower, borrow.BORROW_RETURNED))
+        self.assertTrue(history.requested_at <= history.checked_out_at <= history.returned_at)
+        #the borrow stays in borrowers for a lender review
+        self.assertEqual(Borrower.query.count(), 1)
+
+    def test_wrong_steps_change_nothing(self):
+        with self.assertRaises(BorrowError):
+            borrow.approve_request(self.book_id, self.owner_id, self.owner_id)
+        with self.assertRaises(BorrowError):
+            borrow.request_copy(self.book_id, self.owner_id, self.owner_id)
+
+        borrow.request_copy(self.book_id, self.owner_id, self.user_ids[0])
+        for step in (lambda: borrow.request_copy(self.book_id, self.owner_id, self.user_ids[1]),
+                     lambda: borrow.approve_request(self.book_id, self.owner_id, self.user_ids[0]),
+                     lambda: borrow.return_copy(self.book_id, self.owner_id, self.owner_id),
+                     lambda: borrow.shelve_copy(self.book_id, self.owner_id, borrow.OFF_SHELF)):
+            with self.assertRaises(BorrowError):
+                step()
+
+        self.assertEqual(self.location(), borrow.REQUESTED)
+        self.assertEqual(BorrowHistory.query.count(), 1)
+        self.assertEqual(Borrower.query.count(), 1)
+
+    def test_shelve_with_condition(self):
+        """Taking a copy off the shelf saves its condition in the same commit, or neither"""
+
+        borrow.shelve_copy(self.book_id, self.owner_id, borrow.OFF_SHELF, condition="Worn")
+        self.assertEqual(self.location(), borrow.OFF_SHELF)
+        self.assertEqual(self.commits, 1)
+
+        status = Status.query.filter_by(book_id=self.book_id, user_id=self.owner_id).one()
+        self.assertEqual(status.condition, "Worn")
+
+        borrow.shelve_copy(self.book_id, self.owner_id, borrow.ON_SHELF)
+        borrow.request_copy(self.book_id, self.owner_id, self.user_ids[0])
+        with self.assertRaises(BorrowError):
+            borrow.shelve_copy(self.book_id, self.owner_id, borrow.OFF_SHELF, condition="Like New")
+        db.session.expire_all()
+        status = Status.query.filter_by(book_id=self.book_id, user_id=self.owner_id).one()
+        self.assertEqual((status.location, status.condition), (borrow.REQUESTED, "Worn"))
+
+    def test_reject_after_earlier_borrows(self):
+        """Rejecting a copy that was borrowed before takes out only the latest request"""
+
+        borrower = self.user_ids[0]
+        borrow.request_copy(self.book_id, self.owner_id, borrower)
+        borrow.approve_request(self.book_id, self.owner_id, self.owner_id)
+        borrow.return_copy(self.book_id, self.owner_id, self.owner_id)
+        borrow.request_copy(self.book_id, self.owner_id, borrower)
+        borrow.reject_request(self.book_id, self.owner_id, self.owner_id)
+
+        self.assertEqual(self.location(), borrow.ON_SHELF)
+        self.assertEqual([h.state for h in BorrowHistory.query.order_by(BorrowHistory.id)],
+                         [borrow.BORROW_RETURNED, borrow.BORROW_REJECTED])
+        self.assertEqual(Borrower.query.count(), 1)
+
+    def test_parallel_requests_one_copy(self):
+        """Eight users request the copy at the same moment, one gets it and the rest are told no"""
+
+        start = threading.Barrier(len(self.user_ids))
+        results = {}
+
+        def request(user_id):
+            with self.app.app_context():
+                start.wait()
+                try:
+                    borrow.request_copy(self.book_id, self.owner_id, user_id)
+                    results[user_id] = "requested"
+                except BorrowError:
+                    results[user_id] = "refused"
+                finally:
+                    db.session.remove()
+
+        threads = [threading.Thread(target=request, args=(user_id,)) for user_id in self.user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        winners = [user_id for user_id, result in results.items() if result == "requested"]
+        self.assertEqual(len(results), 8)
+        self.assertEqual(len(winners), 1)
+        self.assertEqual(self.location(), borrow.REQUESTED)
+        self.assertEqual([h.borrower_id for h in BorrowHistory.query], winners)
+        self.assertEqual([b.borrower_id for b in Borrower.query], winners)
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        event.remove(db.engine, "commit", self.count_commit)
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+        os.remove(self.db_path)
@@ -0,0 +1,143 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Catalog Import Tests (against a small generated dump):
+#  - works become books with the same cleanup as a search
+#  - batches load in worker processes and are upserted on key
+#  - a checkpoint lets a stopped import carry on where it left off
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import gzip
+import json
+import os
+import tempfile
+from unittest import TestCase
+from models import db, Book
+import catalog
+from test_warehouse import make_test_app
+
+
+def dump_line(record):
+    """One line as Open Library writes them: type, key, revision, last modified, JSON"""
+    return "\t".join([record['type']['key'], record['key'], "1", "2021-08-01T00:00:00", json.dumps(record)]) + "\n"
+
+
+def write_dumps(folder, works=40):
+    """Write a gzip'd works dump (with an edition, a bad line and a repeated work mixed in)
+    and an authors dump. Sends back their paths."""
+
+    authors_path = os.path.join(folder, "authors.txt.gz")
+    with gzip.open(authors_path, "wt") as f:
+        for num in range(5):
+            f.write(dump_line({'type': {'key': "/type/author"}, 'key': f"/authors/OL{num}A", 'name': f"Author {num}"}))
+
+    works_path = os.path.join(folder, "works.txt.gz")
+    with gzip.open(works_path, "wt") as f:
+        for num in range(works):
+            record = {'type': {'key': "/type/work"}, 'key': f"/works/OL{num}W", 'title': f"Dump Book {num}",
+                      'authors': [{'author': {'key': f"/authors/OL{num % 5}A"}}, {'author': {'key': "/authors/OL4A"}}],
+                      'first_publish_date': f"June {1900 + num}"}
+            if num % 2 == 0:
+                record['description'] = {'type': "/type/text", 'value': f"Description {num}"}
+                record['subjects'] = ["Fiction", f"Subject {num}"]
+                record['cover_edition'] = {'key': f"/books/OL{num}M"}
+            elif num % 3 == 0:
+                record['description'] = f"Plain description {num}"
+                record['covers'] = [-1, 1000 + num]
+            f.write(dump_line(record))
+        f.write(dump_line({'type': {'key': "/type/edition"}, 'key': "/books/OL1M", 'title': "An Edition"}))
+        f.write("not a dump line\n")
+        f.write(dump_line({'type': {'key': "/type/work"}, 'key': "/works/OL0W", 'title': "Dump Book 0 Revised"}))
+    return works_path, authors_path
+
+
+class CatalogImportTestCase(TestCase):
+    """Test loading books from an Open Library dump."""
+
+    def setUp(self):
+        """Dumps and a database file in a temp folder, worker processes need a real file"""
+
+        self.folder = tempfile.TemporaryDirectory()
+        self.works_path, self.authors_path = write_dumps(self.folder.name)
+        self.db_path = os.path.join(self.folder.name, "books.db")
+        self.database_url = f"sqlite:///{self.db_path}"
+
+        self.app = make_test_app()
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = self.database_url
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def run_import(self, **kwargs):
+        kwargs.setdefault('workers', 2)
+        totals = catalog.import_dump(self.works_path, self.database_url, batch_size=7,
+                                     authors_path=self.authors_path, log=lambda line: None, **kwargs)
+        db.session.remove()
+        return totals
+
+    def test_works_become_books(self):
+        totals = self.run_import()
+
+        self.assertEqual(totals['lines'], 43)
+        self.assertEqual(Book.query.count(), 40)
+
+        even = Book.query.filter_by(key="/works/OL2W").one()
+        self.assertEqual((even.author, even.published_year), ("Author 2, Author 4", "1902"))
+        self.assertEqual((even.description, even.subjects), ("Description 2", "Fiction, Subject 2"))
+        self.assertEqual(even.cover_img_url_m, "http://covers.openlibrary.org/b/olid/OL2M-M.jpg")
+
+        plain = Book.query.filter_by(key="/works/OL3W").one()
+        self.assertEqual((plain.description, plain.subjects), ("Plain description 3", ""))
+        self.assertEqual(plain.cover_img_url_s, catalog.COVER_ID_URL + "1003-S.jpg")
+
+        bare = Book.query.filter_by(key="/works/OL1W").one()
+        self.assertIsNone(bare.description)
+        self.assertEqual(bare.cover_img_url_m, Book.cover_img_url_m.default.arg)
+
+        #the repeated work came later in the dump, so it wins
+        self.assertEqual(Book.query.filter_by(key="/works/OL0W").one().title, "Dump Book 0 Revised")
+
+    def test_existing_books_upserted(self):
+        db.session.add(Book(key="/works/OL5W", title="Old Title", author="Someone", avg_rating=4.5))
+        db.session.commit()
+
+        self.run_import(workers=1)
+
+        book = Book.query.filter_by(key="/works/OL5W").one()
+        self.assertEqual((book.title, book.avg_rating), ("Dump Book 5", 4.5))
+
+    def test_resume_from_checkpoint(self):
+        """A stopped import starts after its last whole batch, a finished one loads nothing"""
+
+        checkpoint = self.works_path + ".checkpoint"
+        catalog.write_checkpoint(checkpoint, self.works_path, lines=21, books=21)
+
+        self.assertEqual(self.run_import()['lines'], 22)
+        #works 21-39 and the repeat of work 0 at the end
+        self.assertEqual(Book.query.count(), 20)
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['lines'], 43)
+
+        self.assertEqual(self.run_import()['lines'], 0)
+
+        updated = {book.key: book.updated_at for book in Book.query}
+        self.assertEqual(self.run_import(restart=True)['lines'], 43)
+        self.assertEqual(Book.query.count(), 40)
+        #rows already there are left alone, apart from work 0 which is in the dump twice
+        changed = [book.key for book in Book.query if book.key in updated and book.updated_at != updated[book.key]]
+        self.assertEqual(changed, ["/works/OL0W"])
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+        self.folder.cleanup()
@@ -0,0 +1,142 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Cover Tests (against a local fake cover server):
+#  - a cover is fetched once, then sent from disk with its hash as ETag
+#  - the same image is kept once, the least recently used go over the cap
+#  - missing covers get a placeholder the right size
+#  - cover urls in pages point at /covers
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import hashlib
+import os
+import struct
+import tempfile
+from unittest import TestCase
+from covers import CoverCache, cover_src, NO_IMAGE_URL, SIZES
+from olclient import OpenLibraryClient
+from fake_openlibrary import FakeOpenLibrary
+
+from app import create_app
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+
+def jpeg(num, size=1000):
+    """Not a real JPEG, just bytes that start like one"""
+    return b"\xff\xd8\xff\xe0" + str(num).encode() * (size // len(str(num)))
+
+
+class CoverTestCase(TestCase):
+    """Test the cover route and cache."""
+
+    def setUp(self):
+        """Fake cover server and a cover cache in a temp folder, swapped in for the app's"""
+
+        self.fake = FakeOpenLibrary([], covers={"OL1M-M": jpeg(1), "OL2M-M": jpeg(2), "OL3M-S": jpeg(1),
+                                                "1234-S": jpeg(4)}).start()
+        self.client = OpenLibraryClient(timeout=5, retries=0)
+        self.folder = tempfile.TemporaryDirectory()
+        self.covers = CoverCache(self.folder.name, max_bytes=10000, covers_url=self.fake.url, client=self.client)
+
+        self.saved = app.extensions['covers']
+        app.extensions['covers'] = self.covers
+        self.web = app.test_client()
+
+    def cover_calls(self):
+        return [call for call in self.fake.calls if call.startswith("/b/")]
+
+    def test_cover_fetched_once(self):
+        first = self.web.get("/covers/OL1M-M.jpg")
+        second = self.web.get("/covers/OL1M-M.jpg")
+
+        self.assertEqual((first.status_code, first.data), (200, jpeg(1)))
+        self.assertEqual(second.data, jpeg(1))
+        self.assertEqual(self.cover_calls(), ["/b/olid/OL1M-M.jpg?default=false"])
+        self.assertEqual(self.covers.stats()['hits'], 1)
+
+        self.assertEqual(first.headers['ETag'], f'"{hashlib.sha256(jpeg(1)).hexdigest()}"')
+        self.assertEqual(first.mimetype, "image/jpeg")
+        self.assertIn("immutable", first.headers['Cache-Control'])
+        self.assertIn("max-age=2592000", first.headers['Cache-Control'])
+
+        again = self.web.get("/covers/OL1M-M.jpg", headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual((again.status_code, again.data), (304, b""))
+
+    def test_cover_ids_and_bad_names(self):
+        self.assertEqual(self.web.get("/covers/1234-S.jpg").data, jpeg(4))
+        self.assertEqual(self.cover_calls(), ["/b/id/1234-S.jpg?default=false"])
+        self.assertEqual(self.web.get("/covers/..%2Fkeys-S.jpg").status_code, 404)
+        self.assertEqual(self.web.get("/covers/OL1M-X.jpg").status_code, 404)
+
+    def test_same_image_kept_once(self):
+        self.web.get("/covers/OL1M-M.jpg")
+        self.web.get("/covers/OL3M-S.jpg")
+
+        self.assertEqual(len(self.covers.objects()), 1)
+        self.assertEqual(self.web.get("/covers/OL3M-S.jpg").data, jpeg(1))
+
+    def test_least_recently_used_evicted(self):
+        """Cap of 10000 bytes holds 9 covers of 1000, going over evicts down to 9000"""
+
+        self.fake.covers.update({f"OL{num}W-M": jpeg(num) for num in range(10, 22)})
+        for num in range(10, 19):
+            self.web.get(f"/covers/OL{num}W-M.jpg")
+            #space the file times out so the order is clear
+            path = self.covers.object_path(hashlib.sha256(jpeg(num)).hexdigest())
+            os.utime(path, (1000 + num, 1000 + num))
+        #serving OL10W again makes it the most recently used
+        self.web.get("/covers/OL10W-M.jpg")
+        for num in range(19, 22):
+            self.web.get(f"/covers/OL{num}W-M.jpg")
+
+        kept = {path for _, _, path in self.covers.objects()}
+        self.assertLessEqual(self.covers.stats()['bytes'], 10000)
+        self.assertIn(self.covers.object_path(hashlib.sha256(jpeg(10)).hexdigest()), kept)
+        self.assertNotIn(self.covers.object_path(hashlib.sha256(jpeg(11)).hexdigest()), kept)
+
+        #an evicted cover is fetched again
+        calls = len(self.cover_calls())
+        self.assertEqual(self.web.get("/covers/OL11W-M.jpg").data, jpeg(11))
+        self.assertEqual(len(self.cover_calls()), calls + 1)
+
+    def test_missing_cover_gets_placeholder(self):
+        """Open Library's 404 is remembered, the placeholder is a PNG the size asked for"""
+
+        for _ in range(2):
+            resp = self.web.get("/covers/OL9M-S.jpg")
+            self.assertEqual(resp.mimetype, "image/png")
+        self.assertEqual(len(self.cover_calls()), 1)
+
+        width, height = struct.unpack(">II", resp.data[16:24])
+        self.assertEqual((width, height), SIZES['S'])
+        self.assertEqual(self.web.get("/covers/placeholder-M.png").data[16:24], struct.pack(">II", *SIZES['M']))
+
+    def test_unreachable_cover_not_remembered(self):
+        self.fake.stop()
+
+        self.assertEqual(self.web.get("/covers/OL1M-M.jpg").mimetype, "image/png")
+        self.assertEqual(self.covers.stats()['errors'], 1)
+        self.assertIsNone(self.covers.lookup("OL1M-M"))
+
+    def test_cover_src(self):
+        self.assertEqual(cover_src("http://covers.openlibrary.org/b/olid/OL3M-M.jpg", "S"), "/covers/OL3M-S.jpg")
+        self.assertEqual(cover_src("http://covers.openlibrary.org/b/id/1003-M.jpg"), "/covers/1003-M.jpg")
+        self.assertEqual(cover_src(NO_IMAGE_URL, "S"), "/covers/placeholder-S.png")
+        self.assertEqual(cover_src(None), "/covers/placeholder-M.png")
+        self.assertEqual(cover_src("https://example.com/cover.jpg"), "https://example.com/cover.jpg")
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        app.extensions['covers'] = self.saved
+        self.client.close()
+        self.fake.stop()
+        self.folder.cleanup()
@@ -0,0 +1,105 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Connection Pool Tests:
+#  - DB_* settings turn into pool options for Postgres urls only
+#  - pgbouncer mode keeps no connections and moves the statement timeout
+#    into each transaction
+#  - /healthz reports the database ping, pool, Open Library connections and
+#    cache hits, 503 when it is down
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from unittest import TestCase
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool, QueuePool, StaticPool
+from dbconfig import db_settings, engine_options, PooledSQLAlchemy
+
+from app import create_app
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+PG_URL = "postgresql://booklend@localhost/booklend"
+
+
+class DbConfigTestCase(TestCase):
+    """Test the pool settings."""
+
+    def test_settings_from_environment(self):
+        settings = db_settings({'DB_POOL_SIZE': "12", 'DB_PRE_PING': "0", 'DB_STATEMENT_TIMEOUT_MS': "0"})
+        self.assertEqual((settings['DB_POOL_SIZE'], settings['DB_PRE_PING']), (12, False))
+        self.assertEqual((settings['DB_MAX_OVERFLOW'], settings['DB_POOL_RECYCLE']), (10, 1800))
+        self.assertNotIn('connect_args', engine_options(PG_URL, settings))
+        with self.assertRaises(ValueError):
+            db_settings({'DB_POOL_MODE': "session"})
+
+    def test_queue_mode(self):
+        """Creating the engine does not connect, so no Postgres server is needed"""
+
+        options = engine_options(PG_URL, db_settings({}))
+        self.assertEqual(options['connect_args'], {'options': "-c statement_timeout=30000"})
+
+        engine = create_engine(PG_URL, **options)
+        self.assertIsInstance(engine.pool, QueuePool)
+        self.assertEqual((engine.pool.size(), engine.pool._max_overflow), (5, 10))
+        self.assertTrue(engine.pool._pre_ping)
+        self.assertEqual(engine.pool._recycle, 1800)
+
+    def test_pgbouncer_mode(self):
+        options = engine_options(PG_URL, db_settings({'DB_POOL_MODE': "pgbouncer"}))
+        self.assertNotIn('connect_args', options)
+
+        engine = create_engine(PG_URL, **options)
+        self.assertIsInstance(engine.pool, NullPool)
+        self.assertEqual(engine.get_execution_options()['statement_timeout_ms'], 30000)
+
+    def test_sqlite_keeps_defaults(self):
+        self.assertEqual(engine_options("sqlite://", db_settings({})), {})
+
+    def test_flask_engine(self):
+        """The app's engine picks up its config, SQLite keeps Flask-SQLAlchemy's own pool"""
+
+        test_app = Flask(__name__)
+        test_app.config.update(db_settings({'DB_POOL_SIZE': "3"}), SQLALCHEMY_TRACK_MODIFICATIONS=False,
+                               SQLALCHEMY_DATABASE_URI=PG_URL)
+        test_db = PooledSQLAlchemy(test_app)
+        with test_app.app_context():
+            self.assertEqual(test_db.engine.pool.size(), 3)
+            test_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+            self.assertIsInstance(test_db.engine.pool, StaticPool)
+
+
+class HealthTestCase(TestCase):
+    """Test the /healthz route."""
+
+    def setUp(self):
+        self.uri = app.config["SQLALCHEMY_DATABASE_URI"]
+        self.web = app.test_client()
+
+    def test_healthy(self):
+        resp = self.web.get("/healthz")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json['status'], "ok")
+        self.assertTrue(resp.json['database']['ok'])
+        self.assertEqual(resp.json['pool']['class'], "StaticPool")
+        self.assertEqual(set(resp.json['openlibrary']), {'opened', 'reused', 'requests'})
+        self.assertEqual(set(resp.json['caches']['search']), {'local', 'db'})
+        self.assertIn('jobs', resp.json)
+
+    def test_database_down(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:////no/such/folder/booklend.db"
+        resp = self.web.get("/healthz")
+
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(resp.json['database']['error'], "OperationalError")
+
+    def tearDown(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = self.uri
@@ -0,0 +1,63 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Fragment Tests:
+#  - rating icons come from the lookup table, rounded to whole icons
+#  - cached book cards are rendered again once the book changes
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from unittest import TestCase
+from datetime import datetime, timedelta
+from fragments import fragment_cache, filled_icons, rating_icons, book_card
+
+from app import create_app
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+
+class FragmentTestCase(TestCase):
+    """Test the rating icons filter and the book card cache."""
+
+    def setUp(self):
+        fragment_cache.clear()
+        self.book = {'book_id': 1, 'title': "Dune", 'author': "Frank Herbert", 'description': "Sand",
+                     'subjects': "Fiction", 'cover_img_url_m': None, 'avg_rating': 4.0,
+                     'updated_at': datetime(2021, 8, 1)}
+
+    def test_filled_icons(self):
+        """No rating is empty, 1 is one icon (the old if/elif chains showed 5)"""
+
+        self.assertEqual([filled_icons(r) for r in (None, 0, 1, 1.4, 1.5, 1.6, 4.5, 5)],
+                         [0, 0, 1, 1, 1, 2, 4, 5])
+
+    def test_rating_icons(self):
+        self.assertEqual(rating_icons(3).count("fas fa-star"), 3)
+        self.assertEqual(rating_icons(3).count("far fa-star"), 2)
+        self.assertEqual(rating_icons(2, "heart").count("fas fa-heart"), 2)
+
+    def test_book_card_cached(self):
+        with app.test_request_context():
+            card = book_card(self.book)
+            self.book['title'] = "Not Dune"
+            self.assertIs(book_card(self.book), card)
+            self.assertIn("Dune", card.heading)
+
+    def test_book_card_changed(self):
+        """A new rating or updated_at is a new key"""
+
+        with app.test_request_context():
+            card = book_card(self.book)
+            self.book['avg_rating'] = 2.0
+            self.assertEqual(book_card(self.book).cover.count("fas fa-star"), 2)
+
+            self.book['title'] = "Children of Dune"
+            self.book['updated_at'] += timedelta(seconds=1)
+            self.assertIn("Children of Dune", book_card(self.book).heading)
+            self.assertNotIn("Children", card.heading)
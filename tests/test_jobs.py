@@ -0,0 +1,274 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Background Job Tests (against a local fake Open Library):
+#  - one job per key, the queue is bounded and failed jobs can run again
+#  - a search answers before the work details come back
+#  - the details and the saved books show up once the jobs are done, saved
+#    with one upsert for the whole search, and the search is cached
+#  - /api/search-wh answers with a message and a 502 when Open Library is down
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+import socket
+import tempfile
+import threading
+import time
+from unittest import TestCase
+from models import db, Book, CacheEntry
+import func
+from func import Warehouse, enrichment_key
+from jobs import ThreadQueue, InlineQueue, QueueFull, DONE, FAILED
+import olclient
+from olclient import OpenLibraryClient
+from fake_openlibrary import FakeOpenLibrary, make_works
+from query_counter import count_queries
+from test_warehouse import make_test_app
+
+from app import create_app
+
+
+class JobQueueTestCase(TestCase):
+    """Test the job queue on its own."""
+
+    def setUp(self):
+        self.app = make_test_app()
+        self.jobs = ThreadQueue(self.app, workers=2, maxsize=3)
+        self.release = threading.Event()
+
+    def blocked(self, value):
+        self.release.wait(5)
+        return value
+
+    def wait_for(self, *jobs):
+        for _ in range(200):
+            if all(job.status in (DONE, FAILED) for job in jobs):
+                return
+            time.sleep(0.01)
+        self.fail("jobs did not finish")
+
+    def test_same_key_runs_once(self):
+        calls = []
+        first = self.jobs.submit("a", lambda: calls.append(1) or self.blocked("A"))
+        second = self.jobs.submit("a", lambda: calls.append(2))
+        self.release.set()
+        self.wait_for(first)
+
+        self.assertIs(second, first)
+        self.assertIs(self.jobs.submit("a", lambda: calls.append(3)), first)
+        self.assertEqual(first.result, "A")
+        self.assertEqual(calls, [1])
+        self.assertEqual(self.jobs.stats()['deduplicated'], 2)
+
+    def test_queue_is_bounded(self):
+        waiting = [self.jobs.submit(key, self.blocked, key) for key in "abc"]
+        with self.assertRaises(QueueFull):
+            self.jobs.submit("d", self.blocked, "d")
+
+        stats = self.jobs.stats()
+        self.assertEqual((stats['running'] + stats['depth'], stats['rejected']), (3, 1))
+        self.release.set()
+        self.wait_for(*waiting)
+        self.assertEqual(self.jobs.submit("d", self.blocked, "d").key, "d")
+
+    def test_failed_job_runs_again(self):
+        jobs = InlineQueue(self.app)
+        failed = jobs.submit("a", lambda: 1 / 0)
+        self.assertEqual(failed.status, FAILED)
+
+        again = jobs.submit("a", lambda: "ok")
+        self.assertEqual((again.status, again.result), (DONE, "ok"))
+        stats = jobs.stats()
+        self.assertEqual((stats['failed'], stats['completed']), (1, 1))
+        self.assertIsNotNone(stats['run_ms']['p95'])
+
+    def test_done_callbacks(self):
+        """Callbacks run once the job is over, or right away if it already is. A failing
+        callback does not fail the job."""
+
+        called = []
+        job = self.jobs.submit("a", self.blocked, "A")
+        job.add_done_callback(lambda job: called.append(("first", job.result)))
+        job.add_done_callback(lambda job: 1 / 0)
+        self.assertEqual(called, [])
+        self.release.set()
+        self.wait_for(job)
+        for _ in range(200):
+            if called:
+                break
+            time.sleep(0.01)
+
+        job.add_done_callback(lambda job: called.append(("late", job.status)))
+        self.assertEqual(called, [("first", "A"), ("late", DONE)])
+        self.assertEqual(job.status, DONE)
+
+    def tearDown(self):
+        self.release.set()
+        self.jobs.shutdown()
+
+
+class EnrichmentTestCase(TestCase):
+    """Test searches that leave the work details to background jobs."""
+
+    def setUp(self):
+        """Create app and database, fake library with slow work details. The database is a
+        file so each worker thread gets its own connection, like they would on Postgres."""
+
+        handle, self.db_path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        self.app = make_test_app()
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{self.db_path}"
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        func.search_cache.clear()
+        func.work_cache.clear()
+
+        self.fake = FakeOpenLibrary(make_works(10), detail_delay=0.3).start()
+        self.client = OpenLibraryClient(search_url=self.fake.url + "/search.json",
+                        info_url=self.fake.url, timeout=5, retries=0)
+        self.jobs = ThreadQueue(self.app, workers=10)
+
+    def wait_for_search(self, title):
+        """Wait for the search's last job to save and cache it"""
+        for _ in range(300):
+            if func.search_cache.local.get(func.search_cache_key(title, "")) is not func.MISSING:
+                return
+            time.sleep(0.01)
+        self.fail("search was not cached")
+
+    def wait_for_books(self, books):
+        jobs = [self.jobs.get(enrichment_key(book['key'])) for book in books]
+        for _ in range(300):
+            if all(job.status == DONE for job in jobs):
+                return [job.result for job in jobs]
+            time.sleep(0.01)
+        self.fail("enrichment did not finish")
+
+    def test_search_answers_before_details(self):
+        start = time.perf_counter()
+        books = Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual([book['key'] for book in books], [f"/works/OL{num}W" for num in range(10)])
+        self.assertLessEqual({book["status"] for book in books}, {"pending", "running"})
+        self.assertEqual(books[3]['cover_img_url_m'], func.COVER_URL + "OL3M-M.jpg")
+
+        details = self.wait_for_books(books)
+        self.assertEqual(details[3]['description'], "Description 3")
+        self.assertEqual(details[3]['cover_img_url_m'], func.COVER_URL + "OL3C-M.jpg")
+        self.wait_for_search("fake")
+        db.session.remove()
+        self.assertEqual(Book.query.count(), 10)
+        self.assertEqual(Book.query.filter_by(key="/works/OL7W").one().subjects, "Fiction, Subject 7")
+
+    def test_repeat_search_reuses_jobs(self):
+        """Searching again while or after the details are looked up does not look them up again"""
+
+        first = Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+        Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+        self.wait_for_books(first)
+        again = Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+
+        self.assertEqual({book['status'] for book in again}, {DONE})
+        self.assertEqual(again[0]['description'], "Description 0")
+        detail_calls = [call for call in self.fake.calls if call.startswith("/works/")]
+        self.assertEqual(len(detail_calls), 10)
+        self.assertEqual(self.jobs.stats()['submitted'], 10)
+
+    def test_search_saved_in_two_statements(self):
+        """The books are saved with one upsert up front, their details with one more once the
+        last job is over, and the search is cached so the next one makes no calls"""
+
+        with count_queries(db.engine) as counter:
+            books = Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+            self.assertEqual(Book.query.count(), 10)
+            self.wait_for_books(books)
+            self.wait_for_search("fake")
+        inserts = [sql for sql in counter.statements if sql.startswith("INSERT INTO books")]
+        self.assertEqual(len(inserts), 2)
+
+        calls = len(self.fake.calls)
+        again = Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+        self.assertEqual(len(self.fake.calls), calls)
+        self.assertEqual([book['description'] for book in again], [f"Description {num}" for num in range(10)])
+        db.session.remove()
+        self.assertEqual(Book.query.filter_by(key="/works/OL7W").one().description, "Description 7")
+
+    def test_empty_search_cached(self):
+        self.fake.works = []
+        self.assertEqual(Warehouse("nothing", "", client=self.client).search_and_enqueue(self.jobs), [])
+        self.assertEqual(Warehouse("nothing", "", client=self.client).search_and_enqueue(self.jobs), [])
+
+        self.assertEqual(len(self.fake.calls), 1)
+        self.assertEqual(CacheEntry.query.count(), 1)
+
+    def test_missing_details_cached_briefly(self):
+        """A search whose lookup failed is cached for the negative ttl and the book is saved
+        without details, for a later search to fill in"""
+
+        self.client.timeout = 0.5
+        self.fake.slow_keys, self.fake.slow_delay = {"/works/OL4W"}, 3
+        books = Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+        self.wait_for_books(books)
+        self.wait_for_search("fake")
+
+        entry = CacheEntry.query.filter_by(key="ol-search:" + func.search_cache_key("fake", "")).one()
+        self.assertLessEqual((entry.expires_at - entry.created_at).total_seconds(), func.search_cache.negative_ttl)
+        self.assertIsNone(Book.query.filter_by(key="/works/OL4W").one().description)
+
+    def test_full_queue_marks_books_busy(self):
+        self.jobs.maxsize = 4
+        books = Warehouse("fake", "", client=self.client).search_and_enqueue(self.jobs)
+
+        self.assertEqual([book['status'] for book in books[4:]], ["busy"] * 6)
+        self.assertEqual(self.jobs.stats()['rejected'], 6)
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        self.jobs.shutdown()
+        self.client.close()
+        self.fake.stop()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+        os.remove(self.db_path)
+
+
+class SearchRouteTestCase(TestCase):
+    """Test /api/search-wh when Open Library can't be reached."""
+
+    def setUp(self):
+        """The app's Open Library client points at a port nothing listens on"""
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.saved = olclient._client, olclient._client_pid
+        olclient._client = OpenLibraryClient(search_url=f"http://127.0.0.1:{port}/search.json",
+                                             info_url=f"http://127.0.0.1:{port}", timeout=1, retries=0)
+        olclient._client_pid = os.getpid()
+
+        self.app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+        with self.app.app_context():
+            db.create_all()
+            func.search_cache.clear()
+
+    def test_open_library_down(self):
+        resp = self.app.test_client().get("/api/search-wh?title=nothing+listens&author=")
+
+        self.assertEqual(resp.status_code, 502)
+        self.assertEqual(resp.json, "Sorry, the book warehouse is not answering. Please try again.")
+
+    def tearDown(self):
+        olclient._client.close()
+        olclient._client, olclient._client_pid = self.saved
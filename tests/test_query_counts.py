@@ -0,0 +1,238 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Query Count Tests:
+#  - Each page sends a fixed number of queries no matter how many rows
+#    it shows, so lazy loads in templates (N+1 queries) fail here
+#  - Query count and database time are reported per request, a plan that
+#    can't be made leaves the request's transaction alone
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from unittest import TestCase
+from sqlalchemy import event
+from models import db, User, Book, Status, Borrower, BorrowHistory, BookRating
+from query_counter import QueryCountMixin
+
+from app import create_app, CURR_USER_KEY
+from usercache import user_cache, directory_cache, invalidate_user
+from homefeed import feed_cache
+from dbstats import explain
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://", 'WTF_CSRF_ENABLED': False})
+
+
+def make_user(num):
+    return User(username=f"user{num}", password="HASHED_PASSWORD", first_name="First", last_name="Last",
+                address1="address1", town="town", state="TX", zip="12345", email=f"user{num}@test.com")
+
+
+class RouteQueryCountTestCase(QueryCountMixin, TestCase):
+    """Test that routes send a fixed number of queries."""
+
+    def setUp(self):
+        """Create app on an in-memory database and add 20 books with owners, requests and reviews"""
+
+        app.config["SLOW_QUERY_MS"] = 250
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        user_cache.clear()
+        directory_cache.clear()
+        feed_cache.clear()
+
+        viewer, owner, reviewer = make_user(1), make_user(2), make_user(3)
+        db.session.add_all([viewer, owner, reviewer])
+        db.session.commit()
+        self.viewer_id = viewer.user_id
+
+        for num in range(20):
+            book = Book(key=f"/works/OL{num}W", title=f"Book {num}", author="Author", description="About")
+            db.session.add(book)
+            db.session.flush()
+            location = "Requested" if num < 10 else "On Shelf"
+            db.session.add(Status(book_id=book.book_id, user_id=owner.user_id, location=location))
+            db.session.add(BookRating(book_rated=book.book_id, user_rating=reviewer.user_id, rating=4, review="Good"))
+            db.session.add(BookRating(book_rated=book.book_id, user_rating=owner.user_id, rating=5, review="Great"))
+            if num < 10:
+                db.session.add(Borrower(book_id=book.book_id, status_owner_id=owner.user_id, borrower_id=viewer.user_id))
+                db.session.add(BorrowHistory(book_id=book.book_id, owner_id=owner.user_id, borrower_id=viewer.user_id))
+        db.session.commit()
+        self.book_id = book.book_id
+        self.owner_id = owner.user_id
+        db.session.remove()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def get(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return resp
+
+    def test_homepage(self):
+        self.get("/")
+        db.session.remove()
+        #the feed is cached, only the user's reviews of the feed's books are looked up
+        with self.assertMaxQueries(2):
+            resp = self.get("/")
+        self.assertIn(b"Book 19", resp.data)
+
+    def test_homepage_feed_refreshed(self):
+        """Taking a book off the shelf drops it from the cached feed"""
+
+        self.get("/")
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.owner_id
+        resp = self.client.post(f"/book/{self.book_id}/delete")
+        self.assertEqual(resp.status_code, 302)
+        self.assertNotIn(b"Book 19", self.get("/").data)
+
+    def test_search_results(self):
+        with self.assertMaxQueries(2):
+            resp = self.get("/search?term=Book")
+        self.assertIn(b"Book 19", resp.data)
+
+    def test_book_info(self):
+        with self.assertMaxQueries(4):
+            resp = self.get(f"/book/{self.book_id}")
+        self.assertIn(b"user3", resp.data)
+
+    def test_library(self):
+        with self.assertMaxQueries(3):
+            self.get("/user/library")
+
+    def test_requestor_profile(self):
+        with self.assertMaxQueries(4):
+            resp = self.get(f"/user/profile/{self.owner_id}")
+        self.assertIn(b"Book 5", resp.data)
+
+    def test_requests(self):
+        with self.assertMaxQueries(2):
+            resp = self.get("/user/requests")
+        self.assertIn(b"Book 9", resp.data)
+        self.assertEqual(resp.data.count(b'scope="row"'), 10)
+
+    def test_requests_flat_as_history_grows(self):
+        """The owner's page is one query however many earlier borrows there are, only the open one is listed"""
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.owner_id
+        with self.assertMaxQueries(2):
+            self.get("/user/requests")
+
+        borrowers = [make_user(num) for num in range(10, 40)]
+        db.session.add_all(borrowers)
+        db.session.flush()
+        books = [status.book_id for status in Status.query.filter_by(location="Requested")]
+        for num, borrower in enumerate(borrowers):
+            db.session.add(Borrower(book_id=books[num % 10], status_owner_id=self.owner_id, borrower_id=borrower.user_id))
+            db.session.add(BorrowHistory(book_id=books[num % 10], owner_id=self.owner_id,
+                                         borrower_id=borrower.user_id, state="returned"))
+        db.session.commit()
+        db.session.remove()
+
+        with self.assertMaxQueries(2):
+            resp = self.get("/user/requests")
+        self.assertEqual(resp.data.count(b'scope="row"'), 10)
+        self.assertEqual(resp.data.count(f"/user/profile/{self.viewer_id}\"".encode()), 10)
+        self.assertEqual(resp.data.count(b"/user/profile/"), 10)
+
+    def test_requests_match_book_and_owner(self):
+        """A borrow only matches the status of the owner it was borrowed from. The viewer borrowed
+        books 0-9 from user2 and book 10 from user4, who also has book 0 requested by someone else."""
+
+        other = make_user(4)
+        db.session.add(other)
+        db.session.flush()
+        first, eleventh = [status.book_id for status in Status.query.order_by(Status.book_id).limit(11)][::10]
+        db.session.add_all([Status(book_id=first, user_id=other.user_id, location="Requested"),
+                            Status(book_id=eleventh, user_id=other.user_id, location="Requested"),
+                            BorrowHistory(book_id=first, owner_id=other.user_id, borrower_id=self.owner_id),
+                            BorrowHistory(book_id=eleventh, owner_id=other.user_id, borrower_id=self.viewer_id)])
+        db.session.commit()
+        db.session.remove()
+
+        resp = self.get("/user/requests")
+        self.assertEqual(resp.data.count(b'scope="row"'), 11)
+        self.assertEqual(resp.data.count(b"<td>user4</td>"), 1)
+
+    def test_user_directory(self):
+        with self.assertMaxQueries(3):
+            resp = self.get("/user/all")
+        self.assertIn(b"user2", resp.data)
+
+        #the page itself comes from the directory cache, only the viewer's ratings are looked up
+        db.session.remove()
+        with self.assertMaxQueries(1):
+            self.get("/user/all?sort=username")
+
+    def test_server_timing_header(self):
+        """Requests report their query count and database time"""
+
+        resp = self.get("/user/library")
+        timing = resp.headers["Server-Timing"]
+        self.assertIn('desc="3 queries"', timing)
+        self.assertIn("db-slowest;dur=", timing)
+
+    def test_slow_queries_logged_with_plan(self):
+        """Statements over SLOW_QUERY_MS are logged with their plan"""
+
+        app.config["SLOW_QUERY_MS"] = 0
+        with self.assertLogs("booklandia.db", level="WARNING") as logs:
+            self.get("/user/library")
+        self.assertIn("slow query", logs.output[0])
+        self.assertIn("USING INDEX ix_statuses_user_timestamp", "".join(logs.output))
+
+    def test_failed_plan_keeps_transaction(self):
+        """EXPLAIN runs in a savepoint, when it fails the request's own work carries on"""
+
+        db.session.add(make_user(99))
+        db.session.flush()
+        conn = db.session.connection()
+        sent = []
+        record = lambda conn, cursor, statement, *args: sent.append(statement)
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            plan = explain(conn, "SELECT no_such_column FROM users", (), False)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        self.assertTrue(plan.startswith("(no plan"), plan)
+        self.assertTrue(sent[0].startswith("SAVEPOINT"), sent)
+        self.assertTrue(sent[-1].startswith("ROLLBACK TO SAVEPOINT"), sent)
+        db.session.commit()
+        self.assertEqual(User.query.filter_by(username="user99").count(), 1)
+
+    def test_logged_in_user_cached(self):
+        """The logged in user is not queried again once its snapshot is cached"""
+
+        self.get("/user/library")
+        db.session.remove()
+        with self.assertMaxQueries(2):
+            resp = self.get("/user/library")
+        self.assertIn(b"user1", resp.data)
+
+    def test_invalidated_user_reloaded(self):
+        """After invalidate_user the next request loads the user again"""
+
+        self.get("/user/library")
+        invalidate_user(self.viewer_id)
+        db.session.remove()
+        with self.assertMaxQueries(3) as counter:
+            self.get("/user/library")
+        self.assertEqual(len(counter), 3)
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
@@ -0,0 +1,93 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Rating Total Tests:
+#  - Adding or editing a rating moves the running count/sum/average
+#  - Reconcile rebuilds the totals from the ratings tables
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from unittest import TestCase
+from models import db, User, Book, BookRating, LenderRating
+from commands import reconcile_ratings
+from test_query_counts import make_user
+
+from app import create_app
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+
+class RatingTotalsTestCase(TestCase):
+    """Test running rating totals on books and users."""
+
+    def setUp(self):
+        """Create app on an in-memory database with one book and three users"""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        self.users = [make_user(num) for num in range(3)]
+        self.book = Book(key="/works/OL1W", title="Book", author="Author")
+        db.session.add_all(self.users + [self.book])
+        db.session.commit()
+
+    def rate_book(self, user, rating):
+        db.session.add(BookRating(book_rated=self.book.book_id, user_rating=user.user_id, rating=rating))
+        Book.add_rating(self.book.book_id, rating)
+        db.session.commit()
+
+    def test_add_rating(self):
+        """Each rating moves count, sum and average"""
+
+        self.rate_book(self.users[0], 5)
+        self.rate_book(self.users[1], "2")
+
+        book = Book.query.get(self.book.book_id)
+        self.assertEqual((book.rating_count, book.rating_sum), (2, 7))
+        self.assertEqual(book.avg_rating, 3.5)
+
+    def test_update_rating(self):
+        """Editing a rating swaps the old value without counting it twice"""
+
+        self.rate_book(self.users[0], 5)
+        self.rate_book(self.users[1], 4)
+        review = BookRating.query.filter_by(user_rating=self.users[1].user_id).one()
+        Book.add_rating(self.book.book_id, 1, old_rating=review.rating)
+        review.rating = 1
+        db.session.commit()
+
+        book = Book.query.get(self.book.book_id)
+        self.assertEqual((book.rating_count, book.rating_sum), (2, 6))
+        self.assertEqual(book.avg_rating, 3.0)
+
+    def test_reconcile(self):
+        """Reconcile rebuilds totals from the ratings tables, no ratings means no average"""
+
+        lender, borrower, other = self.users
+        db.session.add_all([BookRating(book_rated=self.book.book_id, user_rating=borrower.user_id, rating=4),
+                            BookRating(book_rated=self.book.book_id, user_rating=other.user_id, rating=3),
+                            LenderRating(user_being_rated_id=lender.user_id, user_rating_id=borrower.user_id, rating=5)])
+        db.session.commit()
+
+        self.assertEqual(reconcile_ratings(), (1, 3))
+
+        book = Book.query.get(self.book.book_id)
+        self.assertEqual((book.rating_count, book.rating_sum, book.avg_rating), (2, 7, 3.5))
+        lender = User.query.get(lender.user_id)
+        self.assertEqual((lender.rating_count, lender.rating_sum, lender.avg_rating), (1, 5, 5.0))
+        other = User.query.get(other.user_id)
+        self.assertEqual((other.rating_count, other.rating_sum, other.avg_rating), (0, 0, None))
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
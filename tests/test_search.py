@@ -0,0 +1,166 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Book Search Tests:
+#  - off Postgres, Book.matching falls back to ILIKE on title, author and
+#    description with no rank, on Postgres the rank is a double
+#  - /search pages through every matching copy once, page boundaries
+#    inside a book included
+#  - a bad "after" cursor means the first page
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import re
+from unittest import TestCase
+from models import db, Book, Status
+from pagination import encode_cursor, decode_cursor
+from usercache import user_cache
+from test_query_counts import make_user
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+NEXT_PAGE = re.compile(r'href="(/search\?[^"]*after=[^"]*)">Next Page')
+COPY = re.compile(r'action="/book/(\d+)/(\d+)/request"')
+
+
+class BookMatchingTestCase(TestCase):
+    """Test the ILIKE search used when the database is not Postgres."""
+
+    def setUp(self):
+        """Create app on an in-memory database with three books"""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        db.session.add_all([
+            Book(key="/works/OL1W", title="The Hobbit", author="J.R.R. Tolkien", description="There and back again"),
+            Book(key="/works/OL2W", title="Dune", author="Frank Herbert", subjects="hobbits"),
+            Book(key="/works/OL3W", title="Emma", author="Jane Austen", description="A HOBBIT-free novel"),
+        ])
+        db.session.commit()
+
+    def matches(self, term):
+        match, rank = Book.matching(term)
+        self.assertIsNone(rank)
+        return sorted(book.title for book in Book.query.filter(match))
+
+    def test_title_author_and_description(self):
+        """Any case, anywhere in the title, author or description. Subjects are not searched."""
+
+        self.assertEqual(self.matches("hobbit"), ["Emma", "The Hobbit"])
+        self.assertEqual(self.matches("HERBERT"), ["Dune"])
+        self.assertEqual(self.matches("back aga"), ["The Hobbit"])
+
+    def test_trigram_ignored(self):
+        match, rank = Book.matching("dune", trigram=True)
+        self.assertIsNone(rank)
+        self.assertEqual([book.title for book in Book.query.filter(match)], ["Dune"])
+
+    def test_no_match(self):
+        self.assertEqual(self.matches("zzz"), [])
+
+    def test_postgres_rank_is_double(self):
+        """The rank goes into page cursors, so it is a double and not ts_rank's real.
+        Building the query does not connect, no Postgres server is needed."""
+
+        pg_app = create_app({'SQLALCHEMY_DATABASE_URI': "postgresql://booklend@localhost/booklend"})
+        with pg_app.app_context():
+            for trigram in (False, True):
+                match, rank = Book.matching("hobbit", trigram=trigram)
+                sql = str(rank.compile(dialect=db.engine.dialect))
+                self.assertTrue(sql.startswith("CAST(ts_rank(") and sql.endswith(" AS FLOAT)"), sql)
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+
+class SearchPagesTestCase(TestCase):
+    """Test paging through /search."""
+
+    def setUp(self):
+        """Seven books to match, two with the same title, each on three shelves"""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        user_cache.clear()
+
+        owners = [make_user(num) for num in range(1, 4)]
+        viewer = make_user(4)
+        db.session.add_all(owners + [viewer])
+        books = [Book(key=f"/works/OL{num}W", title=f"Hobbit {min(num, 5)}", author="Someone")
+                 for num in range(7)]
+        books.append(Book(key="/works/OL9W", title="Dune", author="Frank Herbert"))
+        db.session.add_all(books)
+        db.session.commit()
+        db.session.add_all(Status(book_id=book.book_id, user_id=owner.user_id) for book in books for owner in owners)
+        db.session.commit()
+
+        #title (newest first), then book and owner, as the search orders them
+        self.expected = sorted(((book.title, book.book_id, owner.user_id) for book in books[:7] for owner in owners),
+                               reverse=True)
+        self.expected = [(book_id, user_id) for title, book_id, user_id in self.expected]
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = viewer.user_id
+
+    def copies(self, url):
+        """Follow Next Page links from url, sending back the (book_id, user_id) on each page"""
+
+        pages = []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            html = resp.data.decode()
+            pages.append([(int(book_id), int(user_id)) for book_id, user_id in COPY.findall(html)])
+            url = NEXT_PAGE.search(html)
+            url = url.group(1).replace("&amp;", "&") if url else None
+        return pages
+
+    def test_every_copy_once(self):
+        """Pages of four split books between pages, no copy is repeated or skipped"""
+
+        pages = self.copies("/search?term=hobbit&per_page=4")
+
+        self.assertEqual([len(page) for page in pages], [4, 4, 4, 4, 4, 1])
+        self.assertEqual([copy for page in pages for copy in page], self.expected)
+
+    def test_one_page(self):
+        self.assertEqual(self.copies("/search?term=hobbit&per_page=50"), [self.expected])
+
+    def test_bad_cursor_means_first_page(self):
+        """Cursors that are not three plain values are ignored instead of reaching the query"""
+
+        first = self.copies("/search?term=hobbit&per_page=4")[0]
+        for after in ["NQ==", "WzFd", "W1tdLFtdLFtdXQ==", encode_cursor([{}, 1, 2]),
+                      encode_cursor([True, 1, 2]), "not base64!", "e30="]:
+            resp = self.client.get(f"/search?term=hobbit&per_page=4&after={after}")
+            self.assertEqual(resp.status_code, 200, after)
+            self.assertEqual(COPY.findall(resp.data.decode())[:4], [tuple(map(str, copy)) for copy in first])
+
+    def test_decode_cursor(self):
+        self.assertEqual(decode_cursor(encode_cursor([0.25, 2, None]), 3), [0.25, 2, None])
+        self.assertIsNone(decode_cursor(encode_cursor([0.25, 2]), 3))
+        self.assertIsNone(decode_cursor(encode_cursor([[0.25], 2, 3]), 3))
+        self.assertIsNone(decode_cursor(None, 3))
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
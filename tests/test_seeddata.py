@@ -0,0 +1,69 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Seed Data Tests:
+#  - generate adds every table's rows with bulk inserts
+#  - requests only exist for books off the shelf, never from the owner
+#  - rating totals match the ratings that were added
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from unittest import TestCase
+from models import db, User, Book, Status, Borrower, BookRating
+from seeddata import generate
+
+from app import create_app
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+
+class SeedDataTestCase(TestCase):
+    """Test the synthetic data generator."""
+
+    def setUp(self):
+        """Create app on an in-memory database"""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+    def test_generate(self):
+        """Rows are added for every table and hang together"""
+
+        added = generate(users=10, books=100, log=lambda line: None)
+
+        self.assertEqual((added['users'], added['books'], added['statuses']), (10, 100, 100))
+        self.assertEqual(User.query.count(), 10)
+        self.assertEqual(Status.query.count(), 100)
+        self.assertEqual(added['borrowers'], Status.query.filter(Status.location != "On Shelf").count())
+        self.assertEqual(added['borrow_history'], added['borrowers'])
+        self.assertEqual(BookRating.query.count(), added['books_ratings'])
+
+        for borrow in Borrower.query.all():
+            status = Status.query.filter_by(book_id=borrow.book_id).one()
+            self.assertEqual(status.user_id, borrow.status_owner_id)
+            self.assertNotEqual(borrow.borrower_id, borrow.status_owner_id)
+
+        rated = Book.query.filter(Book.rating_count > 0).first()
+        ratings = [r.rating for r in BookRating.query.filter_by(book_rated=rated.book_id)]
+        self.assertEqual((rated.rating_count, rated.rating_sum), (len(ratings), sum(ratings)))
+
+    def test_generate_twice(self):
+        """A second run adds new users and books instead of clashing with the first"""
+
+        generate(users=3, books=10, log=lambda line: None)
+        generate(users=3, books=10, log=lambda line: None)
+        self.assertEqual((User.query.count(), Book.query.count()), (6, 20))
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
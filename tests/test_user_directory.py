@@ -0,0 +1,109 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  User Directory Tests:
+#  - /user/all is served a page at a time, by username or rating
+#  - cached pages are dropped when a profile or rating changes
+#  - a bad "after" cursor means the first page
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import re
+from unittest import TestCase
+from models import db, User, LenderRating
+from usercache import user_cache, directory_cache, invalidate_user
+from pagination import encode_cursor
+from test_query_counts import make_user
+
+from app import create_app, CURR_USER_KEY
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': "sqlite://"})
+
+NEXT_PAGE = re.compile(r'href="(/user/all\?[^"]*after=[^"]*)">Next Page')
+
+
+class UserDirectoryTestCase(TestCase):
+    """Test paging, sorting and caching of the user directory."""
+
+    def setUp(self):
+        """Create app on an in-memory database with five users, user3 rated highest"""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        user_cache.clear()
+        directory_cache.clear()
+
+        users = [make_user(num) for num in range(1, 6)]
+        for user, rating in zip(users, [2.0, None, 5.0, 3.5, 4.0]):
+            user.avg_rating = rating
+        db.session.add_all(users)
+        db.session.commit()
+        self.viewer_id = users[0].user_id
+        self.rated_id = users[3].user_id
+        db.session.add(LenderRating(user_being_rated_id=self.rated_id, user_rating_id=self.viewer_id, rating=3))
+        db.session.commit()
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.viewer_id
+
+    def usernames(self, url):
+        """Follow Next Page links from url, sending back the usernames on each page"""
+
+        pages = []
+        while url:
+            html = self.client.get(url).data.decode()
+            pages.append(re.findall(r'<th scope="row">(\w+)</th>', html))
+            url = NEXT_PAGE.search(html)
+            url = url.group(1).replace("&amp;", "&") if url else None
+        return pages
+
+    def test_pages_by_username(self):
+        self.assertEqual(self.usernames("/user/all?per_page=2"),
+                         [["user1", "user2"], ["user3", "user4"], ["user5"]])
+
+    def test_pages_by_rating(self):
+        """Highest rated first, unrated users last"""
+
+        self.assertEqual(self.usernames("/user/all?sort=rating&per_page=2"),
+                         [["user3", "user5"], ["user4", "user1"], ["user2"]])
+
+    def test_bad_cursor_means_first_page(self):
+        """Cursors that are not two plain values never reach the query or the cache key"""
+
+        first = self.usernames("/user/all?sort=rating&per_page=2")[0]
+        for values in ([[], []], [None, 3], [{}, 3], [4.0], [True, 3]):
+            resp = self.client.get(f"/user/all?sort=rating&per_page=2&after={encode_cursor(values)}")
+            self.assertEqual(resp.status_code, 200, values)
+            self.assertEqual(re.findall(r'<th scope="row">(\w+)</th>', resp.data.decode()), first)
+
+    def test_rated_lenders_marked(self):
+        html = self.client.get("/user/all").data.decode()
+        self.assertIn(f'href="/user/{self.rated_id}/review/update"', html)
+        self.assertNotIn(f'href="/user/{self.rated_id}/review"', html)
+
+    def test_cache_dropped_on_change(self):
+        """A changed profile shows up once the user is invalidated"""
+
+        self.client.get("/user/all")
+        user = User.query.get(self.viewer_id)
+        user.fav_author = "Octavia Butler"
+        db.session.commit()
+        self.assertNotIn(b"Octavia Butler", self.client.get("/user/all").data)
+
+        invalidate_user(self.viewer_id)
+        self.assertIn(b"Octavia Butler", self.client.get("/user/all").data)
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
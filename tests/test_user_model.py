@@ -16,14 +16,13 @@
 #                           Import Necessary Libraries 
 #--------------------------------------------------------------------------#
 
-import os
 from unittest import TestCase
 from sqlalchemy import exc
 from models import db, User
 
-os.environ['DATABASE_URL'] = "postgresql:///booklend-test"
+from app import create_app
 
-from app import app
+app = create_app({'SQLALCHEMY_DATABASE_URI': "postgresql:///booklend-test"})
 
 db.create_all()
 
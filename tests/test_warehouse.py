@@ -0,0 +1,340 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#
+#  Warehouse Tests (against a local fake Open Library):
+#  - Work details are fetched at the same time
+#  - Results keep the same order and JSON shape
+#  - One slow work does not hold up the search
+#  - Client connections are kept alive and reused
+#  - Searches and work details are cached in-process and in the database,
+#    searches missing a book's details only briefly, and those details are
+#    filled in once a later search gets them
+#  - Streamed searches send each book as soon as its details come back
+#
+#  By: Eldy Deines
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import time
+from urllib.parse import urlparse, parse_qs
+from unittest import TestCase
+from flask import Flask
+from models import db, connect_db, Book, CacheEntry
+import func
+from func import Warehouse
+from cache import TTLCache, MISSING
+from olclient import OpenLibraryClient
+from fake_openlibrary import FakeOpenLibrary, make_works
+from query_counter import count_queries
+
+
+def make_test_app():
+    """Create a small app with an in-memory database for the Warehouse to save books"""
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    connect_db(app)
+    return app
+
+
+class WarehouseTestCase(TestCase):
+    """Test Warehouse against fake Open Library."""
+
+    def setUp(self):
+        """Create app and database, point Warehouse at the fake library"""
+
+        self.app = make_test_app()
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+        func.search_cache.clear()
+        func.work_cache.clear()
+
+        self.fake = None
+        self.client = None
+
+    def start_fake(self, timeout=5, **kwargs):
+        self.fake = FakeOpenLibrary(make_works(10), **kwargs).start()
+        self.client = OpenLibraryClient(search_url=self.fake.url + "/search.json",
+                        info_url=self.fake.url, timeout=timeout, retries=0)
+
+    def test_details_fetched_concurrently(self):
+        """Ten details at 0.3 seconds each should take about one detail call, not ten"""
+
+        self.start_fake(search_delay=0.1, detail_delay=0.3)
+
+        start = time.perf_counter()
+        found = Warehouse("fake", "", client=self.client).findBooksInWH()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(found), 10)
+        self.assertLess(elapsed, 1.5)
+
+    def test_results_keep_order_and_shape(self):
+        """Results are keyed 0-9 in search order with the same fields as before"""
+
+        self.start_fake()
+
+        found = Warehouse("fake", "author", client=self.client).findBooksInWH()
+
+        self.assertEqual(list(found.keys()), list(range(10)))
+        self.assertEqual(set(found[0].keys()), {'key', 'title', 'author', 'description', 'subjects',
+                        'cover_img_url_m', 'cover_img_url_s', 'first_publish_year'})
+        for num in range(10):
+            self.assertEqual(found[num]['key'], f"/works/OL{num}W")
+            self.assertEqual(found[num]['description'], f"Description {num}")
+        self.assertEqual(found[3]['cover_img_url_m'], func.COVER_URL + "OL3C-M.jpg")
+        self.assertEqual(Book.query.count(), 10)
+
+    def test_search_asks_for_what_it_uses(self):
+        """The search call asks for ten books and only the fields a BookRecord is built from"""
+
+        self.fake = FakeOpenLibrary(make_works(15)).start()
+        self.client = OpenLibraryClient(search_url=self.fake.url + "/search.json",
+                        info_url=self.fake.url, timeout=5, retries=0)
+
+        found = Warehouse("fake", "", client=self.client).findBooksInWH()
+
+        search = parse_qs(urlparse(self.fake.calls[0]).query)
+        self.assertEqual(search['limit'], [str(func.MAX_RESULTS)])
+        self.assertEqual(search['fields'][0].split(","), list(func.DOC_FIELDS))
+        self.assertEqual(len(found), 10)
+        self.assertEqual(Book.query.count(), 10)
+
+    def test_book_record_json_and_row(self):
+        """One record gives both the JSON reply and the book table row"""
+
+        doc = make_works(1)[0]
+        record = func.BookRecord.from_doc(doc, {'description': "Plain", 'subjects': ["A", "B"]})
+        self.assertEqual(record.json()['author'], ["Author 0", "Second Author"])
+        self.assertEqual(record.json()['cover_img_url_s'], func.COVER_URL + "OL0M-S.jpg")
+        self.assertEqual(record.row()['author'], "Author 0, Second Author")
+        self.assertEqual((record.row()['subjects'], record.row()['published_year']), ("A, B", 1900))
+
+        pending = func.BookRecord.from_doc(doc)
+        self.assertEqual((pending.description, pending.subjects), (None, []))
+
+    def test_connection_given_back_while_waiting(self):
+        """The cache lookup's transaction is over before the search call waits on Open Library,
+        so a slow search does not hold a database connection"""
+
+        self.start_fake()
+        in_transaction = []
+        search = self.client.search
+
+        def search_and_check(**params):
+            in_transaction.append(db.session().in_transaction())
+            return search(**params)
+
+        self.client.search = search_and_check
+        Warehouse("fake", "", client=self.client).findBooksInWH()
+
+        self.assertEqual(in_transaction, [False])
+        self.assertEqual(Book.query.count(), 10)
+
+    def test_release_connection_commits_nothing(self):
+        """Giving the connection back does not commit work someone else left pending"""
+
+        db.session.add(Book(key="/works/OL1H", title="Half Done", author="Someone"))
+        func.release_connection()
+
+        self.assertFalse(db.session().in_transaction())
+        self.assertEqual(Book.query.count(), 0)
+
+    def test_add_to_db_skips_existing_books(self):
+        """Books already in the table are left alone and the rest are added in one go"""
+
+        db.session.add(Book(key="/works/OL2W", title="Already Here", author="Someone"))
+        db.session.commit()
+        self.start_fake()
+
+        Warehouse("fake", "", client=self.client).findBooksInWH()
+
+        self.assertEqual(Book.query.count(), 10)
+        self.assertEqual(Book.query.filter_by(key="/works/OL2W").one().title, "Already Here")
+        book = Book.query.filter_by(key="/works/OL7W").one()
+        self.assertEqual(book.author, "Author 7, Second Author")
+        self.assertEqual(book.subjects, "Fiction, Subject 7")
+
+    def test_slow_work_does_not_stall(self):
+        """A work slower than the timeout falls back to defaults and the rest come back"""
+
+        self.start_fake(timeout=0.5, slow_keys=["/works/OL4W"], slow_delay=3)
+
+        start = time.perf_counter()
+        found = Warehouse("fake", "", client=self.client).findBooksInWH()
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 2)
+        self.assertIsNone(found[4]['description'])
+        self.assertEqual(found[4]['subjects'], "No Subjects")
+        self.assertEqual(found[4]['cover_img_url_s'], func.COVER_URL + "OL4M-S.jpg")
+        self.assertEqual(found[5]['description'], "Description 5")
+
+    def test_missing_details_filled_in_later(self):
+        """A search with a timed out lookup is only cached for the negative ttl, and the book
+        saved without its details gets them from the next search that finds them"""
+
+        self.start_fake(timeout=0.5, slow_keys=["/works/OL4W"], slow_delay=3)
+        Warehouse("fake", "", client=self.client).findBooksInWH()
+
+        entry = CacheEntry.query.filter_by(key="ol-search:" + func.search_cache_key("fake", "")).one()
+        self.assertLessEqual((entry.expires_at - entry.created_at).total_seconds(), func.search_cache.negative_ttl)
+        missing = Book.query.filter_by(key="/works/OL4W").one()
+        other = Book.query.filter_by(key="/works/OL5W").one()
+        self.assertEqual((missing.description, missing.subjects), (None, ""))
+        saved_at = (missing.updated_at, other.updated_at)
+
+        self.fake.slow_keys = set()
+        func.search_cache.clear()
+        again = Warehouse("fake", "", client=self.client).findBooksInWH()
+        missing = Book.query.filter_by(key="/works/OL4W").one()
+        other = Book.query.filter_by(key="/works/OL5W").one()
+
+        self.assertEqual(again[4]['description'], "Description 4")
+        self.assertEqual((missing.description, missing.subjects), ("Description 4", "Fiction, Subject 4"))
+        self.assertGreater(missing.updated_at, saved_at[0])
+        self.assertEqual(other.updated_at, saved_at[1])
+        self.assertEqual(Book.query.count(), 10)
+
+    def test_stream_with_missing_details_cached_briefly(self):
+        """A streamed search with a failed lookup is cached for the negative ttl too"""
+
+        self.start_fake(timeout=0.5, slow_keys=["/works/OL4W"], slow_delay=3)
+        books = dict(Warehouse("fake", "", client=self.client).stream_books())
+
+        self.assertEqual(books[4]['subjects'], "No Subjects")
+        entry = CacheEntry.query.filter_by(key="ol-search:" + func.search_cache_key("fake", "")).one()
+        self.assertLessEqual((entry.expires_at - entry.created_at).total_seconds(), func.search_cache.negative_ttl)
+
+    def test_connections_reused(self):
+        """A second search should ride on the connections the first one opened"""
+
+        self.start_fake()
+
+        Warehouse("fake", "", client=self.client).findBooksInWH()
+        first = self.client.connection_stats()
+        func.search_cache.clear()
+        func.work_cache.clear()
+        Warehouse("fake", "", client=self.client).findBooksInWH()
+        second = self.client.connection_stats()
+
+        self.assertEqual(second['requests'], 22)
+        self.assertLessEqual(first['opened'], 11)
+        #the second search may open one or two more while others are busy, never a full set
+        self.assertLess(second['opened'] - first['opened'], 5)
+
+    def test_warm_search_answered_from_database(self):
+        """Once a search is cached, the same search (cleaned up) makes no Open Library calls,
+        even from a worker whose in-process cache is empty"""
+
+        self.start_fake()
+        first = Warehouse("The  Fake", "", client=self.client).findBooksInWH()
+        calls = len(self.fake.calls)
+
+        func.search_cache.local.clear()
+        func.work_cache.local.clear()
+        hits = func.search_cache.stats()['db']['hits']
+        second = Warehouse("the fake", "", client=self.client).findBooksInWH()
+
+        self.assertEqual(len(self.fake.calls), calls)
+        self.assertEqual(second, first)
+        self.assertEqual(func.search_cache.stats()['db']['hits'] - hits, 1)
+
+    def test_work_details_cached(self):
+        """A different search that finds the same works does not fetch their details again"""
+
+        self.start_fake()
+        Warehouse("fake", "", client=self.client).findBooksInWH()
+        Warehouse("other", "", client=self.client).findBooksInWH()
+
+        detail_calls = [call for call in self.fake.calls if call.startswith("/works/")]
+        self.assertEqual(len(detail_calls), 10)
+
+    def test_empty_search_cached(self):
+        """Searches with no findings are cached too"""
+
+        self.start_fake()
+        self.fake.works = []
+        self.assertEqual(Warehouse("nothing", "", client=self.client).findBooksInWH(), {})
+        self.assertEqual(Warehouse("nothing", "", client=self.client).findBooksInWH(), {})
+
+        self.assertEqual(len(self.fake.calls), 1)
+        self.assertEqual(CacheEntry.query.count(), 1)
+
+    def test_stream_sends_books_as_details_arrive(self):
+        """The fastest work comes first, one search and one detail call in, and every
+        book ends up sent, saved and cached"""
+
+        self.start_fake(search_delay=0.1, detail_delay=0.8, slow_keys=["/works/OL6W"], slow_delay=0.1)
+
+        start = time.perf_counter()
+        books = Warehouse("fake", "", client=self.client).stream_books()
+        index, first = next(books)
+        first_at = time.perf_counter() - start
+        rest = dict(books)
+
+        self.assertEqual((index, first['description']), (6, "Description 6"))
+        self.assertLess(first_at, 0.6)
+        self.assertEqual(sorted(rest), [0, 1, 2, 3, 4, 5, 7, 8, 9])
+        self.assertEqual(Book.query.count(), 10)
+        cached = dict(Warehouse("the fake", "", client=self.client).stream_books())
+        self.assertEqual(cached[6], first)
+
+    def test_stream_saves_once(self):
+        """Every streamed book is saved with a single insert after the last one is sent"""
+
+        self.start_fake()
+        with count_queries(db.engine) as counter:
+            books = dict(Warehouse("fake", "", client=self.client).stream_books())
+
+        inserts = [sql for sql in counter.statements if sql.startswith("INSERT INTO books")]
+        self.assertEqual((len(books), len(inserts)), (10, 1))
+        self.assertEqual(Book.query.count(), 10)
+
+    def test_ttl_cache_evicts_and_expires(self):
+        """TTLCache drops the least recently used entry when full and expired entries on read"""
+
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        cache.set("d", 4, ttl=0)
+
+        self.assertIs(cache.get("b"), MISSING)
+        self.assertIs(cache.get("d"), MISSING)
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_cache_leaves_request_session_alone(self):
+        """Cache reads and writes neither commit nor throw away the request's unfinished work"""
+
+        db.session.add(Book(key="/works/OL1H", title="Half Done", author="Someone"))
+        func.search_cache.set("half done", [])
+        func.search_cache.local.clear()
+        self.assertEqual(func.search_cache.get("half done"), [])
+        db.session.rollback()
+
+        self.assertEqual(Book.query.count(), 0)
+        self.assertEqual(CacheEntry.query.count(), 1)
+
+        db.session.add(Book(key="/works/OL1H", title="Half Done", author="Someone"))
+        func.search_cache.clear()
+        db.session.commit()
+        self.assertEqual(Book.query.count(), 1)
+
+    def tearDown(self):
+        """Clean Up Data"""
+
+        if self.client:
+            self.client.close()
+        if self.fake:
+            self.fake.stop()
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
@@ -0,0 +1,99 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  usercache.py keeps the logged in user off the database for most requests.
+#  Pages only need the user's id, username, and average rating, so we keep
+#  a small snapshot of those in a short-lived in-process cache. CurrentUser
+#  stands in for g.user; asking it for anything else loads the full User
+#  row once for that request (the session's identity map keeps it).
+#
+#  USER_CACHE_TTL (seconds, default 30) sets how long a snapshot is used.
+#  The cache is per process: invalidate_user only drops the snapshot in the
+#  worker that made the change. Other gunicorn workers (WEB_CONCURRENCY)
+#  can show the old username or rating for up to USER_CACHE_TTL seconds.
+#
+#  Pages of the user directory (/user/all) are kept here too, rendered,
+#  for USER_DIRECTORY_TTL seconds (default 60). Any profile or rating
+#  change drops them all since it can move users between pages. Like the
+#  snapshots they are per process, so other workers may page through the
+#  old directory for up to USER_DIRECTORY_TTL seconds after a change.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+import os
+from collections import namedtuple
+from cache import TTLCache, MISSING
+from models import User
+
+UserSnapshot = namedtuple("UserSnapshot", ["user_id", "username", "avg_rating"])
+
+user_cache = TTLCache(maxsize=int(os.environ.get('USER_CACHE_SIZE', 1024)),
+                      ttl=int(os.environ.get('USER_CACHE_TTL', 30)))
+
+directory_cache = TTLCache(maxsize=int(os.environ.get('USER_DIRECTORY_CACHE_SIZE', 256)),
+                           ttl=int(os.environ.get('USER_DIRECTORY_TTL', 60)))
+
+
+class CurrentUser:
+    """ CurrentUser - what g.user holds for a logged in user
+        - user_id, username, avg_rating come from the cached snapshot
+        - any other attribute loads the full User row (load())
+    """
+
+    def __init__(self, snapshot, user=None):
+        """Instatiate class variables on self"""
+        self._snapshot = snapshot
+        self._user = user
+
+    def __repr__(self):
+        """Creates string identifier in command prompt"""
+        return f"<CURRENTUSER user_id={self.user_id} username={self.username}>"
+
+    @property
+    def user_id(self):
+        return self._snapshot.user_id
+
+    @property
+    def username(self):
+        return self._snapshot.username
+
+    @property
+    def avg_rating(self):
+        return self._snapshot.avg_rating
+
+    def load(self):
+        """Send back the full User row, queried at most once per request"""
+        if self._user is None:
+            self._user = User.query.get(self.user_id)
+        return self._user
+
+    def __getattr__(self, name):
+        #only called for attributes not found above i.e. first_name, profile, status
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+
+def get_current_user(user_id):
+    """Send back a CurrentUser for user_id, or None if that user no longer exists"""
+
+    snapshot = user_cache.get(user_id)
+    if snapshot is not MISSING:
+        return CurrentUser(snapshot)
+
+    user = User.query.get(user_id)
+    if user is None:
+        return None
+    snapshot = UserSnapshot(user.user_id, user.username, user.avg_rating)
+    user_cache.set(user_id, snapshot)
+    return CurrentUser(snapshot, user)
+
+
+def invalidate_user(user_id):
+    """Drop a user's snapshot and the directory pages after their profile or rating changes.
+    Only in this process, other workers catch up when their entries expire."""
+    user_cache.delete(user_id)
+    directory_cache.clear()
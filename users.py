@@ -0,0 +1,336 @@
+#--------------------------------------------------------------------------#
+#  Capstone Project:  BookLandia
+#  users.py - the user directory, libraries, profiles, the requests page
+#  and lender reviews.
+#--------------------------------------------------------------------------#
+
+
+#--------------------------------------------------------------------------#
+#                           Import Necessary Libraries
+#--------------------------------------------------------------------------#
+
+from flask import Blueprint, render_template, request, redirect, flash, g, get_template_attribute
+from sqlalchemy import tuple_
+from sqlalchemy.orm import aliased, contains_eager, joinedload, load_only
+from models import db, User, Status, Borrower, BorrowHistory, BookRating, LenderRating
+from forms import ProfileForm, LenderReviewForm
+from usercache import invalidate_user, directory_cache
+from cache import MISSING
+from pagination import get_per_page, encode_cursor, decode_cursor
+from borrow import OPEN_BORROW, REQUESTED, CHECKED_OUT
+
+bp = Blueprint("users", __name__)
+
+
+#User directory sort options: (sort column, newest/highest first). Unrated users sort as 0.
+USER_SORTS = {
+    'username': (User.username, False),
+    'rating': (db.func.coalesce(User.avg_rating, 0), True),
+}
+
+
+def user_directory_page(sort, per_page, after):
+    """One page of the user directory as (rows, next_cursor). Each row has the user_id, username
+    and the rendered cells that look the same to every viewer. Pages are cached until a profile
+    or rating changes (see usercache.py)."""
+
+    key = (sort, per_page, tuple(after) if after else None)
+    cached = directory_cache.get(key)
+    if cached is not MISSING:
+        return cached
+
+    sort_key, descending = USER_SORTS[sort]
+    users = (User.query
+                .options(load_only(User.user_id, User.username, User.avg_rating,
+                                   User.profile, User.fav_book, User.fav_author))
+                .add_columns(sort_key.label("sort_key")))
+    if descending:
+        users = users.order_by(sort_key.desc(), User.user_id.desc())
+        if after:
+            users = users.filter(tuple_(sort_key, User.user_id) < tuple_(*after))
+    else:
+        users = users.order_by(sort_key, User.user_id)
+        if after:
+            users = users.filter(tuple_(sort_key, User.user_id) > tuple_(*after))
+
+    #one extra row tells us if there is a next page
+    rows = users.limit(per_page + 1).all()
+
+    user_cells = get_template_attribute('users/_directory.html', 'user_cells')
+    page_rows = [{'user_id': user.user_id, 'username': user.username, 'cells': str(user_cells(user))}
+                 for user, sort_value in rows[:per_page]]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last_user, last_sort_value = rows[per_page - 1]
+        next_cursor = encode_cursor([last_sort_value, last_user.user_id])
+
+    directory_cache.set(key, (page_rows, next_cursor))
+    return page_rows, next_cursor
+
+
+@bp.route('/user/all')
+def see_all_users():
+    """Render the user directory a page at a time only if you are a logged in user. 
+    Users are sorted by username or average rating (sort=rating). The shared part of each page 
+    comes from user_directory_page, then we look up which users on the page this user has rated."""
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    sort = request.args.get("sort", "username")
+    if sort not in USER_SORTS:
+        sort = "username"
+    page = max(1, request.args.get("page", 1, type=int))
+    per_page = get_per_page()
+    #sort key and user_id of the last user on the page before, both are never NULL
+    after = decode_cursor(request.args.get("after"), 2, nullable=False)
+
+    users, next_cursor = user_directory_page(sort, per_page, after)
+
+    #lenders on this page already rated by the user, as a set for quick lookups in the template
+    page_ids = [user['user_id'] for user in users]
+    ratings = {user_id for (user_id,) in db.session.query(LenderRating.user_being_rated_id)
+                .filter(LenderRating.user_rating_id==g.user.user_id,
+                        LenderRating.user_being_rated_id.in_(page_ids))}
+
+    return render_template('users/all.html', users=users, ratings=ratings, sort=sort, 
+                           page=page, per_page=per_page, next_cursor=next_cursor)
+
+
+@bp.route('/user/library')
+def see_library():
+    """For logged in user, show books that they have added to their library.
+       This will also render buttons to update status and update reviews so this will
+       query status table and book ratings table as well.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    
+    statuses = (Status.query
+            .options(joinedload(Status.book))
+            .filter_by(user_id=g.user.user_id)
+            .order_by(Status.timestamp.desc()))
+    
+    rated_books = (db.session.query(BookRating.book_rated)
+                    .filter_by(user_rating=g.user.user_id)
+                    .all())
+    reviews_book_ids = [book_rated for (book_rated,) in rated_books]
+
+    return render_template('users/library.html',statuses=statuses, reviews=reviews_book_ids)
+
+
+@bp.route('/user/profile')
+def see_profile():
+    """For Logged in User, show the user's profile by querying the user table."""
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    
+    current_user = g.user.load()
+    return render_template('users/profile.html',user=current_user)
+
+
+@bp.route('/user/profile/<int:user_id>')
+def see_requestor_profile(user_id):
+    """This routes shows a profile of another user not the logged in user.
+       Queries the status to show which books they own.  Queries the book rating table
+       to show what books they have rated with the rating and review. 
+    """
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    requestor = User.query.get(user_id)
+
+    statuses = (Status.query
+            .options(joinedload(Status.book))
+            .filter_by(user_id=requestor.user_id)
+            .order_by(Status.timestamp.desc()))
+    
+    rated_books = (BookRating.query
+                    .options(joinedload(BookRating.book))
+                    .filter_by(user_rating=user_id)
+                    .all())
+
+    return render_template('users/requestor.html',user=requestor,statuses=statuses,ratings=rated_books)
+
+
+@bp.route('/user/profile/update', methods=["GET", "POST"])
+def update_profile():
+    """For Logged in User, they can update their profile if they can enter their password correctly.
+       If password incorrect, they will have to keep trying or move to another page. They will have 
+       the ability to update all fields except username and password."""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    form = ProfileForm()
+    current_user = g.user.load()
+
+    if form.validate_on_submit():
+        pword_entered = request.form['password']
+        if User.authenticate(current_user.username, pword_entered):
+
+            first_name = request.form['first_name']
+            last_name = request.form['last_name']
+            address1 = request.form['address1']
+            address2 = request.form['address2']
+            town = request.form['town']
+            state =  request.form['state']
+            zip = request.form['zip']
+            phone =  request.form['phone']
+            email = request.form['email']
+            profile = request.form['profile']
+            fav_book = request.form['fav_book']
+            fav_author = request.form['fav_author']
+
+            
+            if first_name: 
+                current_user.first_name = first_name
+            if last_name: 
+                current_user.last_name = last_name
+            if address1: 
+                current_user.address1 = address1
+            if address2: 
+                current_user.address2 = address2
+            if town: 
+                current_user.town = town
+            if state:
+                current_user.state = state
+            if zip: 
+                current_user.zip = zip
+            if phone: 
+                current_user.phone = phone
+            if email: 
+                current_user.email = email
+            if profile: 
+                current_user.profile = profile
+            if fav_book:
+                current_user.fav_book = fav_book
+            if fav_author:
+                current_user.fav_author = fav_author
+
+            db.session.commit()
+            invalidate_user(current_user.user_id)
+            flash("Profile has been updated.","success")
+            return redirect("/user/profile")
+
+        flash("Password incorrect. Profile updates not saved.","warning")
+
+
+    return render_template('users/update.html',user=current_user, form=form)
+
+@bp.route('/user/requests')
+def show_requests():
+    """For logged in user, this will show the books requested or checked out by user and 
+    the user's own books that others have requested. One query joins each status with its 
+    book, its owner and the open borrow of that same book and owner (see borrow.py). Rows 
+    are then grouped so each status comes with the user who requested it.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    owner_id = g.user.user_id
+    open_borrow = BorrowHistory.state.in_(OPEN_BORROW)
+    borrowed = (db.session.query(BorrowHistory.book_id, BorrowHistory.owner_id)
+                .filter(BorrowHistory.borrower_id==owner_id, open_borrow))
+    requestor = aliased(User)
+    rows = (db.session.query(Status, requestor)
+            .join(Status.book)
+            .join(Status.user)
+            #the open borrow of each copy, its borrower is only listed on the user's own books
+            .outerjoin(BorrowHistory, (BorrowHistory.book_id==Status.book_id) & (BorrowHistory.owner_id==Status.user_id)
+                       & open_borrow & (Status.user_id==owner_id))
+            .outerjoin(requestor, requestor.user_id==BorrowHistory.borrower_id)
+            .options(contains_eager(Status.book), contains_eager(Status.user))
+            .filter(Status.location.in_((REQUESTED, CHECKED_OUT)))
+            .filter((Status.user_id==owner_id) | tuple_(Status.book_id, Status.user_id).in_(borrowed))
+            .order_by(Status.timestamp.desc(), Status.book_id, Status.user_id)
+            .all())
+
+    #grouped to (status, [requestors]), a copy has one open borrow but older data may have none
+    requests = {}
+    for status, user in rows:
+        requestors = requests.setdefault((status.book_id, status.user_id), (status, []))[1]
+        if user is not None:
+            requestors.append(user)
+
+    return render_template('users/requests.html', requests=list(requests.values()))
+
+@bp.route('/user/<int:user_id>/review', methods=["GET","POST"])
+def review_lender(user_id):
+    """Logged in user can write a review and provide a rating someone who has lended a book to them. 
+    We first query Borrower to make sure their is at least one instance of a borrow. 
+    Upon validating WTForm, we create a new rating record in the LenderRating table.
+    With the added rating, we need to update the Avg Rating for the user in question. User.add_rating 
+    bumps the user's rating count and sum and works out "avg_rating" from them, committed together
+    with the new rating.
+    """
+    
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    lender_under_review = User.query.get(user_id)
+    form=LenderReviewForm()
+    has_borrowed = (Borrower.query
+                    .filter((Borrower.status_owner_id==user_id),(Borrower.borrower_id==g.user.user_id))
+                    .first())
+    if has_borrowed:
+        
+        if form.validate_on_submit():
+            rating = request.form['rating']
+            review = request.form['review']
+            new_rating = LenderRating(user_being_rated_id=lender_under_review.user_id, user_rating_id=g.user.user_id,rating=rating,review=review)
+            db.session.add(new_rating)
+            User.add_rating(lender_under_review.user_id, rating)
+            db.session.commit()
+            invalidate_user(lender_under_review.user_id)
+
+            flash("Rating and review added.", "success")
+            return redirect("/user/all")
+    else:
+        flash("Rating not added as you need to have borrowed previously from user.", "danger")
+        return redirect("/user/all")
+
+    return render_template('users/review.html', form=form, lender=lender_under_review)
+
+
+@bp.route('/user/<int:user_id>/review/update', methods=["GET","POST"])
+def update_user_review(user_id):
+    """If a user has an existing review on a user, they can update the rating and review in this route.
+    Because they may have changed their rating value, we need to ensure the avg_rating is updated 
+    for the specified user.
+    """
+        
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+    
+    lender_under_review = User.query.get(user_id)
+
+    form=LenderReviewForm()
+
+    if form.validate_on_submit():
+        rating = request.form['rating']
+        review = request.form['review']
+
+        current_review = LenderRating.query.filter_by(user_being_rated_id=user_id,user_rating_id=g.user.user_id).one()
+        User.add_rating(lender_under_review.user_id, rating, old_rating=current_review.rating)
+        current_review.rating = rating
+        current_review.review = review
+        db.session.commit()
+        invalidate_user(lender_under_review.user_id)
+
+        flash("Rating and review updated.", "success")
+        return redirect("/user/all")
+    
+    return render_template('users/update_rv.html', form=form, user=lender_under_review)